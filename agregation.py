@@ -0,0 +1,230 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from schema import resoudre_schema
+from sections import _ignorer, cles_mois, detecter_colonnes_familles, libelle_mois
+
+MAPPING_FILIATION = {"ADHERENT": "ASSURÉ PRINCIPAL", "ASSURE PRINCIPAL": "ASSURÉ PRINCIPAL", "ASSURÉ PRINCIPAL": "ASSURÉ PRINCIPAL",
+                     "assure principal": "ASSURÉ PRINCIPAL", "CONJOINT": "CONJOINT", "conjoint": "CONJOINT", "ENFANT": "ENFANT", "enfant": "ENFANT"}
+
+
+@dataclass
+class AgregatsContrat:
+    """
+    Agrégats bruts (numériques, sans ligne de total ni mise en forme) des sections III à VII
+    d'un contrat. Les avertissements et erreurs sont conservés par section et restitués
+    par `section`, pour être affichés à l'endroit de la section concernée.
+    """
+    filiation: pd.DataFrame = None
+    mensuel: pd.DataFrame = None
+    specialites: pd.DataFrame = None
+    prestataires: pd.DataFrame = None
+    familles: pd.DataFrame = None
+    colonnes_familles: tuple = (None, None)
+    avertissements: dict = field(default_factory=dict)
+    erreurs: dict = field(default_factory=dict)
+
+    def section(self, nom, avertir=_ignorer):
+        """
+        Retourne l'agrégat d'une section après avoir transmis ses avertissements.
+
+        Raises:
+            Exception: L'erreur rencontrée lors du calcul de cette section.
+        """
+        for message in self.avertissements.get(nom, []):
+            avertir(message)
+        if nom in self.erreurs:
+            raise self.erreurs[nom]
+        return getattr(self, nom)
+
+
+def valeurs_numeriques(serie):
+    """
+    Valeurs numériques d'une colonne, NaN pour les valeurs vides ou non numériques.
+
+    Returns:
+        np.ndarray: Tableau de float de la longueur de `serie`.
+    """
+    return pd.to_numeric(serie, errors="coerce").to_numpy(dtype=float)
+
+
+def sommes_groupes(codes, nb_groupes, valeurs):
+    """
+    Somme de `valeurs` par groupe, les groupes étant numérotés par `codes` (voir `codes_groupes`).
+    Les NaN sont ignorés et les lignes de code -1 exclues.
+
+    Returns:
+        np.ndarray: Somme de chacun des `nb_groupes` groupes.
+    """
+    valides = codes >= 0
+    return np.bincount(codes[valides], weights=np.nan_to_num(valeurs[valides]), minlength=nb_groupes)
+
+
+def comptes_groupes(codes, nb_groupes):
+    """
+    Nombre de lignes par groupe, les groupes étant numérotés par `codes` (voir `codes_groupes`).
+    Les lignes de code -1 sont exclues.
+
+    Returns:
+        np.ndarray: Nombre de lignes de chacun des `nb_groupes` groupes.
+    """
+    return np.bincount(codes[codes >= 0], minlength=nb_groupes)
+
+
+def codes_groupes(colonnes):
+    """
+    Numérote les groupes formés par une ou plusieurs colonnes clés, dans l'ordre d'un
+    `groupby(sort=True)` ; les lignes dont une clé est manquante reçoivent le code -1.
+
+    Returns:
+        tuple: (codes par ligne, liste des valeurs de chaque clé par groupe)
+    """
+    factorisations = [pd.factorize(colonne, sort=True) for colonne in colonnes]
+    valides = np.logical_and.reduce([codes >= 0 for codes, _ in factorisations])
+    if not valides.any():
+        return np.full(len(valides), -1), [np.array([], dtype=object) for _ in colonnes]
+    combines = np.zeros(len(valides), dtype=np.int64)
+    for codes, uniques in factorisations:
+        combines = combines * len(uniques) + codes
+    groupes, codes_valides = np.unique(combines[valides], return_inverse=True)
+    codes = np.full(len(valides), -1)
+    codes[valides] = codes_valides
+    cles = []
+    for _, uniques in reversed(factorisations):
+        cles.append(np.asarray(uniques, dtype=object)[groupes % len(uniques)])
+        groupes = groupes // len(uniques)
+    return codes, cles[::-1]
+
+
+def _agreger_filiation(df, schema, couvert, avertir):
+    filiation = schema.colonne(df, "filiation").map(MAPPING_FILIATION)
+    codes_filiation, libelles = pd.factorize(filiation)
+    # Un patient est compté dans la filiation de sa première ligne
+    codes_carte, _ = pd.factorize(schema.colonne(df, "carte"), use_na_sentinel=False)
+    _, premieres = np.unique(codes_carte, return_index=True)
+    return pd.DataFrame({
+        "Nombre de patients": comptes_groupes(codes_filiation[premieres], len(libelles)),
+        "Montant couvert": sommes_groupes(codes_filiation, len(libelles), couvert),
+    }, index=libelles)
+
+
+def _agreger_mensuel(df, schema, couvert, avertir):
+    cle_mois = cles_mois(schema.colonne(df, "date"))
+    if (cle_mois < 0).all():
+        raise ValueError("La colonne des dates (colonne 1) contient des valeurs invalides ou est vide.")
+    lignes = np.ones(len(df), dtype=bool)
+    rejets = None
+    if schema.present("rejets") and not schema.colonne(df, "rejets").isna().all():
+        rejets = valeurs_numeriques(schema.colonne(df, "rejets"))
+        lignes = ~np.isnan(rejets)
+    else:
+        avertir("⚠️ La colonne des rejets (colonne 24) est absente ou vide. Traitement sans filtrage des rejets.")
+    if not lignes.any():
+        avertir("⚠️ Aucune donnée disponible pour les consommations mensuelles après filtrage.")
+        return None
+    if (cle_mois[lignes] < 0).any():
+        avertir("⚠️ Certaines dates n'ont pas pu être converties en mois. Vérifiez le format des dates.")
+        lignes &= cle_mois >= 0
+    if not lignes.any():
+        raise ValueError("Aucune donnée valide pour les mois après conversion des dates.")
+
+    mois, codes_valides = np.unique(cle_mois[lignes], return_inverse=True)
+    codes = np.full(len(df), -1)
+    codes[lignes] = codes_valides
+    nb_mois = len(mois)
+
+    polices_renseignees = np.where(schema.colonne(df, "police").notna().to_numpy(), codes, -1)
+    df_mensuel = pd.DataFrame({
+        "MOIS": [libelle_mois(m) for m in mois],
+        "Nombre de Sinistres": comptes_groupes(polices_renseignees, nb_mois),
+        "Frais réels": sommes_groupes(codes, nb_mois, valeurs_numeriques(schema.colonne(df, "frais"))),
+        "Montant Couvert": sommes_groupes(codes, nb_mois, couvert),
+    })
+    if rejets is not None:
+        df_mensuel["Rejets"] = sommes_groupes(codes, nb_mois, rejets)
+    return df_mensuel
+
+
+def _agreger_specialites(df, schema, couvert, avertir):
+    lignes = np.ones(len(df), dtype=bool)
+    rejets = np.zeros(len(df))
+    if schema.present("rejets"):
+        colonne_rejets = schema.colonne(df, "rejets")
+        if colonne_rejets.dtype == object:
+            lignes = np.fromiter((pd.notna(x) and isinstance(x, (int, float)) for x in colonne_rejets),
+                                 dtype=bool, count=len(df))
+        else:
+            lignes = colonne_rejets.notna().to_numpy()
+        rejets = valeurs_numeriques(colonne_rejets)
+    codes, (specialites,) = codes_groupes([schema.colonne(df, "specialite").where(lignes)])
+    return pd.DataFrame({
+        "Nombre": comptes_groupes(codes, len(specialites)),
+        "Couvert": sommes_groupes(codes, len(specialites), couvert),
+        "Rejets": sommes_groupes(codes, len(specialites), rejets),
+    }, index=pd.Index(specialites))
+
+
+def _agreger_prestataires(df, schema, couvert, avertir):
+    codes, (prestataires, villes, communes) = codes_groupes(
+        [schema.colonne(df, "prestataire"), schema.colonne(df, "ville"), schema.colonne(df, "commune")]
+    )
+    return pd.DataFrame({
+        "PRESTATAIRE": prestataires,
+        "VILLE": villes,
+        "COMMUNE": communes,
+        "NOMBRE": comptes_groupes(codes, len(prestataires)),
+        "Couvert": sommes_groupes(codes, len(prestataires), couvert),
+    })
+
+
+def _agreger_familles(df, schema, couvert, avertir, col_carte, col_nom):
+    codes, (cartes, noms) = codes_groupes([df[col_carte], df[col_nom]])
+    return pd.DataFrame({
+        "N° de Famille": cartes,
+        "Assuré Principal": noms,
+        "Nombre d'actes": comptes_groupes(codes, len(cartes)),
+        "Couvert": sommes_groupes(codes, len(cartes), couvert),
+    })
+
+
+def agreger_contrat(df_filtre, schema=None):
+    """
+    Calcule en une fois les agrégats des sections III à VII à partir des lignes DETAIL
+    d'un contrat : chaque colonne utile est lue une seule fois, sans copie du DataFrame,
+    et les sommes par groupe sont faites par `np.bincount` sur des codes de groupe.
+
+    Args:
+        df_filtre (pd.DataFrame): Lignes DETAIL du contrat.
+        schema (SchemaDetail, optional): Colonnes résolues du fichier (`DonneesDetail.schema`) ;
+            résolues à partir des en-têtes de `df_filtre` si absent.
+
+    Returns:
+        AgregatsContrat: Agrégats bruts par section.
+    """
+    agregats = AgregatsContrat()
+    messages_familles = []
+    calculs = {
+        "filiation": _agreger_filiation,
+        "mensuel": _agreger_mensuel,
+        "specialites": _agreger_specialites,
+        "prestataires": _agreger_prestataires,
+        "familles": lambda df, schema, montants, avertir: _agreger_familles(df, schema, montants, avertir,
+                                                                            *agregats.colonnes_familles),
+    }
+    try:
+        schema = schema or resoudre_schema(df_filtre.columns)
+        couvert = valeurs_numeriques(schema.colonne(df_filtre, "couvert"))
+        agregats.colonnes_familles = detecter_colonnes_familles(df_filtre, avertir=messages_familles.append, schema=schema)
+    except Exception as e:
+        agregats.erreurs = {nom: e for nom in calculs}
+        return agregats
+    for nom, calcul in calculs.items():
+        messages = messages_familles if nom == "familles" else []
+        try:
+            setattr(agregats, nom, calcul(df_filtre, schema, couvert, messages.append))
+        except Exception as e:
+            agregats.erreurs[nom] = e
+        agregats.avertissements[nom] = messages
+    return agregats
@@ -0,0 +1,342 @@
+"""
+Génération en lot des rapports PDF, sans interface Streamlit.
+
+Produit un PDF par combinaison (assureur, client, police) présente dans DETAIL :
+
+    python batch.py --detail DETAIL.xlsx --production PRODUCTION.xlsx \
+        --effectif EFFECTIF.xlsx --clause "Clause Ajustement Santé.xlsx" --sortie rapports/ --workers 8
+
+Les contrats sont répartis sur un pool de processus ; au lieu de recevoir le DataFrame
+sérialisé, chaque processus ouvre le snapshot Arrow de DETAIL par memory-mapping (pages
+partagées par le cache disque du système) et ne convertit que les lignes du contrat traité.
+Le statut de chaque contrat est écrit dans `manifeste.json` du répertoire de sortie.
+
+Pour les extractions DETAIL volumineuses, `--flux` lit le classeur par blocs et
+`--colonnes-rapport` ne garde que les colonnes utilisées par le rapport ; `--client` et
+`--police` limitent le lot (et la lecture) à certains contrats.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+from agregation import agreger_contrat
+from chargement import SnapshotStore, charger_clause, charger_detail, charger_effectif, charger_production, normaliser_noms
+from graphiques import graphique_beneficiaires, graphique_effectifs, graphique_mensuel, graphique_specialites, rendre_png
+from mesures import etape
+from rapport_pdf import generer_pdf
+from sections import (
+    RapportContrat, calculer_beneficiaires, calculer_familles, calculer_mensuel, calculer_periode,
+    calculer_prestataires, calculer_sinistralite, calculer_specialites, extraire_primes,
+    preparer_effectifs,
+)
+from texte import clean_text
+
+
+def _section(nom, calcul, avertir, nom_etape):
+    """
+    Exécute le calcul d'une section, mesuré comme l'étape `nom_etape` ; en cas d'erreur, la
+    section est omise du rapport.
+    """
+    try:
+        with etape(nom_etape):
+            return calcul()
+    except Exception as e:
+        avertir(f"❌ Erreur lors du traitement {nom} : {e}")
+        return None
+
+
+def _graphique(nom, fonction, donnees, dpi=None):
+    """Rend un graphique du rapport en PNG (étape mesurée)."""
+    with etape(f"Graphique {nom}"):
+        return rendre_png(fonction(donnees), dpi=dpi)
+
+
+def construire_rapport(df_filtre, nom_assureur, client, police_ankara, production=None, effectif=None,
+                       clause=None, avertir=print, schema=None):
+    """
+    Calcule toutes les sections du rapport d'un contrat, comme le fait l'interface Streamlit.
+
+    Args:
+        df_filtre (pd.DataFrame): Lignes DETAIL du contrat.
+        nom_assureur (str): Assureur normalisé.
+        client (str): Client normalisé.
+        police_ankara: N° de police Ankara.
+        production (TableIndexee, optional): PRODUCTION chargé par `charger_production`.
+        effectif (TableIndexee, optional): EFFECTIF chargé par `charger_effectif`.
+        clause (ClauseAjustement, optional): Résultat de `charger_clause`.
+        avertir (callable): Reçoit les messages d'avertissement et d'erreur.
+        schema (SchemaDetail, optional): Colonnes résolues de DETAIL (`DonneesDetail.schema`).
+
+    Returns:
+        RapportContrat: Rapport prêt pour `generer_pdf`.
+    """
+    df_production_filtered = None
+    police_assureur = ""
+    if production is not None:
+        df_production_filtered = production.selection(nom_assureur, f"{client} | {police_ankara}")
+        if not df_production_filtered.empty:
+            police_assureur = str(df_production_filtered["N° Police Assureur"].iloc[0])
+    prime_nette, prime_acquise = extraire_primes(df_production_filtered, avertir)
+
+    rapport = RapportContrat(nom_assureur=nom_assureur, client=client, police_ankara=police_ankara, police_assureur=police_assureur)
+    with etape("Section I - Sinistralité", lignes=len(df_filtre)):
+        rapport.df_sin, ratio_sp = calculer_sinistralite(df_filtre, nom_assureur, client, police_ankara, police_assureur,
+                                                         prime_nette, prime_acquise, schema)
+    if clause is not None:
+        rapport.df_clause = clause.df
+        rapport.highlight_row = clause.tranche(ratio_sp)
+
+    df_effectif = None
+    if effectif is not None:
+        df_effectif_filtered = effectif.selection(nom_assureur, client).copy()
+        if df_effectif_filtered.empty:
+            avertir("⚠️ Aucune donnée dans EFFECTIF.xlsx pour l'assureur et le client sélectionnés.")
+        else:
+            with etape("Section II - Effectifs", lignes=len(df_effectif_filtered)):
+                rapport.periode = calculer_periode(df_effectif_filtered["MOIS"])
+                df_effectif, rapport.df_effectif_display = preparer_effectifs(df_effectif_filtered)
+            rapport.graphiques["effectifs"] = _graphique("effectifs", graphique_effectifs, df_effectif)
+
+    with etape("Agrégats III à VII", lignes=len(df_filtre)):
+        agregats = agreger_contrat(df_filtre, schema)
+    if df_effectif is not None:
+        rapport.tableau_final = _section("de la consommation", lambda: calculer_beneficiaires(agregats, df_effectif), avertir,
+                                         "Section III - Bénéficiaires")
+        if rapport.tableau_final is not None:
+            rapport.graphiques["beneficiaires"] = _graphique("beneficiaires", graphique_beneficiaires, rapport.tableau_final)
+
+    rapport.df_mensuel_grouped = _section("des consommations mensuelles", lambda: calculer_mensuel(agregats, avertir), avertir,
+                                          "Section IV - Mensuel")
+    if rapport.df_mensuel_grouped is not None:
+        rapport.graphiques["mensuel"] = _graphique("mensuel", graphique_mensuel, rapport.df_mensuel_grouped)
+
+    rapport.tableau_spec = _section("des spécialités", lambda: calculer_specialites(agregats), avertir,
+                                    "Section V - Spécialités")
+    if rapport.tableau_spec is not None:
+        rapport.graphiques["specialites"] = _graphique("specialites", graphique_specialites, rapport.tableau_spec, dpi=300)
+
+    rapport.df_prestataires = _section("des prestataires", lambda: calculer_prestataires(agregats), avertir,
+                                       "Section VI - Prestataires")
+    rapport.df_familles = _section(
+        "des familles de consommateurs",
+        lambda: calculer_familles(agregats, avertir),
+        avertir,
+        "Section VII - Familles"
+    )
+    return rapport
+
+
+def nom_fichier_contrat(nom_assureur, client_short, police_ankara):
+    """Nom de fichier PDF d'un contrat, sans caractères interdits dans un chemin."""
+    nom = f"{clean_text(nom_assureur)}_{clean_text(client_short)}_{clean_text(str(police_ankara))}_rapport_sante.pdf"
+    return re.sub(r'[\\/:*?"<>|]+', "_", nom)
+
+
+def contrats_detail(df_detail, schema):
+    """
+    Regroupe DETAIL par (assureur, client, police) en un seul groupby.
+
+    Returns:
+        dict: {(assureur, client, police): positions des lignes du contrat}
+    """
+    colonnes = [schema.nom_colonne("assureur"), schema.nom_colonne("client"), schema.nom_colonne("police")]
+    return df_detail.groupby(colonnes, sort=True, observed=True).indices
+
+
+# État des processus du pool, initialisé une fois par processus par `_initialiser_worker`
+_WORKER = {}
+
+
+def _traiter_contrat(df_detail, cle, positions, contexte):
+    """
+    Construit et écrit le PDF d'un contrat.
+
+    Returns:
+        dict: Entrée du manifeste (assureur, client, police, fichier, statut, erreur, durée).
+    """
+    nom_assureur, client, police_ankara = cle
+    debut = time.perf_counter()
+    resultat = {"assureur": nom_assureur, "client": client, "police": str(police_ankara), "lignes": len(positions),
+                "fichier": None, "statut": "ok", "erreur": ""}
+    try:
+        rapport = construire_rapport(
+            df_detail.iloc[positions], nom_assureur, client, police_ankara,
+            contexte["production"], contexte["effectif"], contexte["clause"],
+            avertir=lambda message: None, schema=contexte["schema"]
+        )
+        chemin = os.path.join(contexte["sortie"], nom_fichier_contrat(nom_assureur, rapport.client_short, police_ankara))
+        with open(chemin, "wb") as f:
+            f.write(generer_pdf(rapport, contexte["logo_ankara"], contexte["logo_assureur"]))
+        resultat["fichier"] = chemin
+    except Exception as e:
+        resultat["statut"] = "erreur"
+        resultat["erreur"] = str(e)
+    resultat["duree"] = round(time.perf_counter() - debut, 3)
+    return resultat
+
+
+def _initialiser_worker(repertoire_snapshots, nature, empreinte, df_detail, contexte):
+    """
+    Prépare DETAIL dans le processus : la table Arrow memory-mappée du snapshot, dont seules
+    les lignes de chaque contrat sont converties en DataFrame, ou à défaut le DataFrame
+    transmis (repli quand aucun snapshot n'a pu être écrit ou relu).
+
+    Raises:
+        FileNotFoundError: Si le snapshot a disparu (évincé, purgé ou illisible) ;
+            le pool est alors cassé et `generer_lot` relance les contrats restants
+            en transmettant DETAIL.
+    """
+    if df_detail is None:
+        snapshots = SnapshotStore(repertoire_snapshots, taille_max=float("inf"))
+        table = snapshots.lire_table(nature, empreinte)
+        if table is None:
+            raise FileNotFoundError(f"Snapshot {nature} {empreinte} introuvable ou illisible dans {repertoire_snapshots}")
+        _WORKER["snapshots"] = snapshots
+        _WORKER["table"] = table
+    _WORKER["df_detail"] = df_detail
+    _WORKER["contexte"] = contexte
+
+
+def _traiter_contrat_worker(cle, positions):
+    if _WORKER["df_detail"] is not None:
+        return _traiter_contrat(_WORKER["df_detail"], cle, positions, _WORKER["contexte"])
+    df_contrat = _WORKER["snapshots"].vers_pandas(_WORKER["table"].take(positions))
+    return _traiter_contrat(df_contrat, cle, np.arange(len(df_contrat)), _WORKER["contexte"])
+
+
+def _executer_pool(contrats, workers, initargs, enregistrer):
+    """Traite les contrats dans un pool de `workers` processus initialisés par `_initialiser_worker`."""
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initialiser_worker, initargs=initargs) as executor:
+        futures = {executor.submit(_traiter_contrat_worker, cle, positions): cle for cle, positions in contrats.items()}
+        for future in as_completed(futures):
+            enregistrer(futures[future], future.result())
+
+
+def _partager_detail(detail, snapshots, repertoire_temporaire):
+    """
+    Snapshot de DETAIL relu par les processus du pool : dans `snapshots` si possible,
+    sinon dans un répertoire temporaire le temps du lot.
+
+    Returns:
+        tuple: (SnapshotStore contenant le snapshot ou None, messages des écritures échouées)
+    """
+    magasins = [snapshots] if snapshots is not None else []
+    magasins.append(SnapshotStore(repertoire_temporaire, taille_max=float("inf")))
+    erreurs = []
+    for magasin in magasins:
+        if magasin.existe(detail.nature, detail.empreinte) or magasin.ecrire(detail.nature, detail.empreinte, detail.df):
+            return magasin, erreurs
+        erreurs.extend(magasin.echecs.values() or ["pyarrow indisponible"])
+    return None, erreurs
+
+
+def generer_lot(detail, production=None, effectif=None, clause=None, sortie=".",
+                logo_ankara=None, logo_assureur=None, workers=1, snapshots=None, avertir=print):
+    """
+    Génère un PDF par contrat de DETAIL dans le répertoire `sortie` et y écrit `manifeste.json`.
+
+    Args:
+        detail (DonneesDetail): DETAIL chargé par `charger_detail`.
+        logo_ankara, logo_assureur (str | bytes, optional): Logos, chemin ou contenu.
+        workers (int): Nombre de processus ; 1 pour tout traiter dans le processus courant.
+        snapshots (SnapshotStore, optional): Snapshots où les processus relisent DETAIL.
+            Sans snapshots, ou si l'écriture y échoue, un répertoire temporaire est utilisé
+            le temps du lot.
+
+    Returns:
+        list: Entrées du manifeste, dans l'ordre des contrats ; `avertissements` y signale
+            notamment un DETAIL copié dans chaque processus faute de snapshot.
+    """
+    os.makedirs(sortie, exist_ok=True)
+    contrats = contrats_detail(detail.df, detail.schema)
+    contexte = {
+        "production": production, "effectif": effectif, "clause": clause, "sortie": sortie, "schema": detail.schema,
+        "logo_ankara": logo_ankara, "logo_assureur": logo_assureur,
+    }
+    resultats = {}
+    avertissements = []
+
+    def enregistrer(cle, resultat):
+        resultats[cle] = resultat
+        avertir(f"[{len(resultats)}/{len(contrats)}] {' | '.join(map(str, cle))} : {resultat['statut']} {resultat['fichier'] or resultat['erreur']}")
+
+    if workers <= 1 or len(contrats) <= 1:
+        for cle, positions in contrats.items():
+            enregistrer(cle, _traiter_contrat(detail.df, cle, positions, contexte))
+    else:
+        with tempfile.TemporaryDirectory() as repertoire_temporaire:
+            partage, erreurs = _partager_detail(detail, snapshots, repertoire_temporaire)
+            if partage is None:
+                avertissements.append(f"Snapshot DETAIL impossible ({' ; '.join(erreurs)}) : DETAIL est copié dans "
+                                      f"chacun des {workers} processus.")
+                avertir(f"⚠️ {avertissements[-1]}")
+            initargs = (partage.repertoire if partage else None, detail.nature, detail.empreinte,
+                        None if partage else detail.df, contexte)
+            try:
+                _executer_pool(contrats, workers, initargs, enregistrer)
+            except BrokenProcessPool:
+                if partage is None:
+                    raise
+                avertissements.append(f"Snapshot DETAIL introuvable ou illisible dans les processus ({partage.repertoire}) : "
+                                      f"DETAIL est copié dans chacun des {workers} processus.")
+                avertir(f"⚠️ {avertissements[-1]}")
+                restants = {cle: positions for cle, positions in contrats.items() if cle not in resultats}
+                _executer_pool(restants, workers, (None, detail.nature, detail.empreinte, detail.df, contexte), enregistrer)
+
+    manifeste = [dict(resultats[cle], avertissements=avertissements) for cle in contrats]
+    with open(os.path.join(sortie, "manifeste.json"), "w", encoding="utf-8") as f:
+        json.dump(manifeste, f, ensure_ascii=False, indent=2)
+    return manifeste
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Génère le rapport PDF de chaque contrat (assureur, client, police) du fichier DETAIL.")
+    parser.add_argument("--detail", required=True, help="Fichier DETAIL.xlsx")
+    parser.add_argument("--production", help="Fichier PRODUCTION.xlsx")
+    parser.add_argument("--effectif", help="Fichier EFFECTIF.xlsx")
+    parser.add_argument("--clause", help="Fichier Clause Ajustement Santé.xlsx")
+    parser.add_argument("--logo-ankara", help="Logo Ankara (PNG, JPG)")
+    parser.add_argument("--logo-assureur", help="Logo de l'assureur (PNG, JPG)")
+    parser.add_argument("--sortie", default="rapports", help="Répertoire de sortie des PDF (par défaut : rapports)")
+    parser.add_argument("--snapshots", help="Répertoire des snapshots Arrow pour éviter de relire les classeurs")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Nombre de processus de génération (par défaut : nombre de cœurs)")
+    parser.add_argument("--flux", action="store_true",
+                        help="Lire DETAIL par blocs, pour les extractions trop volumineuses pour la mémoire")
+    parser.add_argument("--colonnes-rapport", action="store_true",
+                        help="Lecture par blocs limitée aux colonnes utilisées par le rapport")
+    parser.add_argument("--client", action="append", help="Ne traiter que ce client (option répétable, lecture par blocs)")
+    parser.add_argument("--police", action="append", help="Ne traiter que cette police (option répétable, lecture par blocs)")
+    args = parser.parse_args(argv)
+
+    snapshots = SnapshotStore(args.snapshots) if args.snapshots else None
+
+    def lire(chemin):
+        with open(chemin, "rb") as f:
+            return f.read()
+
+    clients = normaliser_noms(pd.Series(args.client, dtype=object)).tolist() if args.client else None
+    detail = charger_detail(lire(args.detail), snapshots=snapshots, flux=args.flux, colonnes_rapport=args.colonnes_rapport,
+                            clients=clients, polices=args.police)
+    production = charger_production(lire(args.production), snapshots=snapshots) if args.production else None
+    effectif = charger_effectif(lire(args.effectif), snapshots=snapshots) if args.effectif else None
+    clause = charger_clause(lire(args.clause)) if args.clause else None
+
+    resultats = generer_lot(detail, production, effectif, clause, args.sortie, args.logo_ankara, args.logo_assureur,
+                            workers=args.workers, snapshots=snapshots)
+    erreurs = [r for r in resultats if r["statut"] != "ok"]
+    print(f"{len(resultats) - len(erreurs)} rapport(s) généré(s), {len(erreurs)} erreur(s).")
+    return 1 if erreurs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1033 @@
+"""
+Micro-benchmarks des étapes coûteuses de la génération de rapports.
+
+Usage :
+    python benchmark.py                  # tous les benchmarks
+    python benchmark.py mesure --lignes 10000
+    python benchmark.py rapport --tailles 10000 100000 2000000 --resultats resultats.csv
+    python benchmark.py imports          # budget de démarrage (python -X importtime)
+"""
+import argparse
+import ast
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from agregation import agreger_contrat
+from batch import construire_rapport, contrats_detail
+from chargement import (
+    ClauseAjustement, SnapshotStore, TableIndexee, charger_clause, charger_detail, charger_effectif, charger_production,
+    compacter_detail, construire_donnees_detail, lire_detail, lire_detail_flux, normaliser_noms, rapport_memoire,
+)
+from export import _excel_flux, exporter_detail
+from formatage import formater_tableau
+from graphiques import MagasinGraphiques, graphique_beneficiaires, graphique_effectifs, graphique_mensuel, graphique_specialites
+from mesures import Mesures, etape
+from portefeuille import calculer_portefeuille
+from rapport_pdf import PDFWithPageNumbers, generer_pdf, hauteurs_lignes
+from schema import resoudre_schema
+from sections import (
+    _ignorer, calculer_beneficiaires, calculer_familles, calculer_mensuel, calculer_prestataires,
+    calculer_specialites, detecter_colonnes_familles, libelles_mois, mois_fr, preparer_effectifs,
+)
+from texte import clean_text, nettoyer_texte
+from travaux import STATUT_TERMINE, FileRapports
+
+
+def _chronometrer(fonction, repetitions=3):
+    """Meilleur temps (en secondes) sur plusieurs exécutions, et le dernier résultat."""
+    meilleur = None
+    resultat = None
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        resultat = fonction()
+        duree = time.perf_counter() - debut
+        meilleur = duree if meilleur is None else min(meilleur, duree)
+    return meilleur, resultat
+
+
+def tableau_prestataires(nb_lignes, graine=0):
+    """Tableau synthétique au format de la section prestataires (montants déjà formatés)."""
+    rng = np.random.default_rng(graine)
+    noms = np.array([
+        "CLINIQUE INTERNATIONALE SAINTE ANNE-MARIE", "PHARMACIE DU PLATEAU", "LABORATOIRE BIOTEST",
+        "CENTRE MÉDICAL LES ROSIERS", "POLYCLINIQUE FARAH", "CABINET DENTAIRE ÉMERAUDE\nANNEXE",
+    ])
+    montants = rng.integers(1_000, 50_000_000, nb_lignes)
+    return pd.DataFrame({
+        "Prestataire": noms[rng.integers(0, len(noms), nb_lignes)],
+        "Montant couvert": [f"{m:,}".replace(",", " ") for m in montants],
+        "Nombre d'actes": rng.integers(1, 5_000, nb_lignes).astype(str),
+        "Poids": [f"{p:.2f}%" for p in rng.random(nb_lignes) * 100],
+    })
+
+
+def _hauteurs_reference(pdf, df_display, col_widths):
+    """Mesure d'origine : une ligne à la fois, `get_string_width` cellule par cellule."""
+    max_lines_per_row = []
+    for _, row in df_display.iterrows():
+        max_lines = 1
+        for j, item in enumerate(row):
+            num_lines = max(1, len(str(item).split('\n')) + int(pdf.get_string_width(str(item)) / (col_widths[j] - 2)))
+            max_lines = max(max_lines, num_lines)
+        max_lines_per_row.append(max_lines)
+    return max_lines_per_row
+
+
+def bench_mesure(nb_lignes=10_000):
+    """Mesure des hauteurs de lignes de `add_table_section` : boucle d'origine contre version vectorisée."""
+    df_display = clean_text(tableau_prestataires(nb_lignes))
+    col_widths = [95, 35, 30, 30]
+    pdf = PDFWithPageNumbers()
+    pdf.add_page()
+    pdf.set_font("Arial", '', 8)
+
+    duree_ref, ref = _chronometrer(lambda: _hauteurs_reference(pdf, df_display, col_widths), repetitions=1)
+    duree_vec, vec = _chronometrer(lambda: hauteurs_lignes(pdf, df_display, col_widths))
+    assert list(vec) == ref, "Les hauteurs vectorisées diffèrent de la mesure d'origine"
+
+    print(f"Mesure des hauteurs ({nb_lignes} lignes) : "
+          f"boucle {duree_ref * 1000:.1f} ms, vectorisée {duree_vec * 1000:.1f} ms "
+          f"(x{duree_ref / duree_vec:.1f})")
+
+
+def _clean_text_reference(text):
+    """Nettoyage d'origine : remplacements et normalisation NFKD chaîne par chaîne."""
+    if isinstance(text, pd.DataFrame):
+        # Traitement pour DataFrame
+        for col in text.columns:
+            text[col] = text[col].apply(lambda x: _clean_text_reference(x) if isinstance(x, str) else str(x))
+        return text
+    elif isinstance(text, str):
+        # Préserver certains caractères accentués spécifiques
+        preserved_chars = {'à': 'à', 'À': 'À', 'é': 'é', 'É': 'É', 'è': 'è', 'È': 'È'}
+
+        # Sauvegarder les caractères à préserver
+        for char, replacement in preserved_chars.items():
+            text = text.replace(char, f"__PRESERVED_{ord(char)}__")
+
+        # Normalisation Unicode pour décomposer les caractères accentués
+        text = unicodedata.normalize('NFKD', text)
+        # Convertir en ASCII, en ignorant les caractères non-ASCII
+        text = text.encode('ascii', 'ignore').decode('ascii')
+
+        # Restaurer les caractères préservés
+        for char, replacement in preserved_chars.items():
+            text = text.replace(f"__PRESERVED_{ord(char)}__", replacement)
+
+        # Remplacements supplémentaires pour caractères spécifiques
+        replacements = {
+            'Œ': 'OE', 'œ': 'oe', '…': '...', '–': '-', '—': '-', '\u2013': '-', '\u2014': '-',
+            '\u2018': "'", '\u2019': "'", '\u2022': '*', '"': '"', '"': '"'
+        }
+        for k, v in replacements.items():
+            text = text.replace(k, v)
+        return text
+    return str(text)
+
+
+def bench_nettoyage(nb_lignes=10_000):
+    """Nettoyage d'un tableau pour le PDF : `apply` cellule par cellule contre table de traduction et cache."""
+    df = tableau_prestataires(nb_lignes)
+    df["Ville"] = np.array(["Abidjan – Plateau", "Yamoussoukro", "Grand-Bassam", "Bouaké", "Œuvre “Saint-Éloi”"])[np.arange(nb_lignes) % 5]
+    df["Montant"] = np.arange(nb_lignes) * 1.5
+    echantillon = "".join(chr(c) for c in range(0x20, 0x3000)) + "àÀéÉèÈ … – — ‘’ • Œœ"
+    assert nettoyer_texte(echantillon) == _clean_text_reference(echantillon), "Nettoyage différent de l'original"
+
+    duree_ref, ref = _chronometrer(lambda: _clean_text_reference(df.copy()), repetitions=1)
+    nettoyer_texte.cache_clear()
+    duree_vec, vec = _chronometrer(lambda: clean_text(df.copy()))
+    pd.testing.assert_frame_equal(vec, ref)
+
+    print(f"Nettoyage du texte ({nb_lignes} lignes x {len(df.columns)} colonnes) : "
+          f"apply {duree_ref * 1000:.1f} ms, vectorisé {duree_vec * 1000:.1f} ms "
+          f"(x{duree_ref / duree_vec:.1f})")
+
+
+def detail_synthetique(nb_lignes, graine=0, nb_contrats=1):
+    """
+    Lignes DETAIL synthétiques réparties sur `nb_contrats` contrats, aux positions de colonnes
+    lues par l'application (date 1, client 5, police 6, carte 9, filiation 10, assuré principal
+    11-12, prestataire 13-15, spécialité 17, frais 20, couvert 22, rejets 24, assureur 27),
+    avec quelques valeurs manquantes.
+    """
+    rng = np.random.default_rng(graine)
+    colonnes = [f"C{i}" for i in range(28)]
+    colonnes[1], colonnes[6], colonnes[9], colonnes[10] = "DATE SOINS", "POLICE", "N°CARTE", "FILIATION"
+    colonnes[11], colonnes[12] = "ASSURÉ PRINCIPAL", "N°CARTE ASSURÉ PRINCIPAL"
+    colonnes[13], colonnes[14], colonnes[15], colonnes[17] = "PRESTATAIRE", "VILLE", "COMMUNE", "SPECIALITE"
+    colonnes[20], colonnes[22], colonnes[24] = "FRAIS REELS", "MONTANT COUVERT", "REJETS"
+    colonnes[5], colonnes[27] = "CLIENT", "ASSUREUR"
+    df = pd.DataFrame({colonne: np.full(nb_lignes, None, dtype=object) for colonne in colonnes})
+    familles = rng.integers(0, max(nb_lignes // 8, 1), nb_lignes)
+    prestataires = rng.integers(0, 200, nb_lignes)
+    df["DATE SOINS"] = pd.Timestamp("2023-07-01") + pd.to_timedelta(rng.integers(0, 540, nb_lignes), unit="D")
+    df["POLICE"] = "P1"
+    df["N°CARTE"] = [f"C{f}-{m}" for f, m in zip(familles, rng.integers(0, 4, nb_lignes))]
+    df["FILIATION"] = rng.choice(["ADHERENT", "CONJOINT", "ENFANT", "enfant", "AUTRE"], nb_lignes)
+    df["ASSURÉ PRINCIPAL"] = [f"NOM {f}" for f in familles]
+    df["N°CARTE ASSURÉ PRINCIPAL"] = [f"C{f}" for f in familles]
+    df["PRESTATAIRE"] = [f"CLINIQUE {p}" for p in prestataires]
+    df["VILLE"] = np.where(prestataires % 3 == 0, "BOUAKE", "ABIDJAN")
+    df["COMMUNE"] = [f"COMMUNE {p % 7}" for p in prestataires]
+    df["SPECIALITE"] = rng.choice(["PHARMACIE", "CONSULTATION", "BIOLOGIE", "OPTIQUE", "DENTAIRE", "HOSPITALISATION"], nb_lignes)
+    df["FRAIS REELS"] = rng.integers(1_000, 100_000, nb_lignes)
+    df["MONTANT COUVERT"] = (df["FRAIS REELS"] * 0.8).astype(int)
+    df["REJETS"] = rng.integers(0, 500, nb_lignes).astype(object)
+    # Valeurs manquantes ou invalides, comme dans les extractions réelles
+    df.loc[rng.random(nb_lignes) < 0.01, "REJETS"] = None
+    df.loc[rng.random(nb_lignes) < 0.005, "REJETS"] = "N/A"
+    df.loc[rng.random(nb_lignes) < 0.01, "COMMUNE"] = None
+    df.loc[rng.random(nb_lignes) < 0.01, "SPECIALITE"] = None
+    contrats = rng.integers(0, nb_contrats, nb_lignes)
+    df["ASSUREUR"] = [f"ASSUREUR {c % 3}" for c in contrats]
+    df["CLIENT"] = [f"CLIENT {c // 2}" for c in contrats]
+    df["POLICE"] = [f"P{c % 2 + 1}" for c in contrats]
+    return df
+
+
+def effectif_synthetique():
+    """Effectifs mensuels d'un client (colonnes après `lire_effectif`)."""
+    return pd.DataFrame({"ADHERENT": [120, 130], "CONJOINTS": [60, 62], "ENFANTS": [90, 95], "TOTAL": [270, 287]})
+
+
+def _format_date_fr_reference(date):
+    """Mise en forme d'origine : trois `strftime` par date."""
+    return date.strftime("%B %Y").replace(date.strftime("%B"), mois_fr.get(date.strftime("%B"), date.strftime("%B")))
+
+
+def _calculer_beneficiaires_reference(df_filtre, df_effectif):
+    """calculer_beneficiaires d'origine : une copie et un groupby par section."""
+    col_carte = df_filtre.columns[9]
+    col_filiation = df_filtre.columns[10]
+    col_montant = df_filtre.columns[22]
+    mapping = {"ADHERENT": "ASSURÉ PRINCIPAL", "ASSURE PRINCIPAL": "ASSURÉ PRINCIPAL", "ASSURÉ PRINCIPAL": "ASSURÉ PRINCIPAL",
+               "assure principal": "ASSURÉ PRINCIPAL", "CONJOINT": "CONJOINT", "conjoint": "CONJOINT", "ENFANT": "ENFANT", "enfant": "ENFANT"}
+    df_filiation = pd.DataFrame({
+        col_carte: df_filtre[col_carte],
+        "FILIATION": df_filtre[col_filiation].map(mapping),
+        col_montant: df_filtre[col_montant]
+    })
+    patients_uniques = df_filiation.drop_duplicates(subset=[col_carte])[[col_carte, "FILIATION"]]
+    patients_counts = patients_uniques["FILIATION"].value_counts().rename("Nombre de patients")
+    required_columns = ["ADHERENT", "CONJOINTS", "ENFANTS"]
+    missing_columns = [col for col in required_columns if col not in df_effectif.columns]
+    if missing_columns:
+        raise ValueError(f"Les colonnes suivantes sont manquantes dans le fichier EFFECTIF.xlsx : {', '.join(missing_columns)}")
+    effectifs = pd.Series({
+        "ASSURÉ PRINCIPAL": df_effectif["ADHERENT"].max(),
+        "CONJOINT": df_effectif["CONJOINTS"].max(),
+        "ENFANT": df_effectif["ENFANTS"].max()
+    }).rename("Effectif Total")
+
+    # Remplacer les valeurs NaN par 0 dans les effectifs
+    effectifs = effectifs.fillna(0)
+
+    montants = df_filiation.groupby("FILIATION")[col_montant].sum().rename("Montant couvert")
+    tableau = pd.concat([patients_counts, effectifs, montants], axis=1)
+
+    # Gérer la division par zéro pour le taux d'utilisation
+    tableau["Taux d'utilisation"] = tableau.apply(
+        lambda row: row["Nombre de patients"] / row["Effectif Total"] if row["Effectif Total"] > 0 else 0,
+        axis=1
+    )
+
+    total_montant = tableau["Montant couvert"].sum()
+    tableau["Part de consommation"] = tableau["Montant couvert"] / total_montant if total_montant > 0 else 0
+
+    total = pd.DataFrame({
+        "Nombre de patients": [tableau["Nombre de patients"].sum()],
+        "Effectif Total": [tableau["Effectif Total"].sum()],
+        "Taux d'utilisation": [tableau["Nombre de patients"].sum() / tableau["Effectif Total"].sum() if tableau["Effectif Total"].sum() > 0 else 0],
+        "Montant couvert": [total_montant],
+        "Part de consommation": [1.0]
+    }, index=["Total général"])
+    tableau_final = pd.concat([tableau, total])
+    cols = ["Nombre de patients", "Effectif Total", "Taux d'utilisation", "Montant couvert", "Part de consommation"]
+    ordre_filiation = ["ASSURÉ PRINCIPAL", "CONJOINT", "ENFANT", "Total général"]
+    tableau_final = tableau_final.reindex(ordre_filiation)[cols]
+
+    # Remplacer les valeurs non-finies avant conversion
+    tableau_final = tableau_final.replace([np.inf, -np.inf], 0)
+    tableau_final = tableau_final.fillna(0)
+
+    # Conversions sécurisées
+    tableau_final["Taux d'utilisation"] = (tableau_final["Taux d'utilisation"] * 100).round(0).astype(int).astype(str) + "%"
+    tableau_final["Nombre de patients"] = tableau_final["Nombre de patients"].round(0).astype(int)
+    tableau_final["Part de consommation"] = (tableau_final["Part de consommation"] * 100).round(0).astype(int).astype(str) + "%"
+    tableau_final["Montant couvert"] = tableau_final["Montant couvert"].apply(lambda x: f"{int(x):,}".replace(",", " "))
+    return tableau_final
+
+
+def _calculer_mensuel_reference(df_filtre, avertir=_ignorer):
+    """calculer_mensuel d'origine : une copie et un groupby par section."""
+    col_date = df_filtre.columns[1]
+    col_police = df_filtre.columns[6]
+    col_frais = df_filtre.columns[20]
+    col_couvert = df_filtre.columns[22]
+    col_rejet = df_filtre.columns[24] if 24 < len(df_filtre.columns) else None
+    df_mensuel = df_filtre.copy()
+    df_mensuel["DATE"] = pd.to_datetime(df_mensuel[col_date], errors="coerce")
+    if df_mensuel["DATE"].isna().all():
+        raise ValueError("La colonne des dates (colonne 1) contient des valeurs invalides ou est vide.")
+    if col_rejet is not None and col_rejet in df_mensuel.columns and not df_mensuel[col_rejet].isna().all():
+        df_mensuel[col_rejet] = pd.to_numeric(df_mensuel[col_rejet], errors='coerce')
+        df_mensuel = df_mensuel[df_mensuel[col_rejet].notna()]
+    else:
+        avertir("⚠️ La colonne des rejets (colonne 24) est absente ou vide. Traitement sans filtrage des rejets.")
+    if df_mensuel.empty:
+        avertir("⚠️ Aucune donnée disponible pour les consommations mensuelles après filtrage.")
+        return None
+    df_mensuel = df_mensuel.sort_values(by="DATE", ascending=True)
+    df_mensuel["MOIS"] = df_mensuel["DATE"].apply(_format_date_fr_reference)
+    if df_mensuel["MOIS"].isna().any():
+        avertir("⚠️ Certaines dates n'ont pas pu être converties en mois. Vérifiez le format des dates.")
+        df_mensuel = df_mensuel.dropna(subset=["MOIS"])
+    if df_mensuel.empty:
+        raise ValueError("Aucune donnée valide pour les mois après conversion des dates.")
+    agg_dict = {
+        col_police: "count",
+        col_frais: "sum",
+        col_couvert: "sum"
+    }
+    if col_rejet is not None and col_rejet in df_mensuel.columns and not df_mensuel[col_rejet].isna().all():
+        agg_dict[col_rejet] = "sum"
+    df_mensuel_grouped = df_mensuel.groupby("MOIS").agg(agg_dict).rename(columns={
+        col_police: "Nombre de Sinistres",
+        col_frais: "Frais réels",
+        col_couvert: "Montant Couvert",
+        col_rejet: "Rejets" if col_rejet in agg_dict else None
+    }).reset_index()
+    df_mensuel_grouped = df_mensuel_grouped.loc[:, ~df_mensuel_grouped.columns.isin([None])]
+    mois_fr_to_en = {
+        "Janvier": "January", "Février": "February", "Mars": "March", "Avril": "April",
+        "Mai": "May", "Juin": "June", "Juillet": "July", "Août": "August",
+        "Septembre": "September", "Octobre": "October", "Novembre": "November", "Décembre": "December"
+    }
+    df_mensuel_grouped["MOIS_EN"] = df_mensuel_grouped["MOIS"].apply(
+        lambda x: " ".join([mois_fr_to_en.get(x.split()[0], x.split()[0]), x.split()[1]])
+    )
+    df_mensuel_grouped["MOIS_DATE"] = pd.to_datetime(df_mensuel_grouped["MOIS_EN"], format="%B %Y", errors='coerce')
+    df_mensuel_grouped = df_mensuel_grouped.sort_values(by="MOIS_DATE", ascending=True).drop(columns=["MOIS_DATE", "MOIS_EN"])
+    total_row = pd.DataFrame({
+        "MOIS": ["Total général"],
+        "Nombre de Sinistres": [df_mensuel_grouped["Nombre de Sinistres"].sum()],
+        "Frais réels": [df_mensuel_grouped["Frais réels"].sum()],
+        "Montant Couvert": [df_mensuel_grouped["Montant Couvert"].sum()],
+    })
+    if "Rejets" in df_mensuel_grouped.columns:
+        total_row["Rejets"] = [df_mensuel_grouped["Rejets"].sum()]
+    df_mensuel_grouped = pd.concat([df_mensuel_grouped, total_row], ignore_index=True)
+    for col in df_mensuel_grouped.columns:
+        if col != "MOIS":
+            df_mensuel_grouped[col] = df_mensuel_grouped[col].apply(lambda x: f"{int(x):,}".replace(",", " "))
+    return df_mensuel_grouped
+
+
+def _calculer_specialites_reference(df_filtre):
+    """calculer_specialites d'origine : une copie et un groupby par section."""
+    col_specialite = df_filtre.columns[17]
+    col_couvert = df_filtre.columns[22]
+    col_rejets = df_filtre.columns[24] if 24 < len(df_filtre.columns) else None
+    df_specialite = df_filtre.copy()
+    if col_rejets is not None and col_rejets in df_specialite.columns:
+        df_specialite = df_specialite[df_specialite[col_rejets].apply(lambda x: pd.notna(x) and isinstance(x, (int, float)))]
+    tableau_spec = df_specialite.groupby(col_specialite).agg({
+        col_specialite: "count",
+        col_couvert: "sum",
+        col_rejets: "sum" if col_rejets in df_specialite.columns else lambda x: 0
+    }).rename(columns={
+        col_specialite: "Nombre",
+        col_couvert: "Couvert",
+        col_rejets: "Rejets" if col_rejets in df_specialite.columns else None
+    })
+    total_row = pd.DataFrame({
+        "Nombre": [tableau_spec["Nombre"].sum()],
+        "Couvert": [tableau_spec["Couvert"].sum()],
+        "Rejets": [tableau_spec["Rejets"].sum()] if "Rejets" in tableau_spec.columns else [0]
+    }, index=["Total général"])
+    tableau_spec = pd.concat([tableau_spec, total_row]).reset_index().rename(columns={'index': 'Spécialité'})
+    for col in ["Nombre", "Couvert", "Rejets"]:
+        tableau_spec[col] = tableau_spec[col].apply(lambda x: f"{int(x):,}".replace(",", " "))
+    return tableau_spec
+
+
+def _calculer_prestataires_reference(df_filtre):
+    """calculer_prestataires d'origine : une copie et un groupby par section."""
+    col_prestataire = df_filtre.columns[13]
+    col_ville = df_filtre.columns[14]
+    col_commune = df_filtre.columns[15]
+    col_couvert = df_filtre.columns[22]
+    df_prestataires = df_filtre.groupby([col_prestataire, col_ville, col_commune]).agg({
+        col_prestataire: "count",
+        col_couvert: "sum"
+    }).rename(columns={col_prestataire: "NOMBRE", col_couvert: "Couvert"}).reset_index()
+    df_prestataires.columns = ["PRESTATAIRE", "VILLE", "COMMUNE", "NOMBRE", "Couvert"]
+    df_prestataires = df_prestataires.sort_values(by="Couvert", ascending=False)
+    total_covered = df_prestataires["Couvert"].sum()
+    total_nombre = df_prestataires["NOMBRE"].sum()
+    df_prestataires["Proportion"] = (df_prestataires["Couvert"] / total_covered * 100).round(0).astype(int).astype(str) + "%"
+    df_prestataires["Ordre"] = range(1, len(df_prestataires) + 1)
+    df_prestataires = df_prestataires[["Ordre", "PRESTATAIRE", "VILLE", "COMMUNE", "NOMBRE", "Couvert", "Proportion"]]
+    df_prestataires["Couvert"] = df_prestataires["Couvert"].apply(lambda x: f"{int(x):,}".replace(",", " "))
+    total_row = pd.DataFrame({
+        "Ordre": [""],
+        "PRESTATAIRE": ["Total"],
+        "VILLE": [""],
+        "COMMUNE": [""],
+        "NOMBRE": [f"{int(total_nombre):,}".replace(",", " ")],
+        "Couvert": [f"{int(total_covered):,}".replace(",", " ")],
+        "Proportion": ["100%"]
+    })
+    return pd.concat([df_prestataires, total_row], ignore_index=True)
+
+
+def _calculer_familles_reference(df_filtre, col_carte_assure_principal, col_nom_assure_principal):
+    """calculer_familles d'origine : une copie et un groupby par section."""
+    col_couvert = df_filtre.columns[22]  # Colonne montant couvert
+    # Grouper par numéro de carte de l'assuré principal pour obtenir le cumul des dépenses par famille
+    df_familles = df_filtre.groupby([col_carte_assure_principal, col_nom_assure_principal]).agg({
+        col_carte_assure_principal: "count",
+        col_couvert: "sum"
+    }).rename(columns={col_carte_assure_principal: "Nombre d'actes", col_couvert: "Couvert"}).reset_index()
+
+    df_familles.columns = ["N° de Famille", "Assuré Principal", "Nombre d'actes", "Couvert"]
+    df_familles = df_familles.sort_values(by="Couvert", ascending=False)
+    total_covered = df_familles["Couvert"].sum()
+    total_actes = df_familles["Nombre d'actes"].sum()
+    df_familles["Proportion"] = (df_familles["Couvert"] / total_covered * 100).round(0).astype(int).astype(str) + "%"
+    df_familles["Ordre"] = range(1, len(df_familles) + 1)
+    df_familles["Couvert"] = df_familles["Couvert"].apply(lambda x: f"{int(x):,}".replace(",", " "))
+    df_familles = df_familles[["Ordre", "N° de Famille", "Assuré Principal", "Nombre d'actes", "Couvert", "Proportion"]]
+    total_row = pd.DataFrame({
+        "Ordre": [""],
+        "N° de Famille": ["Total"],
+        "Assuré Principal": [""],
+        "Nombre d'actes": [f"{int(total_actes):,}".replace(",", " ")],
+        "Couvert": [f"{int(total_covered):,}".replace(",", " ")],
+        "Proportion": ["100%"]
+    })
+    return pd.concat([df_familles, total_row], ignore_index=True)
+
+
+def _sections_reference(df_filtre, df_effectif):
+    familles = detecter_colonnes_familles(df_filtre)
+    return (
+        _calculer_beneficiaires_reference(df_filtre, df_effectif),
+        _calculer_mensuel_reference(df_filtre),
+        _calculer_specialites_reference(df_filtre),
+        _calculer_prestataires_reference(df_filtre),
+        _calculer_familles_reference(df_filtre, *familles),
+    )
+
+
+def _sections_agregees(df_filtre, df_effectif):
+    agregats = agreger_contrat(df_filtre)
+    tableaux = (
+        calculer_beneficiaires(agregats, df_effectif),
+        calculer_mensuel(agregats),
+        calculer_specialites(agregats),
+        calculer_prestataires(agregats),
+        calculer_familles(agregats),
+    )
+    return tuple(formater_tableau(tableau) for tableau in tableaux)
+
+
+def _sans_espaces(df):
+    """Tableau en texte sans espaces (les nombres d'actes n'avaient de séparateur de milliers que sur le total)."""
+    return df.astype(str).apply(lambda colonne: colonne.str.replace(" ", ""))
+
+
+def bench_agregation(nb_lignes=10_000):
+    """Sections III à VII : un groupby et une copie par section contre le moteur d'agrégation en une passe."""
+    df_filtre = detail_synthetique(nb_lignes)
+    df_effectif = effectif_synthetique()
+
+    duree_ref, ref = _chronometrer(lambda: _sections_reference(df_filtre, df_effectif))
+    duree_vec, vec = _chronometrer(lambda: _sections_agregees(df_filtre, df_effectif))
+    for tableau_ref, tableau_vec in zip(ref, vec):
+        pd.testing.assert_frame_equal(_sans_espaces(tableau_vec), _sans_espaces(tableau_ref))
+
+    print(f"Agrégation des sections III à VII ({nb_lignes} lignes) : "
+          f"par section {duree_ref * 1000:.1f} ms, une passe {duree_vec * 1000:.1f} ms "
+          f"(x{duree_ref / duree_vec:.1f})")
+
+
+def bench_mois(nb_lignes=10_000):
+    """Libellés de mois : `apply(format_date_fr)` ligne par ligne contre une mise en forme par mois distinct."""
+    dates = detail_synthetique(nb_lignes)["DATE SOINS"]
+
+    duree_ref, ref = _chronometrer(lambda: dates.apply(_format_date_fr_reference))
+    duree_vec, vec = _chronometrer(lambda: libelles_mois(dates))
+    assert ref.tolist() == vec.tolist()
+
+    print(f"Libellés de mois ({nb_lignes} lignes) : apply {duree_ref * 1000:.1f} ms, "
+          f"clé de mois {duree_vec * 1000:.1f} ms (x{duree_ref / duree_vec:.1f})")
+
+
+def _trouver_tranche_reference(df_clause, tranche_min_col, tranche_max_col, ratio_sp):
+    """Recherche d'origine : parcours `iterrows` de la clause pour un seul contrat."""
+    pourcentage_sp = round(ratio_sp * 100)
+    for idx, row in df_clause.iterrows():
+        try:
+            if round(row[tranche_min_col] * 100) <= pourcentage_sp <= round(row[tranche_max_col] * 100):
+                return idx
+        except (ValueError, TypeError):
+            continue
+    return None
+
+
+def bench_clause(nb_lignes=10_000):
+    """Tranche de la clause pour `nb_lignes` contrats : `iterrows` par contrat contre recherche vectorisée."""
+    df_clause = pd.DataFrame({
+        "rapport s/p min": [0.0, 0.5, 0.6, 0.7, 0.8, np.nan, 1.0],
+        "rapport s/p max": [0.5, 0.6, 0.7, 0.8, 1.0, np.nan, 5.0],
+        "ajustement": ["-10%", "-5%", "0%", "+5%", "+10%", "", "+20%"],
+    })
+    ratios = np.random.default_rng(0).uniform(0, 6, nb_lignes).round(3)
+    clause = ClauseAjustement(df_clause, "rapport s/p min", "rapport s/p max")
+
+    duree_ref, ref = _chronometrer(
+        lambda: [_trouver_tranche_reference(df_clause, "rapport s/p min", "rapport s/p max", r) for r in ratios],
+        repetitions=1,
+    )
+    duree_vec, vec = _chronometrer(lambda: clause.tranches(ratios))
+    assert [-1 if r is None else r for r in ref] == vec.tolist()
+    # Recherche générale si les tranches ne sont pas ordonnées
+    desordonnee = ClauseAjustement(df_clause.iloc[::-1].reset_index(drop=True), "rapport s/p min", "rapport s/p max")
+    ref_desordonnee = [_trouver_tranche_reference(desordonnee.df, "rapport s/p min", "rapport s/p max", r) for r in ratios[:1000]]
+    assert [-1 if r is None else r for r in ref_desordonnee] == desordonnee.tranches(ratios[:1000]).tolist()
+
+    print(f"Tranches de la clause ({nb_lignes} contrats) : iterrows {duree_ref * 1000:.1f} ms, "
+          f"recherche vectorisée {duree_vec * 1000:.2f} ms (x{duree_ref / duree_vec:.0f})")
+
+
+def _portefeuille_reference(df_detail, production):
+    """Indicateurs contrat par contrat, comme la section I pour le contrat sélectionné."""
+    lignes = []
+    colonnes = [df_detail.columns[27], df_detail.columns[5], df_detail.columns[6]]
+    for (assureur, client, police), positions in df_detail.groupby(colonnes, sort=True).indices.items():
+        df_filtre = df_detail.iloc[positions]
+        sinistres = df_filtre.iloc[:, 22].sum()
+        primes = production.df.loc[(production.df["Assureur"] == assureur)
+                                   & (production.df["client_police_key"] == f"{client} | {police}"), "Primes Acquises"]
+        prime = float(primes.iloc[0]) if len(primes) else 0.0
+        specialites = df_filtre.groupby(df_filtre.columns[17])[df_filtre.columns[22]].sum()
+        lignes.append({
+            "Assureur": assureur, "Client": client, "Police": police,
+            "Nombre de Sinistres": len(df_filtre), "Sinistres": float(sinistres),
+            "S/P": sinistres / prime if prime > 0 else 0.0,
+            "Patients": df_filtre.iloc[:, 9].nunique(),
+            "Spécialité principale": specialites.idxmax() if len(specialites) else None,
+        })
+    return pd.DataFrame(lignes)
+
+
+def bench_portefeuille(nb_lignes=10_000, nb_contrats=1_000):
+    """Tableau de bord : indicateurs contrat par contrat contre un seul passage groupé sur DETAIL."""
+    df_detail = detail_synthetique(nb_lignes, nb_contrats=nb_contrats)
+    cles = df_detail[["ASSUREUR", "CLIENT", "POLICE"]].drop_duplicates()
+    production = TableIndexee(pd.DataFrame({
+        "Assureur": cles["ASSUREUR"].to_numpy(),
+        "client_police_key": (cles["CLIENT"] + " | " + cles["POLICE"]).to_numpy(),
+        "Primes Acquises": np.random.default_rng(1).integers(0, 5_000_000, len(cles)),
+    }), ["Assureur", "client_police_key"])
+
+    duree_ref, ref = _chronometrer(lambda: _portefeuille_reference(df_detail, production), repetitions=1)
+    duree_vec, vec = _chronometrer(lambda: calculer_portefeuille(df_detail, production))
+    vec = vec.sort_values(["Assureur", "Client", "Police"]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(vec[ref.columns], ref, check_dtype=False)
+
+    print(f"Portefeuille ({nb_lignes} lignes, {len(ref)} contrats) : contrat par contrat {duree_ref * 1000:.0f} ms, "
+          f"une passe {duree_vec * 1000:.1f} ms (x{duree_ref / duree_vec:.0f})")
+
+
+def classeur_detail(df_detail):
+    """Contenu d'un classeur DETAIL.xlsx (feuille 'DETAIL') écrit à partir de lignes synthétiques."""
+    tampon = BytesIO()
+    with pd.ExcelWriter(tampon, engine="xlsxwriter") as writer:
+        df_detail.to_excel(writer, index=False, sheet_name="DETAIL")
+    return tampon.getvalue()
+
+
+def _mesurer_lecture(lecteur, contenu):
+    """
+    Durée, pic d'allocation Python et mémoire du DataFrame d'une lecture de DETAIL. Le pic est
+    mesuré par tracemalloc lors d'une seconde lecture, pour ne pas fausser la durée.
+    """
+    duree, df = _chronometrer(lambda: lecteur(BytesIO(contenu)), repetitions=1)
+    tracemalloc.start()
+    lecteur(BytesIO(contenu))
+    _, pic = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duree, pic, int(df.memory_usage(index=True, deep=True).sum()), df
+
+
+def bench_lecture(nb_lignes=10_000):
+    """
+    Lecture de DETAIL : `read_excel` complet contre lecture par blocs, avec ou sans élagage des
+    colonnes, puis écriture et relecture du snapshot d'un DETAIL compacté dont une colonne en
+    catégories mêle nombres et texte.
+    """
+    contenu = classeur_detail(detail_synthetique(nb_lignes, nb_contrats=50))
+    lectures = {
+        "read_excel": lire_detail,
+        "par blocs": lire_detail_flux,
+        "par blocs, colonnes du rapport": lambda source: lire_detail_flux(source, colonnes_rapport=True),
+    }
+    print(f"Lecture de DETAIL ({nb_lignes} lignes, {len(contenu) / 1024 ** 2:.1f} Mo) :")
+    reference = None
+    for nom, lecteur in lectures.items():
+        duree, pic, taille, df = _mesurer_lecture(lecteur, contenu)
+        if reference is None:
+            reference = df
+        assert list(df.columns) == list(reference.columns) and len(df) == len(reference)
+        for position in resoudre_schema(reference.columns).positions_utiles():
+            assert df.iloc[:, position].astype(object).where(df.iloc[:, position].notna(), None).tolist() == \
+                reference.iloc[:, position].astype(object).where(reference.iloc[:, position].notna(), None).tolist()
+        print(f"  {nom:<32} {duree:6.2f} s, pic {pic / 1024 ** 2:7.1f} Mo, DataFrame {taille / 1024 ** 2:6.1f} Mo")
+
+    # Prestataires codés par un numéro sur une ligne sur trois : catégories de types mélangés après compactage
+    df_mixte = reference.copy()
+    prestataire = resoudre_schema(df_mixte.columns).nom_colonne("prestataire")
+    df_mixte[prestataire] = df_mixte[prestataire].astype(object)
+    df_mixte.loc[df_mixte.index[::3], prestataire] = 1000 + np.arange(len(df_mixte.index[::3])) % 7
+    df_mixte = compacter_detail(df_mixte)
+    with tempfile.TemporaryDirectory() as repertoire:
+        snapshots = SnapshotStore(repertoire)
+        debut = time.perf_counter()
+        assert snapshots.ecrire("DETAIL", "mixte", df_mixte), snapshots.echecs
+        duree_ecriture = time.perf_counter() - debut
+        debut = time.perf_counter()
+        relu = snapshots.lire("DETAIL", "mixte")
+        duree_lecture = time.perf_counter() - debut
+        pd.testing.assert_frame_equal(relu, df_mixte)
+    print(f"  {'snapshot, catégories mélangées':<32} écriture {duree_ecriture * 1000:.0f} ms, relecture {duree_lecture * 1000:.0f} ms")
+
+
+def _compacter_reference(df_detail):
+    """Normalisation d'origine : colonnes texte en chaînes Python, clé par concaténation ligne à ligne."""
+    df_detail.iloc[:, 5] = normaliser_noms(df_detail.iloc[:, 5])
+    df_detail.iloc[:, 27] = normaliser_noms(df_detail.iloc[:, 27])
+    df_detail['client_police_key'] = df_detail[df_detail.columns[5]] + " | " + df_detail[df_detail.columns[6]]
+    return df_detail
+
+
+def bench_categories(nb_lignes=10_000):
+    """Colonnes texte répétitives de DETAIL : chaînes Python contre catégories, mémoire et regroupement par contrat."""
+    df_detail = detail_synthetique(nb_lignes, nb_contrats=50)
+    duree_ref, ref = _chronometrer(lambda: _compacter_reference(df_detail.copy()))
+    duree_cat, cat = _chronometrer(lambda: compacter_detail(df_detail.copy()))
+    for nom in ref.columns:
+        assert cat[nom].astype(object).where(cat[nom].notna(), None).tolist() == \
+            ref[nom].astype(object).where(ref[nom].notna(), None).tolist(), nom
+
+    cle = "client_police_key"
+    duree_groupe_ref, _ = _chronometrer(lambda: ref.groupby(cle).indices)
+    duree_groupe_cat, _ = _chronometrer(lambda: cat.groupby(cle, observed=True).indices)
+    memoire = rapport_memoire(cat)
+    print(f"Catégories ({nb_lignes} lignes) : normalisation {duree_ref * 1000:.0f} ms -> {duree_cat * 1000:.0f} ms, "
+          f"DataFrame {ref.memory_usage(deep=True).sum() / 1024 ** 2:.1f} Mo -> {memoire['Mémoire'].sum() / 1024 ** 2:.1f} Mo "
+          f"(estimé sans catégories {memoire['Mémoire en chaînes'].sum() / 1024 ** 2:.1f} Mo), "
+          f"groupby par contrat {duree_groupe_ref * 1000:.1f} ms -> {duree_groupe_cat * 1000:.1f} ms")
+
+
+def bench_schema(nb_lignes=10_000):
+    """Colonnes de DETAIL : résolution du schéma à chaque section contre une fois par fichier."""
+    df_filtre = detail_synthetique(nb_lignes)
+    schema = resoudre_schema(df_filtre.columns)
+    entetes = [f"{nom} (saisie)" if i % 3 == 0 else nom.title() for i, nom in enumerate(df_filtre.columns)]
+    duree_resolution, _ = _chronometrer(lambda: resoudre_schema(df_filtre.columns), repetitions=20)
+    duree_approchee, approche = _chronometrer(lambda: resoudre_schema(entetes), repetitions=20)
+    duree_sans, _ = _chronometrer(lambda: agreger_contrat(df_filtre))
+    duree_avec, _ = _chronometrer(lambda: agreger_contrat(df_filtre, schema))
+    print(f"Schéma ({len(df_filtre.columns)} colonnes) : résolution {duree_resolution * 1e3:.2f} ms, "
+          f"en-têtes modifiés {duree_approchee * 1e3:.2f} ms ({approche.rapport['Méthode'].value_counts().to_dict()}) ; "
+          f"agrégats {duree_sans * 1000:.1f} ms en résolvant, {duree_avec * 1000:.1f} ms avec le schéma du fichier")
+
+
+def _mesurer_export(ecrire):
+    """Durée et pic d'allocation Python d'un export (pic mesuré lors d'une seconde écriture)."""
+    duree, contenu = _chronometrer(ecrire, repetitions=1)
+    tracemalloc.start()
+    ecrire()
+    _, pic = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duree, pic, len(contenu)
+
+
+def _excel_pandas_octets(df):
+    sortie = BytesIO()
+    with pd.ExcelWriter(sortie, engine="xlsxwriter") as writer:
+        df.to_excel(writer, index=False, sheet_name="DETAIL_FILTRÉ")
+    return sortie.getvalue()
+
+
+def _excel_flux_octets(df):
+    sortie = BytesIO()
+    _excel_flux(df, sortie, "DETAIL_FILTRÉ")
+    return sortie.getvalue()
+
+
+def bench_export(nb_lignes=10_000):
+    """Export de DETAIL filtré : classeur pandas/xlsxwriter complet, classeur `constant_memory`, CSV et Parquet."""
+    df_filtre = compacter_detail(detail_synthetique(nb_lignes))
+    exports = {
+        "Excel (to_excel)": lambda: _excel_pandas_octets(df_filtre),
+        "Excel (constant_memory)": lambda: _excel_flux_octets(df_filtre),
+        "CSV": lambda: exporter_detail(df_filtre, "CSV"),
+        "Parquet": lambda: exporter_detail(df_filtre, "Parquet"),
+    }
+    print(f"Export de DETAIL filtré ({nb_lignes} lignes) :")
+    for nom, ecrire in exports.items():
+        duree, pic, taille = _mesurer_export(ecrire)
+        print(f"  {nom:<24} {duree:6.2f} s, pic {pic / 1024 ** 2:7.1f} Mo, fichier {taille / 1024 ** 2:6.1f} Mo")
+
+
+# Au-delà, DETAIL est normalisé en mémoire au lieu d'être relu depuis un classeur : écrire puis
+# relire un million de lignes prend plusieurs minutes, et une feuille Excel en compte au plus 1 048 576
+LIGNES_CLASSEUR_MAX = 200_000
+
+
+def classeur(df):
+    """Contenu d'un classeur d'une feuille écrit à partir d'un tableau synthétique."""
+    tampon = BytesIO()
+    with pd.ExcelWriter(tampon, engine="xlsxwriter") as writer:
+        df.to_excel(writer, index=False)
+    return tampon.getvalue()
+
+
+def _contrats_synthetiques(df_detail):
+    """Contrats (assureur, client, police) présents dans des lignes DETAIL synthétiques."""
+    return df_detail[["ASSUREUR", "CLIENT", "POLICE"]].drop_duplicates().sort_values(["ASSUREUR", "CLIENT", "POLICE"])
+
+
+def production_synthetique(df_detail, graine=0):
+    """Feuille PRODUCTION : une ligne par contrat des lignes DETAIL, primes tirées au hasard."""
+    rng = np.random.default_rng(graine)
+    contrats = _contrats_synthetiques(df_detail)
+    primes = rng.integers(1_000_000, 50_000_000, len(contrats))
+    return pd.DataFrame({
+        "Id Police Ankara": contrats["POLICE"].to_numpy(),
+        "N° Police Assureur": [f"A{i}" for i in range(len(contrats))],
+        "Assureur": contrats["ASSUREUR"].to_numpy(),
+        "Client": contrats["CLIENT"].to_numpy(),
+        "Primes Émises Nettes": primes,
+        "Primes Acquises": (primes * 0.9).astype(int),
+        "Sinistres": 0,
+        "S/P": 0,
+    })
+
+
+def effectif_brut_synthetique(df_detail, graine=0):
+    """
+    Feuille EFFECTIF telle que saisie (mois au format jj/mm/aaaa) : un effectif par mois
+    de soins et par couple (assureur, client) des lignes DETAIL.
+    """
+    rng = np.random.default_rng(graine)
+    couples = _contrats_synthetiques(df_detail)[["ASSUREUR", "CLIENT"]].drop_duplicates()
+    mois = pd.date_range(df_detail["DATE SOINS"].min().to_period("M").to_timestamp(), df_detail["DATE SOINS"].max(), freq="MS")
+    df = couples.merge(pd.DataFrame({"Mois": mois.strftime("%d/%m/%Y")}), how="cross")
+    df["Adherent"] = rng.integers(50, 500, len(df))
+    df["Conjoint"] = df["Adherent"] // 2
+    df["Enfant"] = rng.integers(50, 800, len(df))
+    df["Total"] = df["Adherent"] + df["Conjoint"] + df["Enfant"]
+    return df.rename(columns={"ASSUREUR": "Assureur", "CLIENT": "Client"})[
+        ["Mois", "Assureur", "Client", "Adherent", "Conjoint", "Enfant", "Total"]]
+
+
+def clause_synthetique():
+    """Feuille Clause Ajustement Santé : quatre tranches de S/P."""
+    return pd.DataFrame({"Rapport S/P min": [0, 0.5, 0.75, 1.0], "Rapport S/P max": [0.5, 0.75, 1.0, 9.99],
+                         "Ajustement": ["-10%", "0%", "+10%", "+25%"]})
+
+
+def bench_rapport(nb_lignes=10_000, nb_contrats=20):
+    """
+    Rapport complet du plus gros contrat, sans interface, à partir de classeurs synthétiques :
+    ingestion, filtrage, sections, graphiques et PDF, mesurés par étape comme dans l'application.
+
+    Returns:
+        pd.DataFrame: Étapes mesurées (voir `Mesures.tableau`), pour le suivi des résultats.
+    """
+    df_detail = detail_synthetique(nb_lignes, nb_contrats=nb_contrats)
+    contenu_production = classeur(production_synthetique(df_detail))
+    contenu_effectif = classeur(effectif_brut_synthetique(df_detail))
+    contenu_clause = classeur(clause_synthetique())
+    contenu_detail = classeur_detail(df_detail) if nb_lignes <= LIGNES_CLASSEUR_MAX else None
+
+    mesures = Mesures()
+    debut = time.perf_counter()
+    with mesures.active():
+        if contenu_detail is not None:
+            detail = charger_detail(contenu_detail, flux=True)
+        else:
+            with etape("Normalisation DETAIL (en mémoire)", lignes=nb_lignes):
+                detail = construire_donnees_detail(compacter_detail(df_detail))
+        del df_detail
+        production = charger_production(contenu_production)
+        effectif = charger_effectif(contenu_effectif)
+        clause = charger_clause(contenu_clause)
+
+        nom_assureur, client, police = max(contrats_detail(detail.df, detail.schema).items(), key=lambda c: len(c[1]))[0]
+        with etape("Filtrage du contrat") as mesure:
+            df_filtre = detail.selection_contrat(client, police)
+            mesure.lignes = len(df_filtre)
+        rapport = construire_rapport(df_filtre, nom_assureur, client, police, production, effectif, clause,
+                                     avertir=lambda message: None, schema=detail.schema)
+        with etape("Génération du PDF"):
+            pdf = generer_pdf(rapport)
+    duree = time.perf_counter() - debut
+
+    resultats = mesures.tableau()
+    print(f"Rapport ({nb_lignes} lignes DETAIL, contrat de {len(df_filtre)} lignes, "
+          f"{'classeur' if contenu_detail is not None else 'en mémoire'}) : {duree:.2f} s, PDF {len(pdf) / 1024:.0f} Ko")
+    print(resultats.to_string(index=False, float_format=lambda x: f"{x:.1f}"))
+    return resultats
+
+
+def logo_synthetique(couleur, taille=(120, 60)):
+    """Logo PNG uni, propre à une session simulée."""
+    from PIL import Image
+    tampon = BytesIO()
+    Image.new("RGB", taille, couleur).save(tampon, format="PNG")
+    return tampon.getvalue()
+
+
+def pdf_sans_date(pdf):
+    """PDF sans sa date de création, pour comparer deux générations d'un même rapport."""
+    return re.sub(rb"/CreationDate \(D:\d+\)", b"", pdf)
+
+
+def fichiers_synthetiques(nb_lignes, nb_contrats):
+    """DETAIL, PRODUCTION, EFFECTIF et Clause synthétiques, chargés comme par l'application."""
+    df_detail = detail_synthetique(nb_lignes, nb_contrats=nb_contrats)
+    production = charger_production(classeur(production_synthetique(df_detail)))
+    effectif = charger_effectif(classeur(effectif_brut_synthetique(df_detail)))
+    clause = charger_clause(classeur(clause_synthetique()))
+    return construire_donnees_detail(compacter_detail(df_detail)), production, effectif, clause
+
+
+def rapport_synthetique(detail, production, effectif, clause, contrat):
+    """Rapport complet d'un contrat (assureur, client, police) des fichiers synthétiques."""
+    nom_assureur, client, police = contrat
+    return construire_rapport(detail.selection_contrat(client, police), nom_assureur, client, police,
+                              production, effectif, clause, avertir=lambda message: None, schema=detail.schema)
+
+
+def graphiques_session(magasin, rapport, effectif):
+    """
+    Remplace les graphiques d'un rapport par ceux du magasin d'une session, rendus comme
+    dans l'interface (`MagasinGraphiques.ajouter` puis `impressions`).
+
+    Returns:
+        RapportContrat: `rapport`, dont `graphiques` vient du magasin.
+    """
+    contrat = (rapport.nom_assureur, rapport.client, rapport.police_ankara)
+    df_effectif = None
+    if "effectifs" in rapport.graphiques:
+        df_effectif, _ = preparer_effectifs(effectif.selection(rapport.nom_assureur, rapport.client).copy())
+    for nom, fonction, donnees, dpi in (("effectifs", graphique_effectifs, df_effectif, None),
+                                        ("beneficiaires", graphique_beneficiaires, rapport.tableau_final, None),
+                                        ("mensuel", graphique_mensuel, rapport.df_mensuel_grouped, None),
+                                        ("specialites", graphique_specialites, rapport.tableau_spec, 300)):
+        if donnees is not None:
+            magasin.ajouter(contrat, nom, fonction, donnees, dpi_impression=dpi)
+    rapport.graphiques = magasin.impressions(contrat)
+    return rapport
+
+
+def bench_sessions(nb_lignes=10_000, nb_sessions=8, tours=3):
+    """
+    Sessions simultanées : chaque session simulée génère dans son propre thread (comme les
+    sessions Streamlit d'un même serveur), avec son propre MagasinGraphiques, le PDF de son
+    contrat avec ses logos. Chaque PDF doit être identique à celui généré par la session seule.
+    """
+    detail, production, effectif, clause = fichiers_synthetiques(nb_lignes, nb_sessions)
+    contrats = list(contrats_detail(detail.df, detail.schema))[:nb_sessions]
+
+    def session(numero):
+        rapport = rapport_synthetique(detail, production, effectif, clause, contrats[numero])
+        graphiques_session(MagasinGraphiques(), rapport, effectif)
+        logo_ankara = logo_synthetique((numero * 30 % 256, 120, 200))
+        logo_assureur = logo_synthetique((200, numero * 30 % 256, 60))
+        return generer_pdf(rapport, logo_ankara, logo_assureur)
+
+    debut = time.perf_counter()
+    references = [pdf_sans_date(session(numero)) for numero in range(len(contrats))]
+    duree_seule = time.perf_counter() - debut
+    duree_simultanee = None
+    for _ in range(tours):
+        debut = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(contrats)) as pool:
+            pdfs = list(pool.map(session, range(len(contrats))))
+        duree = time.perf_counter() - debut
+        duree_simultanee = duree if duree_simultanee is None else min(duree_simultanee, duree)
+        differents = [numero for numero, pdf in enumerate(pdfs) if pdf_sans_date(pdf) != references[numero]]
+        assert not differents, f"PDF des sessions {differents} différents de leur génération seule"
+    print(f"Sessions ({len(contrats)} sessions, {nb_lignes} lignes DETAIL) : PDF isolés sur {tours} tours simultanés ; "
+          f"une session après l'autre {duree_seule:.2f} s, en parallèle {duree_simultanee:.2f} s")
+
+
+def bench_file_pdf(nb_lignes=10_000):
+    """File de génération des PDF : première demande, générée en arrière-plan, contre demande identique."""
+    detail, production, effectif, clause = fichiers_synthetiques(nb_lignes, 1)
+    rapport = rapport_synthetique(detail, production, effectif, clause, next(iter(contrats_detail(detail.df, detail.schema))))
+    file_rapports = FileRapports(max_workers=1)
+    etapes = []
+
+    def attendre(travail):
+        while not travail.termine:
+            if not etapes or etapes[-1] != travail.etape:
+                etapes.append(travail.etape)
+            time.sleep(0.001)
+        assert travail.statut == STATUT_TERMINE, travail.details
+        return travail
+
+    debut = time.perf_counter()
+    premier = attendre(file_rapports.soumettre(rapport))
+    duree_generation = time.perf_counter() - debut
+    debut = time.perf_counter()
+    second = attendre(file_rapports.soumettre(rapport))
+    duree_reprise = time.perf_counter() - debut
+    file_rapports.arreter()
+    assert second.pdf is premier.pdf
+    print(f"File PDF ({nb_lignes} lignes DETAIL) : génération {duree_generation * 1000:.0f} ms "
+          f"({len([etape for etape in etapes if etape])} étapes suivies), demande identique {duree_reprise * 1000:.1f} ms")
+
+
+# Budget du temps d'import des modules chargés au démarrage de l'application, et modules
+# qui ne doivent être importés qu'au premier graphique ou au premier PDF
+BUDGET_IMPORT_MS = 600
+MODULES_DIFFERES = ("matplotlib", "fpdf")
+REPERTOIRE = os.path.dirname(os.path.abspath(__file__))
+
+
+def modules_demarrage(chemin=os.path.join(REPERTOIRE, "AppStreamlitSamJesus.py")):
+    """Modules importés au niveau module par l'application, donc chargés à son démarrage."""
+    with open(chemin, encoding="utf-8") as f:
+        arbre = ast.parse(f.read())
+    noms = []
+    for noeud in arbre.body:
+        if isinstance(noeud, ast.Import):
+            noms += [alias.name for alias in noeud.names]
+        elif isinstance(noeud, ast.ImportFrom) and not noeud.level:
+            noms.append(noeud.module)
+    return list(dict.fromkeys(noms))
+
+
+def temps_import(instructions):
+    """
+    Temps d'import mesuré par `python -X importtime` dans un nouvel interpréteur.
+
+    Returns:
+        dict: {module: (durée cumulée en ms, profondeur)}, dans l'ordre d'import.
+    """
+    sortie = subprocess.run([sys.executable, "-X", "importtime", "-c", instructions], cwd=REPERTOIRE,
+                            capture_output=True, text=True, check=True).stderr
+    temps = {}
+    for ligne in sortie.splitlines():
+        if not ligne.startswith("import time:") or "cumulative" in ligne:
+            continue
+        _, cumul, nom = ligne.split("|")
+        temps[nom.strip()] = (int(cumul) / 1000, (len(nom) - len(nom.lstrip()) - 1) // 2)
+    return temps
+
+
+def bench_imports(nb_lignes=None, repetitions=3):
+    """
+    Démarrage à froid : temps d'import des modules de l'application (meilleur de plusieurs
+    interpréteurs), comparé à `BUDGET_IMPORT_MS`, et modules différés chargés au démarrage.
+    """
+    modules = modules_demarrage()
+    # Les modules importés par l'interpréteur lui-même (site, encodings...) ne sont pas comptés
+    interpreteur = set(temps_import("pass"))
+    mesures = [temps_import("import " + ", ".join(modules)) for _ in range(repetitions)]
+    racines = [nom for nom, (_, profondeur) in mesures[0].items() if profondeur == 0 and nom not in interpreteur]
+    durees = {nom: min(temps[nom][0] for temps in mesures if nom in temps) for nom in racines}
+    total = min(sum(temps[nom][0] for nom in racines if nom in temps) for temps in mesures)
+    charges = sorted({nom.split(".")[0] for nom in mesures[0] if nom.split(".")[0] in MODULES_DIFFERES})
+    differes = temps_import("import graphiques, rapport_pdf; graphiques.nouvelle_figure((1, 1))")
+    cout_differe = sum(duree for nom, (duree, profondeur) in differes.items()
+                       if profondeur == 0 and nom.split(".")[0] in MODULES_DIFFERES + ("rapport_pdf",))
+
+    print(f"Imports au démarrage ({len(modules)} modules) : {total:.0f} ms pour un budget de {BUDGET_IMPORT_MS} ms "
+          f"({'respecté' if total <= BUDGET_IMPORT_MS else 'DÉPASSÉ'})")
+    for nom, duree in sorted(durees.items(), key=lambda d: -d[1])[:8]:
+        print(f"  {nom:<24} {duree:7.1f} ms")
+    print(f"  différés au premier graphique / PDF : {cout_differe:.0f} ms"
+          + (f" ; déjà importés au démarrage : {', '.join(charges)}" if charges else ""))
+    return pd.DataFrame({"Étape": ["Imports au démarrage"] + [f"Import {nom}" for nom in durees],
+                         "Durée (ms)": [total] + list(durees.values())})
+
+
+BENCHMARKS = {
+    "mesure": bench_mesure,
+    "nettoyage": bench_nettoyage,
+    "agregation": bench_agregation,
+    "mois": bench_mois,
+    "clause": bench_clause,
+    "portefeuille": bench_portefeuille,
+    "lecture": bench_lecture,
+    "categories": bench_categories,
+    "schema": bench_schema,
+    "export": bench_export,
+    "rapport": bench_rapport,
+    "imports": bench_imports,
+    "sessions": bench_sessions,
+    "file_pdf": bench_file_pdf,
+}
+
+
+def _version():
+    """Commit courant du dépôt, pour comparer les résultats d'une version à l'autre."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks de la génération de rapports.")
+    parser.add_argument("benchmarks", nargs="*", metavar="benchmark", help=f"Benchmarks à exécuter parmi {', '.join(BENCHMARKS)} (tous par défaut)")
+    parser.add_argument("--lignes", type=int, default=10_000, help="Nombre de lignes des tableaux synthétiques")
+    parser.add_argument("--tailles", type=int, nargs="+", help="Plusieurs nombres de lignes (de 10000 à 2000000), remplace --lignes")
+    parser.add_argument("--resultats", help="Fichier CSV auquel ajouter les étapes mesurées, pour suivre les résultats dans le temps")
+    args = parser.parse_args(argv)
+    inconnus = [nom for nom in args.benchmarks if nom not in BENCHMARKS]
+    if inconnus:
+        parser.error(f"benchmark inconnu : {', '.join(inconnus)}")
+
+    resultats = []
+    for taille in args.tailles or [args.lignes]:
+        for nom in args.benchmarks or list(BENCHMARKS):
+            etapes = BENCHMARKS[nom](taille)
+            if etapes is not None:
+                resultats.append(etapes.assign(Benchmark=nom, Taille=taille))
+    if not resultats:
+        return
+
+    tableau = pd.concat(resultats, ignore_index=True)
+    if len(args.tailles or []) > 1:
+        print("\nDurées par taille (ms) :")
+        durees = tableau.pivot_table(index=["Benchmark", "Étape"], columns="Taille", values="Durée (ms)", sort=False)
+        print(durees.to_string(float_format=lambda x: f"{x:.1f}"))
+    if args.resultats:
+        tableau.insert(0, "Date", pd.Timestamp.now().isoformat(timespec="seconds"))
+        tableau.insert(1, "Version", _version())
+        tableau.to_csv(args.resultats, mode="a", index=False, header=not os.path.exists(args.resultats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,935 @@
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field, fields, is_dataclass
+from datetime import datetime
+from functools import partial
+from io import BytesIO
+from itertools import islice, zip_longest
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from mesures import etape
+from schema import SchemaDetail, resoudre_schema
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow est normalement installé avec streamlit
+    pa = None
+    feather = None
+
+# Incrémenter dès que la normalisation change, pour invalider les snapshots existants
+VERSION_SNAPSHOT = 5
+
+COLONNES_PRODUCTION = ["Id Police Ankara", "N° Police Assureur", "Assureur", "Client",
+                       "Primes Émises Nettes", "Primes Acquises", "Sinistres", "S/P"]
+COLONNES_EFFECTIF = ['MOIS', 'ASSUREUR', 'CLIENT', 'ADHERENT', 'CONJOINT', 'ENFANT', 'TOTAL']
+TAILLE_BLOC_DETAIL = 50_000
+# Textes lus comme valeurs manquantes, comme par défaut dans `pd.read_excel`
+VALEURS_MANQUANTES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                      '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+# Noms acceptés (en minuscules) pour les bornes des tranches S/P de la clause
+COLONNES_TRANCHE_MIN = ['tranche min', 'minimum', 'min', 'tranche_min', 'rapport s/p min']
+COLONNES_TRANCHE_MAX = ['tranche max', 'maximum', 'max', 'tranche_max', 'rapport s/p max']
+
+
+def empreinte_fichier(contenu):
+    """
+    Calcule l'empreinte (hash SHA-256) du contenu d'un fichier chargé.
+
+    Args:
+        contenu (bytes): Contenu brut du fichier.
+
+    Returns:
+        str: Empreinte hexadécimale servant de clé de cache.
+    """
+    return hashlib.sha256(contenu).hexdigest()
+
+
+def normaliser_noms(serie):
+    """
+    Normalise une colonne de noms (clients, assureurs) : suppression des espaces
+    superflus et passage en majuscules.
+    """
+    return serie.astype(str).str.strip().str.upper().str.replace(r'\s+', ' ', regex=True)
+
+
+def colonnes_mixtes(df):
+    """
+    Noms des colonnes objet de `df` dont les valeurs sont de types mélangés (nombres et
+    "N/A" par exemple), et des colonnes en catégories dont les catégories le sont.
+    """
+    mixtes = []
+    for nom in df.columns:
+        serie = df[nom]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            serie = serie.cat.categories
+        elif serie.dtype != object:
+            continue
+        if pd.api.types.infer_dtype(serie, skipna=True).startswith("mixed"):
+            mixtes.append(nom)
+    return mixtes
+
+
+def colonnes_texte_mixtes(df):
+    """
+    Copie légère de `df` où les colonnes de types mélangés sont converties en texte,
+    Arrow et Parquet imposant un type par colonne. Les valeurs manquantes sont conservées.
+
+    Returns:
+        pd.DataFrame: `df` lui-même s'il n'a aucune colonne de types mélangés.
+    """
+    mixtes = colonnes_mixtes(df)
+    if not mixtes:
+        return df
+    df = df.copy(deep=False)
+    for nom in mixtes:
+        df[nom] = df[nom].astype(str).where(df[nom].notna(), None)
+    return df
+
+
+def taille_memoire(valeur):
+    """
+    Estime l'empreinte mémoire (en octets) d'un objet mis en cache.
+    """
+    if isinstance(valeur, pd.DataFrame):
+        return int(valeur.memory_usage(index=True, deep=True).sum())
+    if isinstance(valeur, DonneesDetail) and valeur.memoire is not None:
+        return int(valeur.memoire["Mémoire"].sum()) + sum(taille_index(index) for index in valeur.index_list())
+    if isinstance(valeur, (DonneesDetail, TableIndexee)):
+        return taille_memoire(valeur.df) + sum(taille_index(index) for index in valeur.index_list())
+    if isinstance(valeur, ClauseAjustement):
+        return taille_memoire(valeur.df) + valeur.bornes_min.nbytes + valeur.bornes_max.nbytes
+    if isinstance(valeur, (bytes, bytearray)):
+        return len(valeur)
+    if isinstance(valeur, tuple):
+        return sum(taille_memoire(element) for element in {id(element): element for element in valeur}.values())
+    if is_dataclass(valeur):
+        return taille_memoire(tuple(getattr(valeur, champ.name) for champ in fields(valeur)))
+    return 0
+
+
+def taille_index(index):
+    """
+    Taille (en octets) des tableaux de positions d'un index de groupes.
+    """
+    return sum(positions.nbytes for positions in index.values())
+
+
+def construire_index(df, colonnes):
+    """
+    Construit un index {(valeur1, valeur2, ...): positions des lignes} en un seul groupby.
+    Sélectionner un groupe revient ensuite à un `iloc` sur ses positions, au lieu
+    d'un masque booléen évalué sur tout le DataFrame.
+    """
+    return df.groupby(colonnes, sort=False, dropna=False, observed=True).indices
+
+
+def selection_index(df, index, cle):
+    """
+    Retourne les lignes de `df` correspondant à `cle` dans `index` (DataFrame vide si absente).
+    """
+    positions = index.get(cle)
+    if positions is None:
+        return df.iloc[0:0]
+    return df.iloc[positions]
+
+
+class CacheLRU:
+    """
+    Cache LRU borné en mémoire, partagé entre les reruns (et les sessions) Streamlit.
+    Les entrées les moins récemment utilisées sont évincées dès que la taille
+    cumulée dépasse `taille_max` octets ou que le nombre d'entrées dépasse `max_entrees`.
+
+    Un seul calcul est lancé par clé : les appels concurrents de `get_or_compute` pour une
+    clé en cours de calcul (même fichier chargé par deux sessions) attendent son résultat.
+    """
+
+    def __init__(self, taille_max=1024 ** 3, max_entrees=8):
+        self.taille_max = taille_max
+        self.max_entrees = max_entrees
+        self._entrees = OrderedDict()
+        self._en_cours = {}
+        self._taille = 0
+        self._verrou = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def taille(self):
+        with self._verrou:
+            return self._taille
+
+    def __len__(self):
+        with self._verrou:
+            return len(self._entrees)
+
+    def __contains__(self, cle):
+        with self._verrou:
+            return cle in self._entrees
+
+    def get_or_compute(self, cle, calcul):
+        """
+        Retourne la valeur associée à `cle`, en la calculant via `calcul()` si absente.
+        Si la même clé est déjà en cours de calcul dans un autre thread, attend son
+        résultat (ou son exception) au lieu de relancer le calcul.
+        """
+        with self._verrou:
+            if cle in self._entrees:
+                self._entrees.move_to_end(cle)
+                self.hits += 1
+                return self._entrees[cle][0]
+            attente = self._en_cours.get(cle)
+            if attente is None:
+                self.misses += 1
+                resultat = self._en_cours[cle] = Future()
+            else:
+                self.hits += 1
+        if attente is not None:
+            return attente.result()
+        try:
+            valeur = calcul()
+            self.put(cle, valeur)
+        except BaseException as e:
+            with self._verrou:
+                del self._en_cours[cle]
+            resultat.set_exception(e)
+            raise
+        with self._verrou:
+            del self._en_cours[cle]
+        resultat.set_result(valeur)
+        return valeur
+
+    def put(self, cle, valeur):
+        taille = taille_memoire(valeur)
+        with self._verrou:
+            if cle in self._entrees:
+                self._taille -= self._entrees[cle][1]
+            self._entrees[cle] = (valeur, taille)
+            self._entrees.move_to_end(cle)
+            self._taille += taille
+            # On conserve toujours au moins l'entrée la plus récente
+            while len(self._entrees) > 1 and (self._taille > self.taille_max or len(self._entrees) > self.max_entrees):
+                _, (_, taille_evincee) = self._entrees.popitem(last=False)
+                self._taille -= taille_evincee
+                self.evictions += 1
+
+    def clear(self):
+        with self._verrou:
+            self._entrees.clear()
+            self._taille = 0
+
+    def stats(self):
+        with self._verrou:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entrees": len(self._entrees),
+                "taille": self._taille,
+            }
+
+
+class SnapshotStore:
+    """
+    Snapshots colonnaires (Arrow/Feather non compressé) des fichiers déjà lus et normalisés,
+    indexés par empreinte du fichier source. Ils sont relus par memory-mapping lors des
+    sessions suivantes au lieu de reparser le classeur Excel.
+
+    Le répertoire est borné à `taille_max` octets : les snapshots les moins récemment
+    utilisés (date de modification, rafraîchie à chaque lecture) sont supprimés en premier.
+
+    Arrow imposant un type par colonne, les colonnes de types mélangés (N°CARTE mêlant
+    nombres et texte, rejets numériques et "N/A"...) sont écrites en texte, accompagnées
+    d'une colonne `PREFIXE_NOMBRES + nom` qui garde les valeurs numériques d'origine :
+    `lire` restitue ainsi les valeurs lues dans le classeur. Les colonnes en catégories
+    (`compacter_detail`) utilisent `PREFIXE_CATEGORIES` et sont relues en catégories.
+    """
+
+    EXTENSION = ".arrow"
+    PREFIXE_NOMBRES = "__nombres__"
+    PREFIXE_CATEGORIES = "__categories__"
+
+    def __init__(self, repertoire=None, taille_max=2 * 1024 ** 3):
+        self.repertoire = repertoire or os.path.join(tempfile.gettempdir(), "ankara_snapshots")
+        self.taille_max = taille_max
+        # Écritures échouées depuis le démarrage : nom du snapshot -> message d'erreur
+        self.echecs = {}
+        self._verrou = threading.RLock()
+        os.makedirs(self.repertoire, exist_ok=True)
+
+    @property
+    def disponible(self):
+        return feather is not None
+
+    def _chemin(self, nature, empreinte):
+        return os.path.join(self.repertoire, f"{nature}_{empreinte}_v{VERSION_SNAPSHOT}{self.EXTENSION}")
+
+    def existe(self, nature, empreinte):
+        return self.disponible and os.path.exists(self._chemin(nature, empreinte))
+
+    def lire(self, nature, empreinte, colonnes=None):
+        """
+        Relit un snapshot, ou retourne None s'il n'existe pas (ou est illisible).
+        """
+        table = self.lire_table(nature, empreinte, colonnes)
+        if table is None:
+            return None
+        try:
+            return self.vers_pandas(table)
+        except pa.ArrowException:
+            self.supprimer(os.path.basename(self._chemin(nature, empreinte)))
+            return None
+
+    def lire_table(self, nature, empreinte, colonnes=None):
+        """
+        Table Arrow d'un snapshot, memory-mappée : ses colonnes restent dans le cache disque
+        du système, partagé entre processus, tant qu'elles ne sont pas converties par
+        `vers_pandas`. Retourne None si le snapshot n'existe pas (ou est illisible).
+        """
+        if not self.disponible:
+            return None
+        chemin = self._chemin(nature, empreinte)
+        if not os.path.exists(chemin):
+            return None
+        try:
+            if colonnes is not None:
+                with pa.memory_map(chemin) as source:
+                    presentes = set(pa.ipc.open_file(source).schema.names)
+                colonnes = list(colonnes) + [prefixe + nom for nom in colonnes
+                                             for prefixe in (self.PREFIXE_NOMBRES, self.PREFIXE_CATEGORIES)
+                                             if prefixe + nom in presentes]
+            table = feather.read_table(chemin, columns=colonnes, memory_map=True)
+        except (OSError, pa.ArrowException):
+            self.supprimer(os.path.basename(chemin))
+            return None
+        try:
+            os.utime(chemin)
+        except OSError:
+            pass
+        return table
+
+    def vers_pandas(self, table):
+        """
+        Convertit une table lue par `lire_table` (ou une sélection de ses lignes) en DataFrame,
+        valeurs des colonnes de types mélangés comprises.
+        """
+        return self._restaurer_nombres(table.to_pandas())
+
+    def _colonnes_arrow(self, df):
+        """
+        Copie légère de `df` représentable en Arrow : colonnes de types mélangés en texte
+        (en catégories de textes pour les colonnes en catégories), plus leurs valeurs
+        numériques d'origine dans les colonnes `PREFIXE_NOMBRES + nom` ou `PREFIXE_CATEGORIES + nom`.
+        """
+        mixtes = colonnes_mixtes(df)
+        if not mixtes:
+            return df
+        texte = colonnes_texte_mixtes(df)
+        nombres = {}
+        for nom in mixtes:
+            valeurs = df[nom].astype(object)
+            prefixe = self.PREFIXE_NOMBRES
+            if isinstance(df[nom].dtype, pd.CategoricalDtype):
+                texte[nom] = texte[nom].astype("category")
+                prefixe = self.PREFIXE_CATEGORIES
+            nombres[prefixe + nom] = pd.to_numeric(valeurs.where(valeurs.map(_est_nombre)), errors="coerce")
+        return pd.concat([texte, pd.DataFrame(nombres, index=df.index)], axis=1)
+
+    def _restaurer_nombres(self, df):
+        """
+        Inverse de `_colonnes_arrow` : remet les valeurs numériques d'origine dans les
+        colonnes de types mélangés, en catégories s'il y a lieu, et retire les colonnes
+        `PREFIXE_NOMBRES` et `PREFIXE_CATEGORIES`.
+        """
+        for colonne in list(df.columns):
+            prefixe = next((p for p in (self.PREFIXE_NOMBRES, self.PREFIXE_CATEGORIES) if str(colonne).startswith(p)), None)
+            if prefixe is None:
+                continue
+            nombres = df.pop(colonne)
+            nom = colonne[len(prefixe):]
+            if nom not in df.columns:
+                continue
+            lignes = nombres.notna().to_numpy()
+            if lignes.any():
+                valeurs = df[nom].to_numpy(dtype=object, copy=True)
+                valeurs[lignes] = [int(x) if float(x).is_integer() else float(x) for x in nombres.to_numpy()[lignes]]
+                df[nom] = valeurs
+            if prefixe == self.PREFIXE_CATEGORIES:
+                df[nom] = df[nom].astype("category")
+        return df
+
+    def ecrire(self, nature, empreinte, df):
+        """
+        Écrit un snapshot puis applique la limite de taille du répertoire.
+        Retourne False si l'écriture échoue (disque plein, en-têtes non textuels...) ;
+        le message d'erreur est alors gardé dans `echecs`.
+        """
+        if not self.disponible:
+            return False
+        chemin = self._chemin(nature, empreinte)
+        nom = os.path.basename(chemin)
+        temporaire = f"{chemin}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            feather.write_feather(self._colonnes_arrow(df), temporaire, compression="uncompressed")
+            os.replace(temporaire, chemin)
+        except (OSError, TypeError, ValueError, pa.ArrowException) as e:
+            if os.path.exists(temporaire):
+                os.remove(temporaire)
+            with self._verrou:
+                self.echecs[nom] = f"{type(e).__name__} : {e}"
+            return False
+        with self._verrou:
+            self.echecs.pop(nom, None)
+        self.evincer()
+        return True
+
+    def lister(self):
+        """
+        Liste les snapshots présents, du plus récemment utilisé au plus ancien.
+        """
+        snapshots = []
+        for nom in os.listdir(self.repertoire):
+            if not nom.endswith(self.EXTENSION):
+                continue
+            chemin = os.path.join(self.repertoire, nom)
+            try:
+                infos = os.stat(chemin)
+            except OSError:
+                continue
+            nature = nom.split("_", 1)[0]
+            snapshots.append({
+                "nom": nom,
+                "type": nature,
+                "taille": infos.st_size,
+                "dernier_acces": datetime.fromtimestamp(infos.st_mtime),
+            })
+        return sorted(snapshots, key=lambda s: s["dernier_acces"], reverse=True)
+
+    def taille(self):
+        return sum(s["taille"] for s in self.lister())
+
+    def supprimer(self, nom):
+        chemin = os.path.join(self.repertoire, os.path.basename(nom))
+        try:
+            os.remove(chemin)
+            return True
+        except OSError:
+            return False
+
+    def purger(self):
+        """
+        Supprime tous les snapshots. Retourne le nombre de fichiers supprimés.
+        """
+        with self._verrou:
+            return sum(1 for s in self.lister() if self.supprimer(s["nom"]))
+
+    def evincer(self):
+        """
+        Supprime les snapshots les moins récemment utilisés jusqu'à respecter la taille maximale.
+        """
+        with self._verrou:
+            snapshots = self.lister()
+            total = sum(s["taille"] for s in snapshots)
+            # On conserve toujours le snapshot le plus récent
+            while len(snapshots) > 1 and total > self.taille_max:
+                ancien = snapshots.pop()
+                if self.supprimer(ancien["nom"]):
+                    total -= ancien["taille"]
+
+
+def _est_nombre(valeur):
+    return isinstance(valeur, (int, float, np.number)) and not pd.isna(valeur)
+
+
+@dataclass
+class DonneesDetail:
+    """
+    Résultat du chargement du fichier DETAIL : DataFrame normalisé et listes dérivées
+    utilisées par les sélecteurs de l'interface.
+    """
+    df: pd.DataFrame
+    clients: list
+    polices_dict: dict
+    assureurs: list
+    empreinte: str = ""
+    index_contrats: dict = field(default_factory=dict)
+    index_assureur_client: dict = field(default_factory=dict)
+    nature: str = "DETAIL"
+    memoire: pd.DataFrame = None
+    schema: SchemaDetail = None
+
+    def index_list(self):
+        return [self.index_contrats, self.index_assureur_client]
+
+    def selection_contrat(self, client, police):
+        """Lignes du contrat (client, police), en O(taille du groupe)."""
+        return selection_index(self.df, self.index_contrats, (client, police))
+
+    def selection_assureur_client(self, assureur, client):
+        """Lignes de l'assureur et du client, en O(taille du groupe)."""
+        return selection_index(self.df, self.index_assureur_client, (assureur, client))
+
+
+@dataclass
+class TableIndexee:
+    """
+    DataFrame normalisé (PRODUCTION, EFFECTIF) accompagné d'un index sur ses colonnes de filtrage.
+    """
+    df: pd.DataFrame
+    colonnes_index: list
+    index: dict = field(default_factory=dict)
+    empreinte: str = ""
+
+    def index_list(self):
+        return [self.index]
+
+    def selection(self, *cle):
+        return selection_index(self.df, self.index, tuple(cle))
+
+
+@dataclass
+class ClauseAjustement:
+    """
+    Clause Ajustement Santé chargée : table affichée, colonnes des bornes S/P, et bornes des
+    tranches exploitables en pourcentages entiers (tels qu'affichés), triées une fois pour
+    toutes afin de retrouver la tranche de nombreux contrats en un seul appel.
+    """
+    df: pd.DataFrame
+    tranche_min_col: str = None
+    tranche_max_col: str = None
+    positions: np.ndarray = field(default_factory=lambda: np.array([], dtype=np.int64))
+    bornes_min: np.ndarray = field(default_factory=lambda: np.array([]))
+    bornes_max: np.ndarray = field(default_factory=lambda: np.array([]))
+
+    def __post_init__(self):
+        self._ordonnees = False
+        if not self.tranche_min_col or not self.tranche_max_col:
+            return
+        bornes_min = np.round(pd.to_numeric(self.df[self.tranche_min_col], errors="coerce").to_numpy(dtype=float) * 100)
+        bornes_max = np.round(pd.to_numeric(self.df[self.tranche_max_col], errors="coerce").to_numpy(dtype=float) * 100)
+        self.positions = np.flatnonzero(~np.isnan(bornes_min) & ~np.isnan(bornes_max))
+        self.bornes_min = bornes_min[self.positions]
+        self.bornes_max = bornes_max[self.positions]
+        # Tranches dans l'ordre du fichier et sans chevauchement (hors bornes communes) :
+        # la recherche dichotomique sur les bornes min suffit
+        self._ordonnees = bool(np.all(self.bornes_min <= self.bornes_max)
+                               and np.all(self.bornes_min[1:] >= self.bornes_max[:-1]))
+
+    def tranches(self, ratios_sp):
+        """
+        Position (ligne de `df`) de la première tranche contenant chaque rapport S/P, -1 si aucune.
+        Les S/P et les bornes sont comparés en pourcentages arrondis à l'unité.
+        """
+        pourcentages = np.round(np.asarray(ratios_sp, dtype=float) * 100)
+        nb_tranches = len(self.positions)
+        if nb_tranches == 0:
+            return np.full(pourcentages.shape, -1, dtype=np.int64)
+        if self._ordonnees:
+            # Dernière tranche commençant strictement avant le S/P, sinon celle qui commence exactement au S/P
+            precedente = np.searchsorted(self.bornes_min, pourcentages, side="left") - 1
+            suivante = np.minimum(precedente + 1, nb_tranches - 1)
+            dans_precedente = (precedente >= 0) & (pourcentages <= self.bornes_max[np.maximum(precedente, 0)])
+            dans_suivante = (self.bornes_min[suivante] == pourcentages) & (pourcentages <= self.bornes_max[suivante])
+            rangs = np.where(dans_precedente, precedente, np.where(dans_suivante, suivante, -1))
+        else:
+            dedans = ((self.bornes_min <= pourcentages[..., None]) & (pourcentages[..., None] <= self.bornes_max))
+            rangs = np.where(dedans.any(axis=-1), dedans.argmax(axis=-1), -1)
+        return np.where(rangs >= 0, self.positions[np.maximum(rangs, 0)], -1)
+
+    def tranche(self, ratio_sp):
+        """Index (dans `df`) de la ligne dont la tranche contient le S/P du contrat, ou None."""
+        position = int(self.tranches([ratio_sp])[0])
+        return self.df.index[position] if position >= 0 else None
+
+
+def construire_clause(lu, empreinte=""):
+    """Post-traitement de `lire_clause` : bornes des tranches prêtes pour la recherche."""
+    df_clause, tranche_min_col, tranche_max_col = lu
+    return ClauseAjustement(df_clause, tranche_min_col, tranche_max_col)
+
+
+def lire_detail(source):
+    """
+    Lit la feuille DETAIL d'un classeur et normalise les colonnes client (5) et assureur (27).
+
+    Args:
+        source: Chemin ou objet fichier (BytesIO, UploadedFile) du classeur DETAIL.xlsx.
+
+    Returns:
+        pd.DataFrame: Données normalisées, avec la colonne 'client_police_key'.
+
+    Raises:
+        ValueError: Si le classeur ne contient pas de feuille 'DETAIL'.
+    """
+    xls = pd.ExcelFile(source)
+    if "DETAIL" not in xls.sheet_names:
+        raise ValueError("Le fichier DETAIL.xlsx ne contient pas de feuille 'DETAIL'.")
+    return compacter_detail(xls.parse("DETAIL"))
+
+
+def cle_client_police(clients, polices):
+    """
+    Clé "client | police" en catégories, construite sur les codes des deux colonnes : seules
+    les paires distinctes sont assemblées en texte. Clé manquante si le client ou la police l'est.
+    """
+    codes_clients, uniques_clients = pd.factorize(clients)
+    codes_polices, uniques_polices = pd.factorize(polices)
+    valides = (codes_clients >= 0) & (codes_polices >= 0)
+    paires = np.where(valides, codes_clients.astype(np.int64) * max(len(uniques_polices), 1) + codes_polices, -1)
+    uniques_paires, codes = np.unique(paires, return_inverse=True)
+    uniques_paires = uniques_paires[uniques_paires >= 0]
+    if not valides.all():
+        codes = codes - 1
+    libelles = (np.asarray(uniques_clients, dtype=object)[uniques_paires // max(len(uniques_polices), 1)] + " | "
+                + np.asarray(uniques_polices, dtype=object)[uniques_paires % max(len(uniques_polices), 1)])
+    # Deux paires différentes peuvent donner le même texte : les catégories sont dédoublonnées
+    renumerotation, categories = pd.factorize(libelles, sort=True)
+    codes = np.where(codes >= 0, renumerotation[np.maximum(codes, 0)], -1) if len(categories) else codes
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=getattr(clients, "index", None))
+
+
+def compacter_detail(df_detail, schema=None):
+    """
+    Normalise les noms de clients et d'assureurs, passe en catégories les colonnes texte
+    répétitives du schéma et ajoute la clé 'client_police_key'.
+
+    Raises:
+        ValueError: Si des colonnes obligatoires de DETAIL sont introuvables.
+    """
+    schema = schema or resoudre_schema(df_detail.columns).verifier()
+    normalisees = schema.positions_normalisees()
+    for position in schema.positions_categorielles():
+        colonne = df_detail.iloc[:, position]
+        if position in normalisees:
+            df_detail.isetitem(position, _noms_normalises(colonne).array)
+        elif colonne.dtype == object:
+            df_detail.isetitem(position, colonne.astype("category"))
+    df_detail['client_police_key'] = cle_client_police(schema.colonne(df_detail, "client"), schema.colonne(df_detail, "police"))
+    return df_detail
+
+
+def rapport_memoire(df):
+    """
+    Mémoire de chaque colonne, et celle qu'elle occuperait en chaînes Python (dtype object)
+    pour les colonnes en catégories, afin de mesurer le gain du compactage.
+
+    Returns:
+        pd.DataFrame: Colonnes 'Colonne', 'Type', 'Mémoire' et 'Mémoire en chaînes' (octets).
+    """
+    lignes = []
+    for nom in df.columns:
+        serie = df[nom]
+        octets = int(serie.memory_usage(index=False, deep=True))
+        en_chaines = octets
+        if isinstance(serie.dtype, pd.CategoricalDtype) and len(serie.cat.categories):
+            codes = serie.cat.codes.to_numpy()
+            comptes = np.bincount(codes[codes >= 0], minlength=len(serie.cat.categories))
+            tailles = np.fromiter((sys.getsizeof(c) for c in serie.cat.categories), dtype=np.int64)
+            # Un pointeur par ligne, la chaîne de chaque ligne et un flottant NaN par valeur manquante
+            en_chaines = 8 * len(serie) + int(comptes @ tailles) + int((codes < 0).sum()) * sys.getsizeof(np.nan)
+        lignes.append({"Colonne": nom, "Type": str(serie.dtype), "Mémoire": octets, "Mémoire en chaînes": en_chaines})
+    return pd.DataFrame(lignes, columns=["Colonne", "Type", "Mémoire", "Mémoire en chaînes"])
+
+
+def _noms_colonnes(entete):
+    """Noms des colonnes comme `pd.read_excel` : "Unnamed: i" si l'en-tête est vide, suffixe ".n" si répété."""
+    noms, occurrences = [], {}
+    for i, nom in enumerate(entete):
+        nom = f"Unnamed: {i}" if nom is None else nom
+        if nom in occurrences:
+            occurrences[nom] += 1
+            nom = f"{nom}.{occurrences[nom]}"
+        else:
+            occurrences[nom] = 0
+        noms.append(nom)
+    return noms
+
+
+def _serie_bloc(valeurs):
+    """Colonne d'un bloc, les textes de `VALEURS_MANQUANTES` étant lus comme manquants."""
+    serie = pd.Series(valeurs)
+    if serie.dtype == object:
+        manquantes = serie.isin(VALEURS_MANQUANTES)
+        if manquantes.any():
+            serie = serie.mask(manquantes).infer_objects()
+    return serie
+
+
+def _noms_normalises(serie):
+    """`normaliser_noms` appliqué une seule fois par valeur distincte, résultat en catégories."""
+    codes, uniques = pd.factorize(serie.astype(object).where(serie.notna(), np.nan), use_na_sentinel=False)
+    normalises = normaliser_noms(pd.Series(uniques, dtype=object)).to_numpy()
+    return pd.Series(pd.Categorical(normalises[codes]))
+
+
+def _bloc_detail(lignes, nb_colonnes, colonnes_utiles, schema, clients, polices):
+    """
+    Convertit un bloc de lignes brutes en colonnes typées {position: Series} : noms normalisés
+    (client, assureur) et textes répétitifs en catégories, entiers réduits au plus petit type.
+    """
+    normalisees, categorielles = schema.positions_normalisees(), schema.positions_categorielles()
+    colonnes = {}
+    for position, valeurs in enumerate(islice(zip_longest(*lignes), nb_colonnes)):
+        if colonnes_utiles is not None and position not in colonnes_utiles:
+            continue
+        serie = _serie_bloc(valeurs)
+        if position in normalisees:
+            serie = _noms_normalises(serie)
+        elif position in categorielles and serie.dtype == object:
+            serie = serie.astype("category")
+        elif pd.api.types.is_integer_dtype(serie):
+            serie = pd.to_numeric(serie, downcast="integer")
+        colonnes[position] = serie
+    client, police = schema.position("client"), schema.position("police")
+    if clients is not None or polices is not None:
+        garder = np.ones(len(lignes), dtype=bool)
+        if clients is not None:
+            garder &= colonnes[client].isin(clients).to_numpy()
+        if polices is not None:
+            garder &= colonnes[police].isin(polices).to_numpy()
+        colonnes = {position: serie[garder].reset_index(drop=True) for position, serie in colonnes.items()}
+    colonnes["client_police_key"] = cle_client_police(colonnes[client], colonnes[police])
+    return colonnes
+
+
+def _assembler_colonne(blocs):
+    """Concatène les blocs d'une colonne, en conservant les catégories quand tous les blocs en sont."""
+    if all(isinstance(bloc.dtype, pd.CategoricalDtype) for bloc in blocs):
+        categories = pd.api.types.union_categoricals([bloc.array for bloc in blocs], sort_categories=True)
+        return pd.Series(categories).cat.remove_unused_categories()
+    return pd.concat(blocs, ignore_index=True)
+
+
+def lire_detail_flux(source, colonnes_rapport=False, clients=None, polices=None, taille_bloc=TAILLE_BLOC_DETAIL):
+    """
+    Lit la feuille DETAIL ligne à ligne (openpyxl en lecture seule) par blocs de `taille_bloc`
+    lignes, pour les extractions trop volumineuses pour `lire_detail`. Chaque bloc est
+    normalisé et typé aussitôt lu ; seul un bloc brut est en mémoire à la fois.
+
+    Args:
+        source: Chemin ou objet fichier du classeur DETAIL.xlsx.
+        colonnes_rapport (bool): Ne conserver que les colonnes des champs du schéma, résolu sur
+            la ligne d'en-tête ; les autres sont remplacées par des colonnes vides d'un octet
+            par ligne, pour que les positions lues par le rapport restent inchangées.
+        clients, polices (iterable, optional): Clients (noms normalisés) et polices à conserver.
+
+    Returns:
+        pd.DataFrame: Données normalisées, avec la colonne 'client_police_key'.
+
+    Raises:
+        ValueError: Si le classeur ne contient pas de feuille 'DETAIL' ou si des colonnes
+            obligatoires sont introuvables.
+    """
+    clients = None if clients is None else set(clients)
+    polices = None if polices is None else set(polices)
+    classeur = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        if "DETAIL" not in classeur.sheetnames:
+            raise ValueError("Le fichier DETAIL.xlsx ne contient pas de feuille 'DETAIL'.")
+        feuille = classeur["DETAIL"]
+        # Les dimensions déclarées dans le fichier ne sont pas toujours fiables
+        feuille.reset_dimensions()
+        lignes = feuille.iter_rows(values_only=True)
+        noms = _noms_colonnes(next(lignes, ()))
+        schema = resoudre_schema(noms).verifier()
+        colonnes_utiles = set(schema.positions_utiles()) if colonnes_rapport else None
+        blocs = []
+        while True:
+            bloc = [ligne for ligne in islice(lignes, taille_bloc) if any(v is not None for v in ligne)]
+            if not bloc:
+                break
+            blocs.append(_bloc_detail(bloc, len(noms), colonnes_utiles, schema, clients, polices))
+    finally:
+        classeur.close()
+
+    nb_lignes = sum(len(bloc["client_police_key"]) for bloc in blocs)
+    colonnes = {}
+    for position, nom in enumerate(noms):
+        if blocs and position in blocs[0]:
+            colonnes[nom] = _assembler_colonne([bloc[position] for bloc in blocs])
+        else:
+            # Colonne élaguée : catégories vides, un octet par ligne
+            colonnes[nom] = pd.Series(pd.Categorical.from_codes(np.full(nb_lignes, -1, dtype=np.int8), categories=[]))
+    colonnes["client_police_key"] = _assembler_colonne([bloc["client_police_key"] for bloc in blocs]) if blocs else pd.Series([], dtype=object)
+    return pd.DataFrame(colonnes)
+
+
+def construire_donnees_detail(df_detail, empreinte="", nature="DETAIL"):
+    """
+    Dérive du DataFrame DETAIL normalisé les listes utilisées par les sélecteurs, et résout
+    une fois pour toutes le schéma de ses colonnes.
+    """
+    schema = resoudre_schema(df_detail.columns.drop("client_police_key")).verifier()
+    colonne_client, colonne_police = schema.nom_colonne("client"), schema.nom_colonne("police")
+    colonne_assureur = schema.nom_colonne("assureur")
+    clients = df_detail[colonne_client].dropna().unique().tolist()
+    polices_dict = df_detail.groupby(colonne_client, observed=True)[colonne_police].unique().apply(list).to_dict()
+    assureurs = df_detail[colonne_assureur].dropna().unique().tolist()
+    return DonneesDetail(
+        df_detail, clients, polices_dict, assureurs, empreinte,
+        index_contrats=construire_index(df_detail, [colonne_client, colonne_police]),
+        index_assureur_client=construire_index(df_detail, [colonne_assureur, colonne_client]),
+        nature=nature,
+        memoire=rapport_memoire(df_detail),
+        schema=schema,
+    )
+
+
+def indexer_table(colonnes):
+    """
+    Fabrique la fonction de post-traitement qui indexe une table sur `colonnes`.
+    """
+    def indexer(df, empreinte):
+        return TableIndexee(df, colonnes, construire_index(df, colonnes), empreinte)
+    return indexer
+
+
+def lire_production(source):
+    """
+    Lit le fichier PRODUCTION et normalise les colonnes Assureur et Client.
+
+    Raises:
+        ValueError: Si des colonnes attendues sont absentes.
+    """
+    df_production = pd.read_excel(source)
+    if not all(col in df_production.columns for col in COLONNES_PRODUCTION):
+        raise ValueError("Le fichier PRODUCTION.xlsx ne contient pas toutes les colonnes attendues : " + ", ".join(COLONNES_PRODUCTION))
+    df_production["Assureur"] = normaliser_noms(df_production["Assureur"])
+    df_production["Client"] = normaliser_noms(df_production["Client"])
+    df_production['client_police_key'] = df_production["Client"] + " | " + df_production["Id Police Ankara"]
+    return df_production
+
+
+def lire_effectif(source):
+    """
+    Lit le fichier EFFECTIF, normalise les en-têtes, les noms d'assureurs et de clients,
+    et convertit la colonne MOIS en dates.
+
+    Raises:
+        ValueError: Si des colonnes obligatoires sont absentes.
+    """
+    df_effectif = pd.read_excel(source)
+    df_effectif.columns = [c.strip().upper() for c in df_effectif.columns]
+    missing_columns = [col for col in COLONNES_EFFECTIF if col not in df_effectif.columns]
+    if missing_columns:
+        raise ValueError(f"Les colonnes suivantes sont manquantes dans le fichier EFFECTIF.xlsx : {', '.join(missing_columns)}")
+    # Renommer les colonnes après vérification
+    df_effectif = df_effectif.rename(columns={
+        'CONJOINT': 'CONJOINTS',
+        'ENFANT': 'ENFANTS'
+    })
+    df_effectif['ASSUREUR'] = normaliser_noms(df_effectif['ASSUREUR'])
+    df_effectif['CLIENT'] = normaliser_noms(df_effectif['CLIENT'])
+    df_effectif["MOIS"] = pd.to_datetime(df_effectif["MOIS"], format="%d/%m/%Y", errors="coerce")
+    return df_effectif
+
+
+def lire_clause(source):
+    """
+    Lit le fichier Clause Ajustement Santé et convertit les bornes de tranches S/P en nombres
+    (fractions, mises en forme en pourcentages à l'affichage).
+
+    Returns:
+        tuple: (df_clause, tranche_min_col, tranche_max_col), les colonnes valant None si introuvables.
+    """
+    df_clause = pd.read_excel(source)
+    df_clause.columns = [c.strip().lower() for c in df_clause.columns]
+    tranche_min_col = next((col for col in df_clause.columns if col in COLONNES_TRANCHE_MIN), None)
+    tranche_max_col = next((col for col in df_clause.columns if col in COLONNES_TRANCHE_MAX), None)
+    if tranche_min_col and tranche_max_col:
+        df_clause[tranche_min_col] = df_clause[tranche_min_col].astype(float)
+        df_clause[tranche_max_col] = df_clause[tranche_max_col].astype(float)
+    return df_clause, tranche_min_col, tranche_max_col
+
+
+def _charger(nature, contenu, lecteur, cache=None, snapshots=None, apres_lecture=None):
+    """
+    Charge un fichier en passant successivement par le cache mémoire, le snapshot
+    disque puis, en dernier recours, la lecture du classeur Excel.
+    """
+    empreinte = empreinte_fichier(contenu)
+
+    def calcul():
+        df = None
+        if snapshots is not None:
+            with etape(f"Snapshot {nature}"):
+                df = snapshots.lire(nature, empreinte)
+        if df is None:
+            with etape(f"Lecture {nature}") as mesure:
+                df = lecteur(BytesIO(contenu))
+                mesure.lignes = len(df)
+            if snapshots is not None:
+                with etape(f"Écriture du snapshot {nature}", lignes=len(df)):
+                    snapshots.ecrire(nature, empreinte, df)
+        if not apres_lecture:
+            return df
+        with etape(f"Indexation {nature}", lignes=len(df)):
+            return apres_lecture(df, empreinte)
+
+    if cache is None:
+        return calcul()
+    return cache.get_or_compute((nature, empreinte), calcul)
+
+
+def charger_detail(contenu, cache=None, snapshots=None, flux=False, colonnes_rapport=False, clients=None, polices=None):
+    """
+    Charge le fichier DETAIL à partir de son contenu brut, en réutilisant le résultat
+    déjà normalisé si le même fichier (même empreinte) a déjà été traité.
+
+    Args:
+        contenu (bytes): Contenu du fichier DETAIL.xlsx.
+        cache (CacheLRU, optional): Cache mémoire partagé.
+        snapshots (SnapshotStore, optional): Snapshots disque entre sessions.
+        flux (bool): Lecture par blocs (`lire_detail_flux`) pour les fichiers volumineux.
+        colonnes_rapport (bool): En lecture par blocs, ne garder que les colonnes du schéma.
+        clients, polices (iterable, optional): En lecture par blocs, lignes à conserver.
+
+    Returns:
+        DonneesDetail: Données normalisées et listes dérivées.
+    """
+    if not (flux or colonnes_rapport or clients or polices):
+        return _charger("DETAIL", contenu, lire_detail, cache, snapshots, construire_donnees_detail)
+    # Chaque variante de lecture a ses propres entrées de cache et snapshots
+    nature = "DETAIL-RAPPORT" if colonnes_rapport else "DETAIL-FLUX"
+    if clients or polices:
+        filtre = repr((sorted(clients or []), sorted(polices or []))).encode("utf-8")
+        nature = f"{nature}-{hashlib.sha256(filtre).hexdigest()[:12]}"
+    lecteur = partial(lire_detail_flux, colonnes_rapport=colonnes_rapport,
+                      clients=clients or None, polices=polices or None)
+    return _charger(nature, contenu, lecteur, cache, snapshots, partial(construire_donnees_detail, nature=nature))
+
+
+def charger_production(contenu, cache=None, snapshots=None):
+    """
+    Charge le fichier PRODUCTION normalisé (voir `charger_detail`), indexé par
+    (Assureur, client_police_key).
+    """
+    return _charger("PRODUCTION", contenu, lire_production, cache, snapshots,
+                    indexer_table(["Assureur", "client_police_key"]))
+
+
+def charger_effectif(contenu, cache=None, snapshots=None):
+    """
+    Charge le fichier EFFECTIF normalisé (voir `charger_detail`), indexé par (ASSUREUR, CLIENT).
+    """
+    return _charger("EFFECTIF", contenu, lire_effectif, cache, snapshots,
+                    indexer_table(["ASSUREUR", "CLIENT"]))
+
+
+def charger_clause(contenu, cache=None):
+    """
+    Charge le fichier Clause Ajustement Santé une fois par contenu (sans snapshot disque).
+
+    Returns:
+        ClauseAjustement: Table de la clause et recherche des tranches S/P.
+    """
+    return _charger("CLAUSE", contenu, lire_clause, cache, None, construire_clause)
@@ -0,0 +1,83 @@
+from io import BytesIO
+
+import pandas as pd
+import xlsxwriter
+
+from chargement import colonnes_texte_mixtes
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow est normalement installé avec streamlit
+    pa = None
+
+# Au-delà de ce nombre de lignes, le classeur Excel est écrit ligne à ligne en mode
+# `constant_memory` : xlsxwriter ne garde alors qu'une ligne en mémoire
+SEUIL_EXCEL_FLUX = 50_000
+TAILLE_BLOC_EXPORT = 10_000
+FEUILLE_DETAIL_FILTRE = "DETAIL_FILTRÉ"
+
+# Formats proposés : extension et type MIME du fichier téléchargé
+FORMATS_EXPORT = {
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "CSV": ("csv", "text/csv"),
+}
+if pa is not None:
+    FORMATS_EXPORT["Parquet"] = ("parquet", "application/vnd.apache.parquet")
+
+
+def _excel_flux(df, sortie, feuille):
+    """
+    Écrit `df` dans un classeur xlsxwriter en mode `constant_memory`, bloc par bloc et
+    ligne par ligne (ce mode impose d'écrire les lignes dans l'ordre).
+    """
+    classeur = xlsxwriter.Workbook(sortie, {"constant_memory": True, "default_date_format": "yyyy-mm-dd hh:mm:ss"})
+    try:
+        onglet = classeur.add_worksheet(feuille)
+        entete = classeur.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+        onglet.write_row(0, 0, [str(nom) for nom in df.columns], entete)
+        for debut in range(0, len(df), TAILLE_BLOC_EXPORT):
+            bloc = df.iloc[debut:debut + TAILLE_BLOC_EXPORT].astype(object)
+            bloc = bloc.where(bloc.notna(), None)
+            for i, ligne in enumerate(bloc.itertuples(index=False, name=None), start=debut + 1):
+                onglet.write_row(i, 0, ligne)
+    finally:
+        classeur.close()
+
+
+def exporter_detail(df, format_export="Excel", feuille=FEUILLE_DETAIL_FILTRE):
+    """
+    Contenu du fichier d'export des lignes DETAIL d'un contrat.
+
+    Args:
+        df (pd.DataFrame): Lignes à exporter.
+        format_export (str): Clé de `FORMATS_EXPORT`.
+        feuille (str): Nom de l'onglet Excel.
+
+    Returns:
+        bytes: Contenu du fichier.
+
+    Raises:
+        ValueError: Si le format est inconnu ou si les données ne sont pas représentables en Parquet.
+    """
+    if format_export not in FORMATS_EXPORT:
+        raise ValueError(f"Format d'export inconnu : {format_export}")
+    sortie = BytesIO()
+    if format_export == "CSV":
+        # Séparateur et décimale du français, BOM pour qu'Excel reconnaisse l'UTF-8
+        df.to_csv(sortie, index=False, sep=";", decimal=",", encoding="utf-8-sig")
+    elif format_export == "Parquet":
+        try:
+            colonnes_texte_mixtes(df).to_parquet(sortie, index=False)
+        except (TypeError, ValueError, pa.ArrowException) as e:
+            raise ValueError(f"Les données ne sont pas représentables en Parquet ({e}) ; choisissez Excel ou CSV.")
+    elif len(df) > SEUIL_EXCEL_FLUX:
+        _excel_flux(df, sortie, feuille)
+    else:
+        with pd.ExcelWriter(sortie, engine="xlsxwriter") as writer:
+            df.to_excel(writer, index=False, sheet_name=feuille)
+    return sortie.getvalue()
+
+
+def nom_fichier_export(format_export, nom="DETAIL_filtre"):
+    """Nom du fichier téléchargé pour un format d'export."""
+    return f"{nom}.{FORMATS_EXPORT[format_export][0]}"
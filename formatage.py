@@ -0,0 +1,90 @@
+import numbers
+from functools import partial
+
+import pandas as pd
+
+from chargement import COLONNES_TRANCHE_MAX, COLONNES_TRANCHE_MIN
+
+
+def format_montant(valeur):
+    """Montant tronqué à l'unité avec séparateur de milliers : 1234567.9 -> "1 234 567"."""
+    return f"{int(valeur):,}".replace(",", " ")
+
+
+def format_montant_arrondi(valeur):
+    """Montant arrondi à l'unité avec séparateur de milliers : 1234567.9 -> "1 234 568"."""
+    return f"{valeur:,.0f}".replace(",", " ")
+
+
+def format_pourcentage(valeur):
+    """Fraction en pourcentage arrondi à l'unité : 0.456 -> "46%"."""
+    return f"{int(round(valeur * 100))}%"
+
+
+# Mise en forme des colonnes des tableaux du rapport, qui restent numériques jusqu'à l'affichage.
+# Les colonnes absentes de ce registre sont affichées telles quelles.
+FORMATS_COLONNES = {
+    # Section I et clause (montants arrondis, les sections suivantes les tronquent)
+    "Primes Émises Nettes": format_montant_arrondi,
+    "Primes Acquises": format_montant_arrondi,
+    "Sinistres": format_montant_arrondi,
+    "S/P": format_pourcentage,
+    **{col: format_pourcentage for col in COLONNES_TRANCHE_MIN + COLONNES_TRANCHE_MAX},
+    # Section III
+    "Taux d'utilisation": format_pourcentage,
+    "Montant couvert": format_montant,
+    "Part de consommation": format_pourcentage,
+    # Section IV
+    "Nombre de Sinistres": format_montant,
+    "Frais réels": format_montant,
+    "Montant Couvert": format_montant,
+    "Rejets": format_montant,
+    # Sections V à VII
+    "Nombre": format_montant,
+    "Couvert": format_montant,
+    "NOMBRE": format_montant,
+    "Nombre d'actes": format_montant,
+    "Proportion": format_pourcentage,
+    # Tableau de bord du portefeuille
+    "Prochaine tranche": format_pourcentage,
+    "Marge avant tranche": format_pourcentage,
+}
+
+
+def _formater_valeur(format_colonne, valeur):
+    """Applique le format aux seules valeurs numériques renseignées (les libellés de total restent inchangés)."""
+    if isinstance(valeur, numbers.Real) and not pd.isna(valeur):
+        return format_colonne(valeur)
+    return valeur
+
+
+def formats_tableau(df):
+    """Formats du registre applicables aux colonnes d'un tableau, sous la forme {colonne: fonction}."""
+    return {col: partial(_formater_valeur, FORMATS_COLONNES[col]) for col in df.columns if col in FORMATS_COLONNES}
+
+
+def formater_tableau(df):
+    """
+    Copie d'un tableau dont les colonnes du registre sont converties en texte (export PDF).
+    Chaque colonne n'est parcourue qu'une fois et le tableau d'origine reste numérique.
+    """
+    df_formate = df.copy()
+    for col, format_colonne in formats_tableau(df).items():
+        df_formate[col] = [format_colonne(valeur) for valeur in df[col].to_numpy(dtype=object)]
+    return df_formate
+
+
+def style_tableau(df, ligne_surlignee=None):
+    """
+    Tableau mis en forme pour `st.dataframe` : un Styler qui formate les valeurs à l'affichage,
+    avec la ligne `ligne_surlignee` (index) en orange. Au-delà de la limite de cellules des Styler,
+    le tableau est renvoyé déjà converti en texte.
+    """
+    if df.size > pd.get_option("styler.render.max_elements"):
+        return formater_tableau(df)
+    styler = df.style.format(formats_tableau(df), na_rep="")
+    if ligne_surlignee is not None:
+        styler = styler.apply(
+            lambda ligne: ['background-color: #f77f00' if ligne.name == ligne_surlignee else '' for _ in ligne], axis=1
+        )
+    return styler
@@ -0,0 +1,332 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from mesures import etape
+
+# Résolutions par défaut : celle de st.pyplot pour l'écran, celle de matplotlib pour le PDF
+DPI_ECRAN = 200
+DPI_IMPRESSION = 100
+
+# Incrémenter dès que le style d'un graphique change, pour invalider les rendus en cache
+VERSION_STYLE = 1
+
+
+def nouvelle_figure(figsize):
+    """
+    Figure matplotlib et ses axes, créés sans pyplot sur un canevas Agg : aucun état global
+    (figures ouvertes, figure courante) n'est partagé entre les sessions, qui peuvent tracer
+    simultanément dans leurs threads. matplotlib n'est importé qu'au premier graphique.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig, fig.subplots()
+
+
+def format_milliers(x, _):
+    """Graduation d'axe en montant entier, espace comme séparateur de milliers."""
+    return f"{int(x):,}".replace(",", " ")
+
+
+def rendre_png(fig, dpi=None):
+    """
+    Rend une figure en PNG en mémoire.
+
+    L'image est aplatie en RVB (le fond des figures est opaque) : FPDF l'intègre alors
+    directement, sans extraire une couche alpha pixel par pixel.
+
+    Args:
+        fig: Figure matplotlib.
+        dpi (int, optional): Résolution (par défaut celle de matplotlib).
+
+    Returns:
+        bytes: Contenu du PNG.
+    """
+    tampon = BytesIO()
+    if dpi is None:
+        fig.savefig(tampon, format='png', bbox_inches='tight')
+    else:
+        fig.savefig(tampon, format='png', bbox_inches='tight', dpi=dpi)
+    from PIL import Image
+    tampon.seek(0)
+    sortie = BytesIO()
+    Image.open(tampon).convert('RGB').save(sortie, format='PNG')
+    return sortie.getvalue()
+
+
+def empreinte_graphique(fonction, donnees, **parametres):
+    """
+    Clé de cache d'un graphique : fonction de tracé, table agrégée (valeurs, index et
+    colonnes) et paramètres de rendu.
+
+    Returns:
+        str: Empreinte hexadécimale SHA-256.
+    """
+    empreinte = hashlib.sha256()
+    empreinte.update(pd.util.hash_pandas_object(donnees, index=True).to_numpy().tobytes())
+    empreinte.update(repr((fonction.__name__, VERSION_STYLE, list(donnees.columns), list(donnees.dtypes.astype(str)),
+                           sorted(parametres.items()))).encode())
+    return empreinte.hexdigest()
+
+
+class MagasinGraphiques:
+    """
+    Graphiques rendus en mémoire, par contrat, à deux résolutions : écran (interface)
+    et impression (PDF). Une instance par session évite que des utilisateurs simultanés
+    écrasent les images les uns des autres ; seuls les derniers contrats consultés sont gardés,
+    dans la limite de `taille_max` octets (quota de la session).
+
+    Avec un `cache` (CacheLRU, éventuellement partagé entre sessions), un graphique dont la
+    table agrégée et le rendu sont inchangés n'est pas retracé : les PNG déjà rendus sont repris.
+    """
+
+    def __init__(self, dpi_ecran=DPI_ECRAN, dpi_impression=DPI_IMPRESSION, max_contrats=3, cache=None, taille_max=None):
+        self.dpi_ecran = dpi_ecran
+        self.dpi_impression = dpi_impression
+        self.max_contrats = max_contrats
+        self.taille_max = taille_max
+        self.cache = cache
+        self._contrats = OrderedDict()
+        self._verrou = threading.RLock()
+
+    def ajouter(self, contrat, nom, fonction, donnees, dpi_impression=None):
+        """
+        Trace le graphique (ou le reprend du cache) et le rend pour l'écran et pour l'impression.
+
+        Args:
+            contrat (tuple): Clé du contrat, par ex. (assureur, client, police).
+            nom (str): Nom du graphique dans le rapport ("effectifs", "specialites", ...).
+            fonction (callable): Fonction de tracé, par ex. `graphique_effectifs`.
+            donnees (pd.DataFrame): Table agrégée passée à `fonction`.
+            dpi_impression (int, optional): Résolution d'impression propre à ce graphique.
+
+        Returns:
+            bytes: PNG à la résolution écran.
+        """
+        dpi_impression = dpi_impression or self.dpi_impression
+
+        def rendre():
+            with etape(f"Graphique {nom}"):
+                return tracer()
+
+        def tracer():
+            fig = fonction(donnees)
+            ecran = rendre_png(fig, self.dpi_ecran)
+            impression = ecran if dpi_impression == self.dpi_ecran else rendre_png(fig, dpi_impression)
+            return ecran, impression
+
+        if self.cache is None:
+            ecran, impression = rendre()
+        else:
+            cle = empreinte_graphique(fonction, donnees, dpi_ecran=self.dpi_ecran, dpi_impression=dpi_impression)
+            ecran, impression = self.cache.get_or_compute(cle, rendre)
+        with self._verrou:
+            images = self._contrats.setdefault(contrat, {})
+            self._contrats.move_to_end(contrat)
+            images[nom] = (ecran, impression)
+            # Le contrat courant est toujours gardé, même s'il dépasse seul le quota
+            while len(self._contrats) > 1 and (len(self._contrats) > self.max_contrats or
+                                               (self.taille_max is not None and self.taille() > self.taille_max)):
+                self._contrats.popitem(last=False)
+        return ecran
+
+    def ecran(self, contrat, nom):
+        """PNG écran d'un graphique, ou None."""
+        image = self._contrats.get(contrat, {}).get(nom)
+        return image[0] if image else None
+
+    def impression(self, contrat, nom):
+        """PNG impression d'un graphique, ou None."""
+        image = self._contrats.get(contrat, {}).get(nom)
+        return image[1] if image else None
+
+    def impressions(self, contrat):
+        """PNG impression de tous les graphiques d'un contrat, par nom (pour `RapportContrat.graphiques`)."""
+        return {nom: image[1] for nom, image in self._contrats.get(contrat, {}).items()}
+
+    def supprimer(self, contrat=None):
+        """Oublie les graphiques d'un contrat, ou de tous les contrats."""
+        with self._verrou:
+            if contrat is None:
+                self._contrats.clear()
+            else:
+                self._contrats.pop(contrat, None)
+
+    def taille(self):
+        """Taille totale des images en mémoire (octets)."""
+        with self._verrou:
+            return sum(len(ecran) + (len(impression) if impression is not ecran else 0)
+                       for images in self._contrats.values() for ecran, impression in images.values())
+
+
+def graphique_effectifs(df_effectif_filtered):
+    """
+    Courbes d'évolution des effectifs (adhérents, conjoints, enfants, total) par mois.
+    """
+    fig, ax = nouvelle_figure(figsize=(10, 5))
+    colors = ['#279244', '#f77f00', '#ff6f61']
+    for i, col in enumerate(["ADHERENT", "CONJOINTS", "ENFANTS", "TOTAL"]):
+        if col in df_effectif_filtered.columns:
+            ax.plot(df_effectif_filtered["MOIS"], df_effectif_filtered[col], marker='o', label=col.title(), color=colors[i % len(colors)])
+    ax.set_title("Évolution des effectifs")
+    ax.set_xlabel("Mois")
+    ax.set_ylabel("Effectifs")
+    ax.legend()
+    ax.tick_params(axis='x', labelrotation=45)
+    return fig
+
+
+def graphique_beneficiaires(tableau_final):
+    """
+    Barres des montants couverts par type de bénéficiaire (hors ligne de total).
+    """
+    df_graph_benef = tableau_final[tableau_final.index != "Total général"]
+    fig, ax = nouvelle_figure(figsize=(10, 5))
+    colors = ['#279244', '#f77f00', '#2a9d8f']
+    ax.bar(df_graph_benef.index, df_graph_benef["Montant couvert"], color=colors)
+    ax.set_title("Montants couverts par bénéficiaire")
+    ax.set_xlabel("Type de bénéficiaire")
+    ax.set_ylabel("Montant (FCFA)")
+    ax.yaxis.set_major_formatter(format_milliers)
+    ax.tick_params(axis='x', labelrotation=45)
+    return fig
+
+
+def graphique_mensuel(df_mensuel_grouped):
+    """
+    Barres des montants couverts et des rejets par mois (hors ligne de total).
+    """
+    df_graph_mensuel = df_mensuel_grouped[df_mensuel_grouped["MOIS"] != "Total général"]
+    fig, ax = nouvelle_figure(figsize=(10, 5))
+    bar_width = 0.35
+    index = range(len(df_graph_mensuel["MOIS"]))
+    ax.bar([i - bar_width/2 for i in index], df_graph_mensuel["Montant Couvert"], bar_width, label="Montant Couvert", color='#279244')
+    if "Rejets" in df_graph_mensuel.columns:
+        ax.bar([i + bar_width/2 for i in index], df_graph_mensuel["Rejets"], bar_width, label="Rejets", color='#f77f00')
+    ax.set_title("Montants Couverts et Rejets par Mois")
+    ax.set_xlabel("Mois")
+    ax.set_ylabel("Montant (FCFA)")
+    ax.yaxis.set_major_formatter(format_milliers)
+    ax.set_xticks(index)
+    ax.set_xticklabels(df_graph_mensuel["MOIS"], rotation=45)
+    ax.legend()
+    return fig
+
+
+def graphique_specialites(tableau_spec):
+    """
+    Camembert de la répartition des montants couverts par spécialité, avec étiquettes reliées.
+    """
+    df_graph = tableau_spec[tableau_spec["Spécialité"] != "Total général"]
+    fig, ax = nouvelle_figure(figsize=(10, 6))
+    total_couvert = df_graph["Couvert"].sum()
+    
+    # Préparer les données pour le pie chart
+    colors = ['#06A77D', '#F58634', '#2a9d8f', '#ff6f61', '#264653', '#3498db', '#9b59b6', '#e74c3c', '#f1c40f', '#1abc9c']
+    # S'assurer qu'il y a assez de couleurs pour toutes les spécialités
+    while len(colors) < len(df_graph):
+        colors.extend(colors)
+    colors = colors[:len(df_graph)]
+    
+    # Ajuster les paramètres du pie chart pour ajouter les connexions
+    wedges, texts, autotexts = ax.pie(
+        df_graph["Couvert"], 
+        autopct='%1.1f%%', 
+        startangle=90, 
+        explode=[0.05] * len(df_graph), 
+        colors=colors, 
+        textprops={'fontsize': 0},  # Masquer les étiquettes par défaut
+        labeldistance=None,  # Supprimer les étiquettes par défaut
+        pctdistance=0.75,    # Positionner les pourcentages plus près du centre
+        wedgeprops={'edgecolor': 'white', 'linewidth': 1.5},  # Bordures blanches pour plus de clarté
+        shadow=False  # Désactiver l'ombre pour éviter l'effet de double cercle
+    )
+    
+    # Personnaliser le style des pourcentages
+    for autotext in autotexts:
+        autotext.set_color('white')
+        autotext.set_fontsize(9)
+        autotext.set_fontweight('bold')
+        
+    # Ajouter des annotations avec des lignes de connexion améliorées
+    bbox_props = dict(boxstyle="round,pad=0.3", fc="white", ec="gray", lw=1, alpha=0.9)
+    
+    # Créer une liste des positions et des étiquettes
+    labels_data = []
+    for i, (wedge, text_label) in enumerate(zip(wedges, [f"{spec}" for spec in df_graph["Spécialité"]])):
+        ang = (wedge.theta2 - wedge.theta1) / 2. + wedge.theta1
+        x = np.cos(np.deg2rad(ang))
+        y = np.sin(np.deg2rad(ang))
+        
+        # Ajuster la distance selon la longueur du texte
+        text_length = len(text_label)
+        if text_length > 15:  # Étiquettes longues comme "TRANSPORT PAR AMBULANCE"
+            distance = 1.5
+        elif text_length > 10:
+            distance = 1.4
+        else:
+            distance = 1.35
+        
+        # Calculer la position finale
+        final_x = distance * x
+        final_y = distance * y
+        
+        # Déterminer l'alignement horizontal
+        if x > 0.1:
+            ha = "left"
+        elif x < -0.1:
+            ha = "right"
+        else:
+            ha = "center"
+        
+        labels_data.append({
+            'text': text_label,
+            'xy': (x, y),
+            'xytext': (final_x, final_y),
+            'ha': ha,
+            'angle': ang
+        })
+    
+    # Appliquer les annotations avec les paramètres optimisés
+    for label_info in labels_data:
+        # Style de connexion adaptatif
+        kw_adaptive = dict(
+            arrowprops=dict(
+                arrowstyle="-", 
+                color="gray", 
+                linewidth=1.2,
+                connectionstyle="arc3,rad=0.1"
+            ),
+            bbox=bbox_props, 
+            zorder=10, 
+            va="center",
+            ha=label_info['ha'],
+            fontsize=9,
+            fontweight='normal'
+        )
+        
+        ax.annotate(
+            label_info['text'], 
+            xy=label_info['xy'], 
+            xytext=label_info['xytext'],
+            **kw_adaptive
+        )
+    
+    # Titre et style - augmenter l'espace avec le graphique
+    fig.subplots_adjust(top=0.85, bottom=0.1, left=0.1, right=0.9)  # Améliorer les marges
+    ax.set_title("Répartition par spécialité", fontsize=14, fontweight='bold', pad=40, y=1.1)
+    
+    # Ajuster les limites pour accueillir les étiquettes longues
+    ax.set_xlim(-2, 2)
+    ax.set_ylim(-2, 2)
+    
+    # Supprimer les cadres et les axes
+    ax.set_frame_on(False)
+    ax.axis('equal')  # Assurer un cercle parfait
+    return fig
@@ -0,0 +1,217 @@
+import contextvars
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from functools import wraps
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows : pas de pic RSS
+    resource = None
+
+# Mesures de l'exécution en cours (une par exécution du script Streamlit ou par traitement)
+_MESURES = contextvars.ContextVar("mesures", default=None)
+_VERROU_JOURNAL = threading.Lock()
+
+# tracemalloc est global au processus, que partagent les sessions Streamlit et les threads
+# de génération des PDF : il est démarré par la première exécution qui trace la mémoire et
+# arrêté par la dernière. `generation` change à chaque exécution qui commence à tracer.
+_VERROU_TRACE = threading.Lock()
+_TRACE = {"traceurs": 0, "proprietaire": False, "generation": 0}
+
+
+def _demarrer_trace():
+    with _VERROU_TRACE:
+        if _TRACE["traceurs"] == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _TRACE["proprietaire"] = True
+        _TRACE["traceurs"] += 1
+        _TRACE["generation"] += 1
+
+
+def _arreter_trace():
+    with _VERROU_TRACE:
+        _TRACE["traceurs"] -= 1
+        if _TRACE["traceurs"] == 0 and _TRACE["proprietaire"]:
+            tracemalloc.stop()
+            _TRACE["proprietaire"] = False
+
+
+def rss_max():
+    """Pic de mémoire résidente du processus (octets), None si indisponible."""
+    if resource is None:
+        return None
+    # ru_maxrss est en kilo-octets sous Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@dataclass
+class MesureEtape:
+    """
+    Mesure d'une étape : durée, pic d'allocation Python au-delà de la mémoire au début de
+    l'étape (tracemalloc, si activé), pic RSS du processus en fin d'étape et lignes traitées.
+    Une étape cumulée regroupe plusieurs appels (`appels`).
+
+    Le pic de tracemalloc étant commun au processus, il n'est utilisé que si l'exécution a
+    été la seule à tracer pendant toute l'étape ; sinon `memoire` est l'allocation nette du
+    processus pendant l'étape (mémoire tracée à la fin moins celle du début), approximative
+    quand d'autres sessions calculent en même temps.
+    """
+    etape: str
+    duree: float
+    memoire: int = None
+    rss_max: int = None
+    lignes: int = None
+    appels: int = 1
+
+
+class Mesures:
+    """
+    Journal des étapes d'une exécution (chargements, sections, graphiques, PDF).
+
+    Args:
+        journal (str, optional): Fichier où chaque étape est ajoutée en JSON lines.
+        tracer_memoire (bool): Mesurer les allocations Python par tracemalloc (ralentit le calcul).
+        contexte (dict, optional): Champs ajoutés à chaque ligne du journal (session, contrat...).
+    """
+
+    def __init__(self, journal=None, tracer_memoire=False, contexte=None):
+        self.journal = journal
+        self.tracer_memoire = tracer_memoire
+        self.contexte = dict(contexte or {})
+        self.etapes = []
+        self._cumuls = {}
+        self._pile = []
+        self._trace = False
+
+    @contextmanager
+    def active(self):
+        """Rend ces mesures courantes (voir `etape`) le temps du bloc."""
+        jeton = _MESURES.set(self)
+        demarre = self.tracer_memoire and not self._trace
+        if demarre:
+            _demarrer_trace()
+            self._trace = True
+        try:
+            yield self
+        finally:
+            if demarre:
+                self._trace = False
+                _arreter_trace()
+            _MESURES.reset(jeton)
+
+    @contextmanager
+    def etape(self, nom, lignes=None, cumuler=False):
+        """
+        Mesure le bloc comme une étape. Les étapes imbriquées sont mesurées séparément ; le pic
+        mémoire d'une étape englobe celui de ses sous-étapes. La mesure renvoyée permet de
+        renseigner `lignes` une fois le calcul fait.
+        """
+        mesure = MesureEtape(nom, 0.0, lignes=lignes)
+        cadre = None
+        if self._trace:
+            with _VERROU_TRACE:
+                courant, pic = tracemalloc.get_traced_memory()
+                # Le pic n'est remis à zéro que s'il n'appartient qu'à cette exécution
+                generation = _TRACE["generation"] if _TRACE["traceurs"] == 1 else None
+                if generation is not None:
+                    tracemalloc.reset_peak()
+            if self._pile:
+                self._pile[-1][1] = max(self._pile[-1][1], pic if generation is not None else courant)
+            cadre = [courant, courant, generation]
+            self._pile.append(cadre)
+        debut = time.perf_counter()
+        try:
+            yield mesure
+        finally:
+            mesure.duree = time.perf_counter() - debut
+            if cadre is not None:
+                with _VERROU_TRACE:
+                    courant, pic = tracemalloc.get_traced_memory()
+                    seule = cadre[2] is not None and cadre[2] == _TRACE["generation"] and _TRACE["traceurs"] == 1
+                pic = max(cadre[1], pic if seule else courant)
+                mesure.memoire = max(pic - cadre[0], 0)
+                self._pile.pop()
+                if self._pile:
+                    self._pile[-1][1] = max(self._pile[-1][1], pic)
+            mesure.rss_max = rss_max()
+            self.ajouter(mesure, cumuler)
+
+    def ajouter(self, mesure, cumuler=False):
+        """Enregistre une mesure ; une étape cumulée additionne ses appels sur une seule ligne."""
+        if cumuler and mesure.etape in self._cumuls:
+            cumul = self._cumuls[mesure.etape]
+            cumul.duree += mesure.duree
+            cumul.appels += 1
+            cumul.rss_max = mesure.rss_max
+            if mesure.lignes is not None:
+                cumul.lignes = (cumul.lignes or 0) + mesure.lignes
+            if mesure.memoire is not None:
+                cumul.memoire = max(cumul.memoire or 0, mesure.memoire)
+            return
+        if cumuler:
+            self._cumuls[mesure.etape] = mesure
+        self.etapes.append(mesure)
+        if self.journal and not cumuler:
+            self._journaliser(mesure)
+
+    def _journaliser(self, mesure):
+        ligne = {"horodatage": datetime.now().isoformat(timespec="milliseconds"), **self.contexte, **asdict(mesure)}
+        try:
+            with _VERROU_JOURNAL, open(self.journal, "a", encoding="utf-8") as f:
+                f.write(json.dumps(ligne, ensure_ascii=False, default=str) + "\n")
+        except OSError:
+            # Le journal est facultatif : une erreur d'écriture ne doit pas interrompre le rapport
+            pass
+
+    def terminer(self):
+        """Écrit dans le journal les étapes cumulées (une ligne chacune, en fin d'exécution)."""
+        if self.journal:
+            for mesure in self._cumuls.values():
+                self._journaliser(mesure)
+
+    def tableau(self):
+        """Étapes dans l'ordre de fin d'exécution, durées en millisecondes et mémoire en Mo."""
+        df = pd.DataFrame([asdict(mesure) for mesure in self.etapes],
+                          columns=["etape", "duree", "memoire", "rss_max", "lignes", "appels"])
+        return pd.DataFrame({
+            "Étape": df["etape"],
+            "Durée (ms)": df["duree"] * 1000,
+            "Mémoire Python (Mo)": pd.to_numeric(df["memoire"]) / 1024 ** 2,
+            "Pic RSS (Mo)": pd.to_numeric(df["rss_max"]) / 1024 ** 2,
+            "Lignes": pd.to_numeric(df["lignes"]).astype("Int64"),
+            "Appels": df["appels"],
+        })
+
+
+def mesures_courantes():
+    """Mesures de l'exécution en cours, ou None."""
+    return _MESURES.get()
+
+
+def etape(nom, lignes=None, cumuler=False):
+    """
+    Mesure un bloc dans les mesures courantes ; sans mesures actives, ne fait rien.
+
+        with etape("Section IV", lignes=len(df_filtre)):
+            ...
+    """
+    mesures = _MESURES.get()
+    return nullcontext(MesureEtape(nom, 0.0, lignes=lignes)) if mesures is None else mesures.etape(nom, lignes, cumuler)
+
+
+def mesurer(nom, cumuler=False):
+    """Décorateur : mesure chaque appel de la fonction comme l'étape `nom`."""
+    def decorateur(fonction):
+        @wraps(fonction)
+        def enveloppe(*args, **kwargs):
+            with etape(nom, cumuler=cumuler):
+                return fonction(*args, **kwargs)
+        return enveloppe
+    return decorateur
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+from agregation import codes_groupes, comptes_groupes, sommes_groupes, valeurs_numeriques
+from schema import resoudre_schema
+
+TAILLES_PAGE = [25, 50, 100, 250]
+
+
+def _patients_distincts(codes, nb_groupes, cartes):
+    """Nombre de cartes distinctes par groupe."""
+    codes_cartes, uniques = pd.factorize(cartes)
+    valides = (codes >= 0) & (codes_cartes >= 0)
+    paires = np.unique(codes[valides].astype(np.int64) * len(uniques) + codes_cartes[valides])
+    return np.bincount(paires // max(len(uniques), 1), minlength=nb_groupes)
+
+
+def _specialite_principale(codes, nb_groupes, specialites, couvert):
+    """Spécialité au plus fort montant couvert de chaque groupe (None si aucune)."""
+    resultat = np.full(nb_groupes, None, dtype=object)
+    codes_specialites, uniques = pd.factorize(specialites)
+    valides = (codes >= 0) & (codes_specialites >= 0)
+    if not valides.any():
+        return resultat
+    paires, inverse = np.unique(codes[valides].astype(np.int64) * len(uniques) + codes_specialites[valides],
+                                return_inverse=True)
+    montants = np.bincount(inverse, weights=np.nan_to_num(couvert[valides]))
+    groupes = paires // len(uniques)
+    # Par groupe, la paire au plus fort montant vient en premier
+    ordre = np.lexsort((-montants, groupes))
+    premieres = ordre[np.r_[True, groupes[ordre][1:] != groupes[ordre][:-1]]]
+    resultat[groupes[premieres]] = np.asarray(uniques, dtype=object)[paires[premieres] % len(uniques)]
+    return resultat
+
+
+def calculer_portefeuille(df_detail, production=None, effectif=None, schema=None):
+    """
+    Indicateurs de tous les contrats (assureur, client, police) de DETAIL, calculés en une passe
+    sur les codes de groupe du contrat, puis rapprochés de PRODUCTION sur (Assureur,
+    client_police_key) et d'EFFECTIF sur (ASSUREUR, CLIENT).
+
+    Args:
+        df_detail (pd.DataFrame): DETAIL normalisé (`lire_detail`).
+        production (TableIndexee, optional): PRODUCTION chargé (`charger_production`).
+        effectif (TableIndexee, optional): EFFECTIF chargé (`charger_effectif`).
+        schema (SchemaDetail, optional): Colonnes résolues de DETAIL (`DonneesDetail.schema`).
+
+    Returns:
+        pd.DataFrame: Une ligne par contrat, valeurs numériques, triée par S/P décroissant.
+    """
+    schema = schema or resoudre_schema(df_detail.columns)
+    codes, (assureurs, clients, polices) = codes_groupes(
+        [schema.colonne(df_detail, "assureur"), schema.colonne(df_detail, "client"), schema.colonne(df_detail, "police")]
+    )
+    nb_contrats = len(assureurs)
+    couvert = valeurs_numeriques(schema.colonne(df_detail, "couvert"))
+    portefeuille = pd.DataFrame({
+        "Assureur": assureurs,
+        "Client": clients,
+        "Police": polices,
+        "Nombre de Sinistres": comptes_groupes(codes, nb_contrats),
+        "Sinistres": sommes_groupes(codes, nb_contrats, couvert),
+        "Patients": _patients_distincts(codes, nb_contrats, schema.colonne(df_detail, "carte")),
+        "Spécialité principale": _specialite_principale(codes, nb_contrats, schema.colonne(df_detail, "specialite"), couvert),
+    })
+
+    primes = np.full(nb_contrats, np.nan)
+    if production is not None:
+        primes_production = (production.df.drop_duplicates(["Assureur", "client_police_key"])
+                             .set_index(["Assureur", "client_police_key"])["Primes Acquises"])
+        cles = pd.MultiIndex.from_arrays([assureurs, pd.Series(clients, dtype=object) + " | " + pd.Series(polices, dtype=object)])
+        primes = pd.to_numeric(primes_production.reindex(cles), errors="coerce").to_numpy(dtype=float)
+    portefeuille["Primes Acquises"] = primes
+    # Même règle qu'en section I : S/P nul sans prime acquise positive
+    with np.errstate(divide="ignore", invalid="ignore"):
+        portefeuille["S/P"] = np.where(primes > 0, portefeuille["Sinistres"] / primes, 0.0)
+
+    effectifs = np.full(nb_contrats, np.nan)
+    if effectif is not None:
+        effectifs_clients = (effectif.df.groupby(["ASSUREUR", "CLIENT"])[["ADHERENT", "CONJOINTS", "ENFANTS"]]
+                             .max().fillna(0).sum(axis=1))
+        effectifs = effectifs_clients.reindex(pd.MultiIndex.from_arrays([assureurs, clients])).to_numpy(dtype=float)
+    portefeuille["Effectif Total"] = effectifs
+    with np.errstate(divide="ignore", invalid="ignore"):
+        portefeuille["Taux d'utilisation"] = np.where(effectifs > 0, portefeuille["Patients"] / effectifs, np.nan)
+
+    portefeuille = portefeuille[["Assureur", "Client", "Police", "Primes Acquises", "Sinistres", "S/P",
+                                 "Nombre de Sinistres", "Patients", "Effectif Total", "Taux d'utilisation",
+                                 "Spécialité principale"]]
+    return portefeuille.sort_values("S/P", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def ajouter_tranches_clause(portefeuille, clause):
+    """
+    Ajoute au portefeuille la tranche de la clause de chaque contrat et la marge de S/P avant
+    la tranche suivante, pour repérer les contrats proches d'un changement de tranche.
+    """
+    if clause is None or len(clause.positions) == 0:
+        return portefeuille
+    portefeuille = portefeuille.copy()
+    ratios = portefeuille["S/P"].to_numpy(dtype=float)
+    positions = clause.tranches(ratios)
+    trouvees = positions >= 0
+    # Rang de la tranche parmi les tranches exploitables (positions triées)
+    rangs = np.where(trouvees, np.searchsorted(clause.positions, positions), 0)
+    libelles = [f"{minimum:.0f}% - {maximum:.0f}%" for minimum, maximum in zip(clause.bornes_min[rangs], clause.bornes_max[rangs])]
+    portefeuille["Tranche S/P"] = np.where(trouvees, libelles, "")
+    # Plus petite borne min strictement supérieure au S/P (arrondi) du contrat
+    bornes = np.unique(clause.bornes_min)
+    suivantes = np.searchsorted(bornes, np.round(ratios * 100), side="right")
+    prochaines = np.where(suivantes < len(bornes), bornes[np.minimum(suivantes, len(bornes) - 1)] / 100, np.nan)
+    portefeuille["Prochaine tranche"] = prochaines
+    portefeuille["Marge avant tranche"] = prochaines - ratios
+    return portefeuille
+
+
+def nombre_pages(nb_lignes, taille_page):
+    """Nombre de pages d'un tableau de `nb_lignes` lignes (au moins une)."""
+    return max(1, -(-nb_lignes // taille_page))
+
+
+def page_tableau(df, page, taille_page):
+    """Lignes de la page `page` (numérotée à partir de 1)."""
+    debut = (page - 1) * taille_page
+    return df.iloc[debut:debut + taille_page]
@@ -0,0 +1,452 @@
+import hashlib
+import os
+import struct
+from datetime import datetime
+from io import BytesIO
+
+import numpy as np
+from fpdf import FPDF
+from PIL import Image
+
+from formatage import formater_tableau
+from mesures import etape
+from sections import (
+    ETAPE_COUVERTURE, ETAPE_FINALISATION, ETAPE_SOMMAIRE, TITRE_BENEFICIAIRES, TITRE_CLAUSE, TITRE_EFFECTIFS,
+    TITRE_FAMILLES, TITRE_MENSUEL, TITRE_PRESTATAIRES, TITRE_SINISTRALITE, TITRE_SPECIALITES, _ignorer,
+)
+from texte import clean_text
+
+ADRESSE_ANKARA = ("Ankara Services, Abidjan – Plateau, Avenue Noguès Immeuble Borija, Tel :+225 25 20 01 31 05/06\n"
+                  "Société Anonyme avec Conseil d'Administration au Capital de 10.000.000 FCFA - 01 BP 1194 ABJ 01\n"
+                  "RCCM CI- ABJ-03-2021-B14-00020-NCC 2110076 V-Banque : STANBIC CI198 01001 918000005921 84\n"
+                  "www.ankaraservives.com")
+
+
+# Tables de largeurs des caractères Latin-1 par police, construites une fois par processus
+_LARGEURS_POLICES = {}
+
+
+def largeurs_caracteres(pdf):
+    """
+    Table NumPy des largeurs (en millièmes de taille de police) des 256 caractères Latin-1
+    de la police courante ; l'indice 256 (caractères hors Latin-1) vaut 0 comme dans FPDF.
+    """
+    cle = pdf.current_font['name']
+    table = _LARGEURS_POLICES.get(cle)
+    if table is None:
+        cw = pdf.current_font['cw']
+        table = np.array([cw.get(chr(i), 0) for i in range(256)] + [0], dtype=np.int64)
+        _LARGEURS_POLICES[cle] = table
+    return table
+
+
+def largeurs_textes(pdf, textes):
+    """
+    Équivalent vectorisé de `pdf.get_string_width` pour une liste de chaînes : tous les
+    caractères sont convertis en codes en une fois puis sommés par chaîne.
+    """
+    longueurs = np.fromiter(map(len, textes), dtype=np.int64, count=len(textes))
+    sommes = np.zeros(len(textes), dtype=np.int64)
+    if longueurs.sum() > 0:
+        codes = np.frombuffer("".join(textes).encode("utf-32-le"), dtype=np.uint32)
+        largeurs = largeurs_caracteres(pdf)[np.minimum(codes, 256)]
+        debuts = np.concatenate(([0], np.cumsum(longueurs)[:-1]))
+        non_vides = longueurs > 0
+        sommes[non_vides] = np.add.reduceat(largeurs, debuts[non_vides])
+    return sommes * pdf.font_size / 1000.0
+
+
+def nombre_lignes(pdf, textes, largeurs_colonnes):
+    """
+    Nombre de lignes occupées par chaque texte dans une cellule de largeur donnée
+    (scalaire ou une largeur par texte), selon la même règle que le rendu des tableaux.
+    """
+    sauts = np.fromiter((texte.count('\n') for texte in textes), dtype=np.int64, count=len(textes))
+    debordements = (largeurs_textes(pdf, textes) / (np.asarray(largeurs_colonnes, dtype=float) - 2)).astype(np.int64)
+    return np.maximum(1, sauts + 1 + debordements)
+
+
+def hauteurs_lignes(pdf, df_display, col_widths):
+    """
+    Nombre de lignes de texte de chaque ligne du tableau (maximum sur ses cellules),
+    calculé colonne par colonne avec la police courante.
+    """
+    max_lines = np.ones(len(df_display), dtype=np.int64)
+    for j in range(len(df_display.columns)):
+        textes = [str(item) for item in df_display.iloc[:, j].tolist()]
+        max_lines = np.maximum(max_lines, nombre_lignes(pdf, textes, col_widths[j]))
+    return max_lines
+
+
+def info_image(donnees):
+    """
+    Décrit une image en mémoire au format attendu par FPDF (`FPDF.images`).
+
+    Les PNG RVB ou en niveaux de gris 8 bits sont repris tels quels (flux IDAT) ; les autres
+    images (JPEG, palette, transparence...) sont d'abord aplaties sur fond blanc en PNG RVB.
+    """
+    image = Image.open(BytesIO(donnees))
+    if image.format != 'PNG' or image.mode not in ('RGB', 'L') or image.info.get('interlace'):
+        image = image.convert('RGBA')
+        fond = Image.new('RGB', image.size, (255, 255, 255))
+        fond.paste(image, mask=image.getchannel('A'))
+        tampon = BytesIO()
+        fond.save(tampon, format='PNG')
+        donnees = tampon.getvalue()
+    largeur, hauteur, bpc, type_couleur = struct.unpack('>IIBB', donnees[16:26])
+    couleurs = 3 if type_couleur == 2 else 1
+    flux = []
+    pos = 8
+    while pos < len(donnees):
+        longueur, = struct.unpack('>I', donnees[pos:pos + 4])
+        type_bloc = donnees[pos + 4:pos + 8]
+        if type_bloc == b'IDAT':
+            flux.append(donnees[pos + 8:pos + 8 + longueur])
+        elif type_bloc == b'IEND':
+            break
+        pos += 12 + longueur
+    return {
+        'w': largeur, 'h': hauteur, 'cs': 'DeviceRGB' if couleurs == 3 else 'DeviceGray', 'bpc': bpc,
+        'f': 'FlateDecode', 'dp': f'/Predictor 15 /Colors {couleurs} /BitsPerComponent {bpc} /Columns {largeur}',
+        'pal': '', 'trns': '', 'data': b''.join(flux),
+    }
+
+
+class PDFWithPageNumbers(FPDF):
+    """
+    PDF du rapport : pages de garde et sommaire sans en-tête ni pied de page,
+    puis logo Ankara en en-tête et pagination en pied de page.
+
+    Le nombre total de pages (hors couverture et sommaire) est écrit sous forme d'alias
+    dans les pieds de page et remplacé à la finalisation du document, ce qui évite un
+    premier rendu complet destiné uniquement à compter les pages.
+    """
+
+    ALIAS_TOTAL_PAGES = "{ns}"
+
+    def __init__(self, logo_ankara=None, titre_pied_de_page=""):
+        super().__init__()
+        self.logo_ankara = logo_ankara
+        self.titre_pied_de_page = titre_pied_de_page
+
+    def placer_image(self, source, x=None, y=None, w=0, h=0):
+        """
+        Place une image donnée par son chemin ou par son contenu (bytes, sans fichier temporaire).
+
+        Returns:
+            bool: False si la source est vide ou introuvable (rien n'est placé).
+        """
+        if isinstance(source, bytes):
+            nom = "memoire:" + hashlib.sha1(source).hexdigest()
+            if nom not in self.images:
+                info = info_image(source)
+                info['i'] = len(self.images) + 1
+                self.images[nom] = info
+            self.image(nom, x=x, y=y, w=w, h=h)
+            return True
+        if source and os.path.exists(source):
+            self.image(source, x=x, y=y, w=w, h=h)
+            return True
+        return False
+
+    def header(self):
+        if self.page_no() > 2:
+            self.placer_image(self.logo_ankara, x=10, y=10, w=30)
+            self.ln(10)
+
+    def footer(self):
+        if self.page_no() > 2:
+            self.set_y(-15)
+            self.set_fill_color(39, 146, 68)
+            self.rect(0, self.h - 15, self.w, 10, 'F')
+            self.set_font("Arial", "I", 8)  # Augmenté de 7 à 8
+            self.set_text_color(255, 255, 255)
+            page_text = f"Statistiques {self.titre_pied_de_page} - Page {self.page_no() - 2} / {self.ALIAS_TOTAL_PAGES}"
+            self.cell(0, 10, page_text, align="C")
+
+    def _putpages(self):
+        total_pages = str(self.page - 2)
+        for n in range(1, self.page + 1):
+            self.pages[n] = self.pages[n].replace(self.ALIAS_TOTAL_PAGES, total_pages)
+        super()._putpages()
+
+
+def add_table_section(pdf, title, df, is_prestataires=False, is_familles=False, highlight_row=None, new_page=True):
+    if new_page:
+        pdf.add_page()
+    section_page = pdf.page_no() - 2
+    pdf.set_font("Arial", 'B', 13)
+    pdf.set_text_color(0, 0, 0)
+    pdf.cell(0, 10, clean_text(title), ln=True)
+    pdf.ln(5)
+    pdf.set_font("Arial", '', 8)  # Augmenté de 7 à 8
+    pdf.set_text_color(0, 0, 0)
+    page_width = float(pdf.w - 2 * pdf.l_margin)
+    line_height = 5.0
+    
+    # Définir les largeurs des colonnes selon la section
+    if title == "Section I - Sinistralité":
+        # Largeur augmentée pour la colonne "Client" (index 3)
+        col_widths = [25.0, 25.0, 30.0, 60.0, 20.0, 20.0, 20.0, 20.0]
+    elif is_prestataires:
+        col_widths = [15.0, 50.0, 20.0, 25.0, 20.0, 30.0, 30.0]
+    elif is_familles:
+        col_widths = [15.0, 30.0, 50.0, 30.0, 30.0, 30.0]
+    else:
+        num_cols = len(df.columns)
+        col_widths = [page_width / num_cols] * num_cols
+    
+    total_width = sum(col_widths)
+    if total_width > page_width:
+        scale_factor = page_width / total_width
+        col_widths = [w * scale_factor for w in col_widths]
+    
+    df_display = clean_text(formater_tableau(df))
+    max_header_lines = max(1, int(nombre_lignes(pdf, [str(col).upper() for col in df_display.columns], col_widths).max()))
+    
+    header_height = line_height * float(max_header_lines) + 2
+    header_text_y_offset = (header_height - line_height * float(max_header_lines)) / 2
+    
+    max_lines_per_row = hauteurs_lignes(pdf, df_display, col_widths)
+    
+    pdf.set_fill_color(39, 146, 68)
+    pdf.set_text_color(255, 255, 255)
+    pdf.set_font("Arial", 'B', 7)
+    x_start = float(pdf.l_margin)
+    y_start = float(pdf.get_y())
+    
+    for i, col in enumerate(df_display.columns):
+        pdf.set_xy(x_start, y_start)
+        pdf.cell(col_widths[i], header_height, '', border=0, fill=True)
+        pdf.set_xy(x_start, y_start + header_text_y_offset)
+        pdf.multi_cell(col_widths[i], line_height, clean_text(str(col).upper()), border=0, align='C')
+        x_start += col_widths[i]
+    
+    pdf.set_y(y_start + header_height)
+    table_width = float(sum(col_widths))
+    pdf.set_draw_color(0, 0, 0)
+    pdf.set_line_width(0.2)
+    pdf.line(pdf.l_margin, y_start, pdf.l_margin + table_width, y_start)
+    pdf.set_text_color(0, 0, 0)
+    pdf.set_font("Arial", '', 7)
+    table_y_start = float(pdf.get_y())
+    page_height = float(pdf.h)
+    bottom_margin = float(pdf.b_margin)
+    
+    for i, row in enumerate(df_display.itertuples(index=False, name=None)):
+        row_height = line_height * float(max_lines_per_row[i])
+        current_y = float(pdf.get_y())
+        if current_y + row_height > page_height - bottom_margin - 15:
+            y_end = page_height - bottom_margin - 15
+            pdf.line(pdf.l_margin, table_y_start, pdf.l_margin, y_end)
+            pdf.line(pdf.l_margin + table_width, table_y_start, pdf.l_margin + table_width, y_end)
+            pdf.add_page()
+            table_y_start = float(pdf.get_y())
+            pdf.set_fill_color(39, 146, 68)
+            pdf.set_text_color(255, 255, 255)
+            pdf.set_font("Arial", 'B', 7)
+            x_start = float(pdf.l_margin)
+            for j, col in enumerate(df_display.columns):
+                pdf.set_xy(x_start, table_y_start)
+                pdf.cell(col_widths[j], header_height, '', border=0, fill=True)
+                pdf.set_xy(x_start, table_y_start + header_text_y_offset)
+                pdf.multi_cell(col_widths[j], line_height, clean_text(str(col).upper()), border=0, align='C')
+                x_start += col_widths[j]
+            pdf.set_y(table_y_start + header_height)
+            pdf.set_draw_color(0, 0, 0)
+            pdf.set_line_width(0.2)
+            pdf.line(pdf.l_margin, table_y_start, pdf.l_margin + table_width, table_y_start)
+            pdf.set_text_color(0, 0, 0)
+            pdf.set_font("Arial", '', 6.5)
+        
+        if highlight_row is not None and i == highlight_row:
+            pdf.set_fill_color(247, 127, 0)
+        else:
+            if i % 2 == 0:
+                pdf.set_fill_color(255, 255, 255)
+            else:
+                pdf.set_fill_color(220, 220, 220)
+        
+        pdf.set_draw_color(0, 0, 0)
+        pdf.set_line_width(0.1)
+        x_start = float(pdf.l_margin)
+        y_start = float(pdf.get_y())
+        for j, item in enumerate(row):
+            pdf.set_xy(x_start, y_start)
+            pdf.cell(col_widths[j], row_height, '', border='T' if i == 0 else 'TB', fill=True)
+            pdf.set_xy(x_start, y_start)
+            pdf.multi_cell(col_widths[j], line_height, str(item), border=0, align='C')
+            x_start += col_widths[j]
+        pdf.set_y(y_start + row_height)
+    
+    table_y_end = float(pdf.get_y())
+    pdf.set_draw_color(0, 0, 0)
+    pdf.set_line_width(0.2)
+    pdf.line(pdf.l_margin, table_y_start, pdf.l_margin, table_y_end)
+    pdf.line(pdf.l_margin + table_width, table_y_start, pdf.l_margin + table_width, table_y_end)
+    pdf.line(pdf.l_margin, table_y_end, pdf.l_margin + table_width, table_y_end)
+    pdf.ln(5)
+    return section_page
+
+
+def _ajouter_image(pdf, image):
+    if pdf.placer_image(image, x=10, w=180):
+        pdf.ln(5)
+
+
+def ajouter_sections(pdf, rapport, progression=_ignorer):
+    """
+    Ajoute au PDF les sections I à VII disponibles dans le rapport, en signalant le début
+    de chacune à `progression` (titre de la section).
+
+    Returns:
+        dict: Numéro de page (hors couverture et sommaire) de chaque section ajoutée, par titre.
+    """
+    pages = {}
+    graphiques = rapport.graphiques
+    if rapport.df_sin is not None:
+        progression(TITRE_SINISTRALITE)
+        pages[TITRE_SINISTRALITE] = add_table_section(pdf, TITRE_SINISTRALITE, rapport.df_sin)
+        if rapport.df_clause is not None:
+            pages[TITRE_CLAUSE] = add_table_section(pdf, TITRE_CLAUSE, rapport.df_clause, highlight_row=rapport.highlight_row, new_page=False)
+    if rapport.df_effectif_display is not None:
+        progression(TITRE_EFFECTIFS)
+        pages[TITRE_EFFECTIFS] = add_table_section(pdf, TITRE_EFFECTIFS, rapport.df_effectif_display)
+        _ajouter_image(pdf, graphiques.get("effectifs"))
+    if rapport.tableau_final is not None:
+        progression(TITRE_BENEFICIAIRES)
+        pages[TITRE_BENEFICIAIRES] = add_table_section(pdf, TITRE_BENEFICIAIRES, rapport.tableau_final.reset_index().rename(columns={"index": "Type de bénéficiaire"}))
+        _ajouter_image(pdf, graphiques.get("beneficiaires"))
+    if rapport.df_mensuel_grouped is not None:
+        progression(TITRE_MENSUEL)
+        pages[TITRE_MENSUEL] = add_table_section(pdf, TITRE_MENSUEL, rapport.df_mensuel_grouped)
+        _ajouter_image(pdf, graphiques.get("mensuel"))
+    if rapport.tableau_spec is not None:
+        progression(TITRE_SPECIALITES)
+        pages[TITRE_SPECIALITES] = add_table_section(pdf, TITRE_SPECIALITES, rapport.tableau_spec)
+        _ajouter_image(pdf, graphiques.get("specialites"))
+    if rapport.df_prestataires is not None:
+        progression(TITRE_PRESTATAIRES)
+        pages[TITRE_PRESTATAIRES] = add_table_section(pdf, TITRE_PRESTATAIRES, rapport.df_prestataires, is_prestataires=True)
+    if rapport.df_familles is not None:
+        progression(TITRE_FAMILLES)
+        pages[TITRE_FAMILLES] = add_table_section(pdf, TITRE_FAMILLES, rapport.df_familles, is_familles=True)
+    return pages
+
+
+def ajouter_couverture(pdf, rapport, logo_ankara=None, logo_assureur=None):
+    """
+    Page de garde : logos, titre et encadré assureur / client / période / date d'édition.
+    """
+    pdf.add_page()
+    if pdf.placer_image(logo_ankara, x=(pdf.w - 80) / 2, y=20, w=80):
+        pdf.ln(90)
+    pdf.set_font("Arial", 'B', 24)
+    pdf.set_text_color(39, 146, 68)
+    pdf.cell(0, 20, clean_text("STATISTIQUES DE GESTION SANTE"), ln=True, align="C")
+    pdf.ln(20)
+    info_box_width, info_box_height = 140, 50
+    info_box_x, info_box_y = (pdf.w - info_box_width) / 2, float(pdf.get_y())
+    pdf.set_fill_color(245, 245, 245)
+    pdf.rect(info_box_x, info_box_y, info_box_width, info_box_height, 'F')
+    pdf.set_draw_color(54, 69, 79)
+    pdf.set_line_width(0.3)
+    pdf.rect(info_box_x, info_box_y, info_box_width, info_box_height)
+    line_height = 10
+    total_text_height = 4 * line_height
+    start_y = info_box_y + (info_box_height - total_text_height) / 2
+    label_width = 40
+    value_width = info_box_width - label_width - 15
+    pdf.set_font("Arial", '', 12)
+    pdf.set_text_color(54, 69, 79)
+
+    lignes = [
+        ("Assureur : ", rapport.assureur_short),
+        ("Client : ", rapport.client_short),
+        ("Période : ", rapport.periode),
+        ("Date d'édition : ", datetime.now().strftime("%d/%m/%Y")),
+    ]
+    for i, (label, valeur) in enumerate(lignes):
+        pdf.set_xy(info_box_x + 10, start_y + i * line_height)
+        pdf.set_font("Arial", 'B', 12)
+        pdf.cell(label_width, line_height, clean_text(label), align='L')
+        pdf.set_font("Arial", '', 12)
+        pdf.set_x(info_box_x + 10 + label_width)
+        pdf.multi_cell(value_width, line_height, clean_text(valeur), align='L')
+
+    pdf.set_y(info_box_y + info_box_height + 10)
+    if pdf.placer_image(logo_assureur, x=(pdf.w - 50) / 2, y=float(pdf.get_y()), w=50):
+        pdf.ln(60)
+    pdf.set_font("Arial", 'I', 10)
+    pdf.set_text_color(54, 69, 79)
+    pdf.multi_cell(0, 5, clean_text(ADRESSE_ANKARA), align="C")
+
+
+def ajouter_sommaire(pdf, pages, page_sommaire=2):
+    """
+    Écrit le sommaire, listant chaque section ajoutée avec son numéro de page, sur la page
+    `page_sommaire` réservée avant le rendu des sections. Le document est ainsi mis en page
+    une seule fois et les numéros du sommaire proviennent de cette même mise en page.
+    """
+    derniere_page = pdf.page
+    x, y = pdf.get_x(), pdf.get_y()
+    pdf.page = page_sommaire
+    # Forcer la réémission de la police dans le flux de la page du sommaire
+    pdf.font_family = ""
+    pdf.set_xy(pdf.l_margin, pdf.t_margin)
+    pdf.set_font("Arial", 'B', 16)
+    pdf.set_text_color(39, 146, 68)
+    pdf.cell(0, 10, clean_text("SOMMAIRE"), ln=True, align="C")
+    pdf.ln(10)
+    pdf.set_font("Arial", '', 12)
+    pdf.set_text_color(54, 69, 79)
+    right_align_x = pdf.w - pdf.r_margin - 20
+    left_shift = pdf.l_margin + 20
+    for title, page in pages.items():
+        dots = "." * int((right_align_x - pdf.get_string_width(clean_text(title)) - pdf.get_string_width(f"Page {page}") - left_shift - 10) / pdf.get_string_width("."))
+        pdf.set_x(left_shift)
+        pdf.cell(0, 8, f"{clean_text(title)}{dots}Page {page}", ln=True, align="L")
+        pdf.ln(8)
+    pdf.page = derniere_page
+    pdf.font_family = ""
+    pdf.set_xy(x, y)
+
+
+def generer_pdf(rapport, logo_ankara=None, logo_assureur=None, progression=_ignorer):
+    """
+    Génère le PDF complet d'un rapport (couverture, sommaire, sections I à VII) en une seule passe.
+
+    Args:
+        rapport (RapportContrat): Tableaux et graphiques (PNG en bytes ou chemins) du contrat.
+        logo_ankara (bytes | str, optional): Logo Ankara (couverture et en-têtes), contenu ou chemin.
+        logo_assureur (bytes | str, optional): Logo de l'assureur (couverture), contenu ou chemin.
+        progression (callable): Reçoit chaque étape (`sections.ETAPES_PDF`) au moment où elle commence.
+
+    Returns:
+        bytes: Contenu du PDF.
+    """
+    pdf = PDFWithPageNumbers(
+        logo_ankara=logo_ankara,
+        titre_pied_de_page=f"{clean_text(rapport.nom_assureur)}_{clean_text(rapport.client_short)}",
+    )
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.alias_nb_pages()
+    progression(ETAPE_COUVERTURE)
+    with etape("PDF couverture"):
+        ajouter_couverture(pdf, rapport, logo_ankara, logo_assureur)
+    # Page du sommaire, complétée une fois les numéros de page des sections connus
+    pdf.add_page()
+    page_sommaire = pdf.page_no()
+    with etape("PDF sections"):
+        pages = ajouter_sections(pdf, rapport, progression)
+    progression(ETAPE_SOMMAIRE)
+    with etape("PDF sommaire"):
+        ajouter_sommaire(pdf, pages, page_sommaire)
+    progression(ETAPE_FINALISATION)
+    with etape("PDF sortie"):
+        return pdf.output(dest='S').encode('latin1')
+
+
+def nom_fichier_pdf(rapport):
+    """Nom du fichier PDF proposé au téléchargement."""
+    return f"{clean_text(rapport.nom_assureur)}_{clean_text(rapport.client_short)}_rapport_sante.pdf"
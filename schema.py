@@ -0,0 +1,190 @@
+import unicodedata
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+
+import pandas as pd
+
+# Similarité minimale entre un en-tête et un alias pour une correspondance approchée
+SEUIL_APPROCHE = 0.85
+
+
+@dataclass(frozen=True)
+class ChampDetail:
+    """
+    Champ logique de DETAIL : en-têtes acceptés, mots que l'en-tête doit (ou ne doit pas)
+    contenir, et position historique de la colonne, utilisée en dernier recours.
+    """
+    nom: str
+    libelle: str
+    position: int
+    alias: tuple = ()
+    mots: tuple = ()
+    exclus: tuple = ()
+    requis: bool = True
+    categorie: bool = False
+    normaliser: bool = False
+
+
+CHAMPS_DETAIL = (
+    ChampDetail("date", "DATE SOINS", 1, ("DATE SOINS", "DATE DES SOINS", "DATE DE SOINS", "DATE SINISTRE", "DATE")),
+    ChampDetail("client", "CLIENT", 5, ("CLIENT", "NOM CLIENT", "SOUSCRIPTEUR"), categorie=True, normaliser=True),
+    ChampDetail("police", "POLICE", 6, ("POLICE", "N° POLICE", "NUMERO POLICE", "ID POLICE ANKARA", "N° POLICE ANKARA"),
+                categorie=True),
+    ChampDetail("carte", "N°CARTE", 9, ("N°CARTE", "N° CARTE", "NUMERO CARTE", "CARTE", "MATRICULE")),
+    ChampDetail("filiation", "FILIATION", 10, ("FILIATION", "LIEN DE PARENTE", "LIEN"), categorie=True),
+    ChampDetail("assure_principal", "ASSURÉ PRINCIPAL", 11, ("ASSURÉ PRINCIPAL", "NOM ASSURÉ PRINCIPAL"),
+                mots=("ASSURE", "PRINCIPAL"), exclus=("CARTE",)),
+    # Repli historique de la section VII sur la carte du patient (position 9)
+    ChampDetail("carte_assure_principal", "N°CARTE ASSURÉ PRINCIPAL", 9,
+                ("N°CARTE ASSURÉ PRINCIPAL", "N° CARTE ASSURÉ PRINCIPAL"), mots=("CARTE", "ASSURE", "PRINCIPAL")),
+    ChampDetail("prestataire", "PRESTATAIRE", 13, ("PRESTATAIRE", "NOM PRESTATAIRE", "ETABLISSEMENT"), categorie=True),
+    ChampDetail("ville", "VILLE", 14, ("VILLE",), categorie=True),
+    ChampDetail("commune", "COMMUNE", 15, ("COMMUNE",), categorie=True),
+    ChampDetail("specialite", "SPECIALITE", 17, ("SPECIALITE", "SPÉCIALITÉ", "ACTE", "NATURE ACTE"), categorie=True),
+    ChampDetail("frais", "FRAIS REELS", 20, ("FRAIS REELS", "FRAIS RÉELS", "MONTANT FRAIS REELS")),
+    ChampDetail("couvert", "MONTANT COUVERT", 22, ("MONTANT COUVERT", "COUVERT", "MONTANT PRIS EN CHARGE")),
+    ChampDetail("rejets", "REJETS", 24, ("REJETS", "REJET", "MONTANT REJETE"), requis=False),
+    ChampDetail("assureur", "ASSUREUR", 27, ("ASSUREUR", "COMPAGNIE", "NOM ASSUREUR"), categorie=True, normaliser=True),
+)
+
+# Méthodes de résolution, de la plus sûre à la moins sûre
+METHODE_NOM = "nom"
+METHODE_APPROCHEE = "approchée"
+METHODE_POSITION = "position"
+METHODE_ABSENTE = "absente"
+
+
+def normaliser_entete(nom):
+    """En-tête sans accents, en majuscules, espaces superflus supprimés."""
+    texte = unicodedata.normalize("NFKD", str(nom)).encode("ascii", "ignore").decode("ascii")
+    return " ".join(texte.upper().split())
+
+
+def _compact(nom):
+    """En-tête normalisé réduit à ses lettres et chiffres ("N°CARTE" et "N° CARTE" sont égaux)."""
+    return "".join(c for c in normaliser_entete(nom) if c.isalnum())
+
+
+def _correspond(champ, entete):
+    """L'en-tête désigne-t-il le champ (alias exact ou mots requis) ?"""
+    if _compact(entete) in {_compact(alias) for alias in champ.alias}:
+        return True
+    texte = normaliser_entete(entete)
+    return bool(champ.mots) and all(mot in texte for mot in champ.mots) and not any(mot in texte for mot in champ.exclus)
+
+
+def _similarite(champ, entete):
+    """Plus forte similarité entre l'en-tête et les alias du champ."""
+    compact = _compact(entete)
+    return max((SequenceMatcher(None, compact, _compact(alias)).ratio() for alias in champ.alias), default=0.0)
+
+
+@dataclass
+class SchemaDetail:
+    """
+    Correspondance entre les champs logiques de DETAIL et les colonnes du fichier, résolue une
+    fois par fichier. `rapport` décrit pour chaque champ la colonne retenue et la méthode.
+    """
+    colonnes: list
+    positions: dict = field(default_factory=dict)
+    methodes: dict = field(default_factory=dict)
+
+    def position(self, nom):
+        """Position de la colonne du champ, None si absente."""
+        return self.positions.get(nom)
+
+    def nom_colonne(self, nom):
+        """Nom de la colonne du champ dans le DataFrame, None si absente."""
+        position = self.positions.get(nom)
+        return None if position is None else self.colonnes[position]
+
+    def colonne(self, df, nom):
+        """Colonne du champ dans `df` (DETAIL complet ou lignes d'un contrat)."""
+        return df.iloc[:, self.positions[nom]]
+
+    def present(self, nom):
+        """Le champ a-t-il une colonne ?"""
+        return self.positions.get(nom) is not None
+
+    def positions_utiles(self):
+        """Positions de toutes les colonnes résolues, pour ne lire que celles-ci."""
+        return sorted({position for position in self.positions.values() if position is not None})
+
+    def positions_categorielles(self):
+        """Positions des colonnes texte à stocker en catégories."""
+        return [self.positions[champ.nom] for champ in CHAMPS_DETAIL if champ.categorie and self.present(champ.nom)]
+
+    def positions_normalisees(self):
+        """Positions des colonnes de noms à normaliser (client, assureur)."""
+        return [self.positions[champ.nom] for champ in CHAMPS_DETAIL if champ.normaliser and self.present(champ.nom)]
+
+    @property
+    def rapport(self):
+        """Rapport de validation : une ligne par champ logique."""
+        return pd.DataFrame([{
+            "Champ": champ.libelle,
+            "Colonne": self.nom_colonne(champ.nom),
+            "Position": self.position(champ.nom),
+            "Méthode": self.methodes[champ.nom],
+            "Obligatoire": champ.requis,
+        } for champ in CHAMPS_DETAIL])
+
+    def manquants(self):
+        """Libellés des champs obligatoires sans colonne."""
+        return [champ.libelle for champ in CHAMPS_DETAIL if champ.requis and not self.present(champ.nom)]
+
+    def verifier(self):
+        """
+        Raises:
+            ValueError: Si des champs obligatoires n'ont pas de colonne.
+        """
+        manquants = self.manquants()
+        if manquants:
+            raise ValueError(f"Colonnes introuvables dans le fichier DETAIL.xlsx : {', '.join(manquants)}")
+        return self
+
+
+def resoudre_schema(colonnes, champs=CHAMPS_DETAIL):
+    """
+    Associe chaque champ logique à une colonne de DETAIL : en-tête de la position historique
+    s'il correspond, sinon première colonne libre dont l'en-tête correspond, puis la plus
+    proche au-delà de `SEUIL_APPROCHE`, et à défaut la position historique.
+
+    Args:
+        colonnes (iterable): En-têtes de la feuille DETAIL, dans l'ordre.
+
+    Returns:
+        SchemaDetail: Correspondance champs -> positions et méthode de chaque résolution.
+    """
+    colonnes = list(colonnes)
+    schema = SchemaDetail(colonnes)
+    prises = set()
+
+    def retenir(champ, position, methode):
+        schema.positions[champ.nom] = position
+        schema.methodes[champ.nom] = methode
+        if position is not None and methode != METHODE_POSITION:
+            prises.add(position)
+
+    # Les correspondances exactes passent avant les recherches, qui ne prennent que les colonnes libres
+    for champ in champs:
+        if champ.position < len(colonnes) and _correspond(champ, colonnes[champ.position]):
+            retenir(champ, champ.position, METHODE_NOM)
+    for champ in champs:
+        if champ.nom in schema.positions:
+            continue
+        position = next((i for i, nom in enumerate(colonnes) if i not in prises and _correspond(champ, nom)), None)
+        if position is not None:
+            retenir(champ, position, METHODE_NOM)
+    for champ in champs:
+        if champ.nom in schema.positions:
+            continue
+        similarites = [(_similarite(champ, nom), i) for i, nom in enumerate(colonnes) if i not in prises]
+        meilleure, position = max(similarites, default=(0.0, None))
+        if meilleure >= SEUIL_APPROCHE:
+            retenir(champ, position, METHODE_APPROCHEE)
+        elif champ.position < len(colonnes):
+            retenir(champ, champ.position, METHODE_POSITION)
+        else:
+            retenir(champ, None, METHODE_ABSENTE)
+    return schema
@@ -0,0 +1,438 @@
+import re
+import unicodedata
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from schema import METHODE_ABSENTE, METHODE_POSITION, resoudre_schema
+
+# Dictionnaire pour traduire les mois en français
+mois_fr = {
+    "January": "Janvier", "February": "Février", "March": "Mars", "April": "Avril",
+    "May": "Mai", "June": "Juin", "July": "Juillet", "August": "Août",
+    "September": "Septembre", "October": "Octobre", "November": "Novembre", "December": "Décembre"
+}
+# Noms français des mois, indexés de 0 (janvier) à 11 (décembre)
+MOIS_FR = tuple(mois_fr.values())
+
+# Ordre et titres des sections du rapport
+TITRE_SINISTRALITE = "Section I - Sinistralité"
+TITRE_CLAUSE = "Clause Ajustement Santé"
+TITRE_EFFECTIFS = "Section II - Évolution des effectifs"
+TITRE_BENEFICIAIRES = "Section III - Consommation par type de bénéficiaire"
+TITRE_MENSUEL = "Section IV - Consommation mensuelle"
+TITRE_SPECIALITES = "Section V - Consommation par spécialité"
+TITRE_PRESTATAIRES = "Section VI - Top des prestataires"
+TITRE_FAMILLES = "Section VII - Top des Familles de Consommateurs"
+
+# Étapes de la génération du PDF, dans l'ordre, pour le suivi de sa progression
+ETAPE_COUVERTURE = "Couverture"
+ETAPE_SOMMAIRE = "Sommaire"
+ETAPE_FINALISATION = "Finalisation"
+ETAPES_PDF = (
+    ETAPE_COUVERTURE, TITRE_SINISTRALITE, TITRE_EFFECTIFS, TITRE_BENEFICIAIRES, TITRE_MENSUEL,
+    TITRE_SPECIALITES, TITRE_PRESTATAIRES, TITRE_FAMILLES, ETAPE_SOMMAIRE, ETAPE_FINALISATION,
+)
+
+
+def _ignorer(message):
+    pass
+
+
+def libelle_mois(cle):
+    """Libellé français ("Janvier 2024") d'une clé de mois `année * 12 + mois - 1`."""
+    return f"{MOIS_FR[cle % 12]} {cle // 12}"
+
+
+def format_date_fr(date):
+    return libelle_mois(date.year * 12 + date.month - 1)
+
+
+def cles_mois(dates):
+    """
+    Clé entière de mois (`année * 12 + mois - 1`) de chaque date, -1 pour les dates manquantes.
+    Les clés se trient dans l'ordre chronologique.
+    """
+    dates = pd.to_datetime(pd.Series(dates), errors="coerce")
+    valides = dates.notna().to_numpy()
+    cles = np.full(len(dates), -1, dtype=np.int64)
+    cles[valides] = (dates.dt.year * 12 + dates.dt.month - 1).to_numpy()[valides]
+    return cles
+
+
+def libelles_mois(dates):
+    """
+    Libellés français des mois d'une colonne de dates (None pour les dates manquantes).
+    Chaque mois distinct n'est mis en forme qu'une fois.
+    """
+    cles = cles_mois(dates)
+    mois, codes = np.unique(cles, return_inverse=True)
+    libelles = np.array([libelle_mois(m) if m >= 0 else None for m in mois], dtype=object)
+    return pd.Series(libelles[codes.ravel()], index=getattr(dates, "index", None))
+
+
+# Fonction pour extraire intelligemment un nombre adapté de mots d'un nom de client
+def extract_client_words(client, max_words=4, max_chars=30):
+    """
+    Extrait un nombre adapté de mots d'un nom de client en fonction de la longueur des mots.
+    Les mots liés par une apostrophe (ex. "d'ALMEIDA") sont considérés comme un seul mot.
+    
+    Args:
+        client (str): Nom du client.
+        max_words (int): Nombre maximum initial de mots à extraire (par défaut 4).
+        max_chars (int): Nombre approximatif maximum de caractères souhaité (par défaut 30).
+    
+    Returns:
+        str: Chaîne contenant un nombre adapté de mots, ou "(vide)" si l'entrée est vide.
+    
+    Exemple:
+        >>> extract_client_words("Société d'ALMEIDA Jean Baptiste KOUADIO SARL")
+        'Société d'ALMEIDA Jean'
+        
+        >>> extract_client_words("ETABLISSEMENTS COMMERCIAUX PHARMACEUTIQUES INTERNATIONAUX")
+        'ETABLISSEMENTS COMMERCIAUX'
+    """
+    if not client or not client.strip():
+        return "(vide)"
+    
+    # Normaliser les caractères Unicode (ex. ' → ')
+    normalized_client = unicodedata.normalize('NFKD', client).strip()
+    # Splitter uniquement sur les espaces, préserver les apostrophes
+    client_words = re.split(r'\s+', normalized_client)
+    # Filtrer les mots non vides
+    client_words = [word for word in client_words if word]
+    
+    # Logique adaptative pour déterminer le nombre optimal de mots
+    actual_max_words = max_words
+    
+    # Si les 2 premiers mots sont déjà très longs (plus de max_chars/2 caractères)
+    if len(" ".join(client_words[:2])) > max_chars/2:
+        actual_max_words = 2
+    # Si les 3 premiers mots sont déjà longs (plus de 2*max_chars/3 caractères)
+    elif len(" ".join(client_words[:3])) > 2*max_chars/3:
+        actual_max_words = 3
+    # Pour les cas extrêmes où même un seul mot est très long
+    elif client_words and len(client_words[0]) > max_chars - 5:
+        # Tronquer le premier mot s'il est extrêmement long
+        return client_words[0][:max_chars-3] + "..."
+        
+    # Prendre les actual_max_words premiers mots et joindre avec des espaces
+    result = " ".join(client_words[:actual_max_words])
+    
+    # Si le résultat reste trop long, ajouter des points de suspension
+    if len(result) > max_chars:
+        result = result[:max_chars-3] + "..."
+        
+    return result
+
+
+# Fonction pour traiter les noms d'assureurs trop longs
+def extract_assureur_words(assureur, max_words=3, max_chars=25):
+    """
+    Extrait un nombre adapté de mots d'un nom d'assureur en fonction de la longueur des mots.
+    
+    Args:
+        assureur (str): Nom de l'assureur.
+        max_words (int): Nombre maximum initial de mots à extraire (par défaut 3).
+        max_chars (int): Nombre approximatif maximum de caractères souhaité (par défaut 25).
+    
+    Returns:
+        str: Chaîne contenant un nombre adapté de mots, ou "(vide)" si l'entrée est vide.
+    
+    Exemple:
+        >>> extract_assureur_words("COMPAGNIE NATIONALE D'ASSURANCE AFRICAINE")
+        'COMPAGNIE NATIONALE D'ASSURANCE'
+    """
+    if not assureur or not assureur.strip():
+        return "(vide)"
+    
+    # Normaliser les caractères Unicode
+    normalized_assureur = unicodedata.normalize('NFKD', assureur).strip()
+    # Splitter uniquement sur les espaces, préserver les apostrophes
+    assureur_words = re.split(r'\s+', normalized_assureur)
+    # Filtrer les mots non vides
+    assureur_words = [word for word in assureur_words if word]
+    
+    # Logique adaptative pour déterminer le nombre optimal de mots
+    actual_max_words = max_words
+    
+    # Si les 2 premiers mots sont déjà très longs
+    if len(" ".join(assureur_words[:2])) > max_chars/2:
+        actual_max_words = 2
+    # Pour les cas extrêmes où même un seul mot est très long
+    elif assureur_words and len(assureur_words[0]) > max_chars - 5:
+        # Tronquer le premier mot s'il est extrêmement long
+        return assureur_words[0][:max_chars-3] + "..."
+        
+    # Prendre les actual_max_words premiers mots et joindre avec des espaces
+    result = " ".join(assureur_words[:actual_max_words])
+    
+    # Si le résultat reste trop long, ajouter des points de suspension
+    if len(result) > max_chars:
+        result = result[:max_chars-3] + "..."
+        
+    return result
+
+
+@dataclass
+class RapportContrat:
+    """
+    Ensemble des tableaux et graphiques d'un rapport pour un contrat (assureur, client, police).
+    Les tableaux restent numériques ; ils sont mis en forme à l'affichage (`formatage`).
+    Les sections absentes (données manquantes ou en erreur) restent à None et ne sont pas
+    reprises dans le PDF.
+    """
+    nom_assureur: str
+    client: str
+    police_ankara: str
+    police_assureur: str = ""
+    periode: str = ""
+    df_sin: pd.DataFrame = None
+    df_clause: pd.DataFrame = None
+    highlight_row: int = None
+    df_effectif_display: pd.DataFrame = None
+    tableau_final: pd.DataFrame = None
+    df_mensuel_grouped: pd.DataFrame = None
+    tableau_spec: pd.DataFrame = None
+    df_prestataires: pd.DataFrame = None
+    df_familles: pd.DataFrame = None
+    graphiques: dict = field(default_factory=dict)
+
+    @property
+    def client_short(self):
+        return extract_client_words(self.client, max_words=4)
+
+    @property
+    def assureur_short(self):
+        return extract_assureur_words(self.nom_assureur, max_words=3)
+
+
+def extraire_primes(df_production_filtered, avertir=_ignorer):
+    """
+    Extrait les primes émises nettes et acquises de la ligne PRODUCTION du contrat.
+
+    Returns:
+        tuple: (prime_nette, prime_acquise), à 0 si absentes ou non numériques.
+    """
+    if df_production_filtered is None or df_production_filtered.empty:
+        avertir("⚠️ Aucune donnée dans PRODUCTION.xlsx pour l'assureur, le client et la police sélectionnés.")
+        return 0.0, 0.0
+    prime_nette = df_production_filtered["Primes Émises Nettes"].iloc[0]
+    prime_acquise = df_production_filtered["Primes Acquises"].iloc[0]
+    try:
+        return float(prime_nette), float(prime_acquise)
+    except (ValueError, TypeError):
+        avertir("⚠️ Impossible de convertir les primes en nombres. Valeurs définies à 0.")
+        return 0.0, 0.0
+
+
+def calculer_sinistralite(df_filtre, nom_assureur, client, police_ankara, police_assureur, prime_nette, prime_acquise,
+                          schema=None):
+    """
+    Section I : primes, sinistres et rapport S/P du contrat.
+
+    Returns:
+        tuple: (df_sin, ratio_sp)
+    """
+    schema = schema or resoudre_schema(df_filtre.columns)
+    montant_sinistres = schema.colonne(df_filtre, "couvert").sum()
+    ratio_sp = montant_sinistres / prime_acquise if prime_acquise > 0 else 0
+    # Extraire intelligemment les noms du client et de l'assureur
+    client_short = extract_client_words(client, max_words=4)
+    assureur_short = extract_assureur_words(nom_assureur, max_words=3)
+    df_sin = pd.DataFrame([{
+        "Id Police Ankara": police_ankara,
+        "N° Police Assureur": police_assureur or "(vide)",
+        "Assureur": assureur_short,
+        "Client": client_short,
+        "Primes Émises Nettes": prime_nette,
+        "Primes Acquises": prime_acquise,
+        "Sinistres": montant_sinistres,
+        "S/P": ratio_sp
+    }])
+    df_sin = df_sin[["Id Police Ankara", "N° Police Assureur", "Assureur", "Client", "Primes Émises Nettes", "Primes Acquises", "Sinistres", "S/P"]]
+    return df_sin, ratio_sp
+
+
+def calculer_periode(dates):
+    """
+    Période couverte par les effectifs, ex. "de Janvier à Décembre 2024".
+    Retourne une chaîne vide si aucune date n'est valide.
+    """
+    cles = cles_mois(dates)
+    cles = cles[cles >= 0]
+    if len(cles) == 0:
+        return ""
+    mois_min, annee_min = MOIS_FR[cles.min() % 12], cles.min() // 12
+    mois_max, annee_max = MOIS_FR[cles.max() % 12], cles.max() // 12
+
+    if annee_min == annee_max:
+        return f"de {mois_min} à {mois_max} {annee_max}"
+    return f"de {mois_min} {annee_min} à {mois_max} {annee_max}"
+
+
+def preparer_effectifs(df_effectif_filtered):
+    """
+    Section II : effectifs mensuels du client triés par mois, avec le mois au format français.
+
+    Returns:
+        tuple: (df_effectif_filtered, df_effectif_display)
+    """
+    df_effectif_filtered = df_effectif_filtered.sort_values(by="MOIS", ascending=True)
+    df_effectif_filtered["MOIS"] = libelles_mois(df_effectif_filtered["MOIS"])
+    display_columns = ["MOIS", "ADHERENT", "CONJOINTS", "ENFANTS", "TOTAL"]
+    return df_effectif_filtered, df_effectif_filtered[display_columns]
+
+
+def calculer_beneficiaires(agregats, df_effectif):
+    """
+    Section III : patients, effectifs, taux d'utilisation et montants couverts par type de bénéficiaire.
+
+    Args:
+        agregats (AgregatsContrat): Agrégats du contrat (`agregation.agreger_contrat`).
+        df_effectif (pd.DataFrame): Effectifs mensuels du client.
+
+    Raises:
+        ValueError: Si des colonnes d'effectifs sont absentes.
+    """
+    filiation = agregats.section("filiation")
+    required_columns = ["ADHERENT", "CONJOINTS", "ENFANTS"]
+    missing_columns = [col for col in required_columns if col not in df_effectif.columns]
+    if missing_columns:
+        raise ValueError(f"Les colonnes suivantes sont manquantes dans le fichier EFFECTIF.xlsx : {', '.join(missing_columns)}")
+    effectifs = pd.Series({
+        "ASSURÉ PRINCIPAL": df_effectif["ADHERENT"].max(),
+        "CONJOINT": df_effectif["CONJOINTS"].max(),
+        "ENFANT": df_effectif["ENFANTS"].max()
+    }).rename("Effectif Total")
+
+    # Remplacer les valeurs NaN par 0 dans les effectifs
+    effectifs = effectifs.fillna(0)
+
+    tableau = pd.concat([filiation["Nombre de patients"], effectifs, filiation["Montant couvert"]], axis=1)
+
+    # Gérer la division par zéro pour le taux d'utilisation
+    tableau["Taux d'utilisation"] = tableau.apply(
+        lambda row: row["Nombre de patients"] / row["Effectif Total"] if row["Effectif Total"] > 0 else 0,
+        axis=1
+    )
+
+    total_montant = tableau["Montant couvert"].sum()
+    tableau["Part de consommation"] = tableau["Montant couvert"] / total_montant if total_montant > 0 else 0
+
+    total = pd.DataFrame({
+        "Nombre de patients": [tableau["Nombre de patients"].sum()],
+        "Effectif Total": [tableau["Effectif Total"].sum()],
+        "Taux d'utilisation": [tableau["Nombre de patients"].sum() / tableau["Effectif Total"].sum() if tableau["Effectif Total"].sum() > 0 else 0],
+        "Montant couvert": [total_montant],
+        "Part de consommation": [1.0]
+    }, index=["Total général"])
+    tableau_final = pd.concat([tableau, total])
+    cols = ["Nombre de patients", "Effectif Total", "Taux d'utilisation", "Montant couvert", "Part de consommation"]
+    ordre_filiation = ["ASSURÉ PRINCIPAL", "CONJOINT", "ENFANT", "Total général"]
+    tableau_final = tableau_final.reindex(ordre_filiation)[cols]
+
+    # Remplacer les valeurs non-finies avant conversion
+    tableau_final = tableau_final.replace([np.inf, -np.inf], 0)
+    tableau_final = tableau_final.fillna(0)
+
+    tableau_final["Nombre de patients"] = tableau_final["Nombre de patients"].round(0).astype(int)
+    return tableau_final
+
+
+def calculer_mensuel(agregats, avertir=_ignorer):
+    """
+    Section IV : nombre de sinistres, frais réels, montants couverts et rejets par mois.
+
+    Returns:
+        pd.DataFrame: Tableau mensuel avec ligne de total, ou None si aucune donnée exploitable.
+
+    Raises:
+        ValueError: Si la colonne des dates ne contient aucune date valide.
+    """
+    df_mensuel_grouped = agregats.section("mensuel", avertir)
+    if df_mensuel_grouped is None:
+        return None
+    total_row = pd.DataFrame({
+        "MOIS": ["Total général"],
+        "Nombre de Sinistres": [df_mensuel_grouped["Nombre de Sinistres"].sum()],
+        "Frais réels": [df_mensuel_grouped["Frais réels"].sum()],
+        "Montant Couvert": [df_mensuel_grouped["Montant Couvert"].sum()],
+    })
+    if "Rejets" in df_mensuel_grouped.columns:
+        total_row["Rejets"] = [df_mensuel_grouped["Rejets"].sum()]
+    return pd.concat([df_mensuel_grouped, total_row], ignore_index=True)
+
+
+def calculer_specialites(agregats):
+    """
+    Section V : nombre d'actes, montants couverts et rejets par spécialité.
+    """
+    tableau_spec = agregats.section("specialites")
+    total_row = pd.DataFrame({
+        "Nombre": [tableau_spec["Nombre"].sum()],
+        "Couvert": [tableau_spec["Couvert"].sum()],
+        "Rejets": [tableau_spec["Rejets"].sum()] if "Rejets" in tableau_spec.columns else [0]
+    }, index=["Total général"])
+    return pd.concat([tableau_spec, total_row]).reset_index().rename(columns={'index': 'Spécialité'})
+
+
+def calculer_prestataires(agregats):
+    """
+    Section VI : classement des prestataires (prestataire, ville, commune) par montant couvert.
+    """
+    df_prestataires = agregats.section("prestataires")
+    df_prestataires = df_prestataires.sort_values(by="Couvert", ascending=False)
+    total_covered = df_prestataires["Couvert"].sum()
+    total_nombre = df_prestataires["NOMBRE"].sum()
+    df_prestataires["Proportion"] = df_prestataires["Couvert"] / total_covered
+    df_prestataires["Ordre"] = range(1, len(df_prestataires) + 1)
+    df_prestataires = df_prestataires[["Ordre", "PRESTATAIRE", "VILLE", "COMMUNE", "NOMBRE", "Couvert", "Proportion"]]
+    total_row = pd.DataFrame({
+        "Ordre": [""],
+        "PRESTATAIRE": ["Total"],
+        "VILLE": [""],
+        "COMMUNE": [""],
+        "NOMBRE": [total_nombre],
+        "Couvert": [total_covered],
+        "Proportion": [1.0]
+    })
+    return pd.concat([df_prestataires, total_row], ignore_index=True)
+
+
+def detecter_colonnes_familles(df_filtre, avertir=_ignorer, schema=None):
+    """
+    Colonnes 'N°CARTE ASSURÉ PRINCIPAL' et 'ASSURÉ PRINCIPAL' du schéma résolu (par nom,
+    avec repli sur les positions 9 et 11).
+
+    Returns:
+        tuple: (col_carte_assure_principal, col_nom_assure_principal)
+    """
+    schema = schema or resoudre_schema(df_filtre.columns)
+    for champ, libelle in (("carte_assure_principal", "N°CARTE ASSURÉ PRINCIPAL"), ("assure_principal", "ASSURÉ PRINCIPAL")):
+        if schema.methodes.get(champ) in (METHODE_POSITION, METHODE_ABSENTE):
+            avertir(f"⚠️ Colonne '{libelle}' non trouvée. Utilisation de la colonne par défaut.")
+    return schema.nom_colonne("carte_assure_principal"), schema.nom_colonne("assure_principal")
+
+
+def calculer_familles(agregats, avertir=_ignorer):
+    """
+    Section VII : cumul des dépenses par famille (numéro de carte de l'assuré principal).
+    """
+    df_familles = agregats.section("familles", avertir)
+    df_familles = df_familles.sort_values(by="Couvert", ascending=False)
+    total_covered = df_familles["Couvert"].sum()
+    total_actes = df_familles["Nombre d'actes"].sum()
+    df_familles["Proportion"] = df_familles["Couvert"] / total_covered
+    df_familles["Ordre"] = range(1, len(df_familles) + 1)
+    df_familles = df_familles[["Ordre", "N° de Famille", "Assuré Principal", "Nombre d'actes", "Couvert", "Proportion"]]
+    total_row = pd.DataFrame({
+        "Ordre": [""],
+        "N° de Famille": ["Total"],
+        "Assuré Principal": [""],
+        "Nombre d'actes": [total_actes],
+        "Couvert": [total_covered],
+        "Proportion": [1.0]
+    })
+    return pd.concat([df_familles, total_row], ignore_index=True)
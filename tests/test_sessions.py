@@ -0,0 +1,91 @@
+"""
+Sessions Streamlit simultanées : chaque session, dans son propre thread, rend les
+graphiques de ses contrats dans son MagasinGraphiques (cache de rendus partagé, comme
+dans l'application) puis génère leurs PDF avec ses logos.
+
+Lancement : python -m pytest -q tests
+"""
+import copy
+import threading
+import unittest
+
+from benchmark import (
+    contrats_detail, fichiers_synthetiques, graphiques_session, logo_synthetique, pdf_sans_date, rapport_synthetique,
+)
+from chargement import CacheLRU
+from graphiques import MagasinGraphiques
+from rapport_pdf import generer_pdf
+
+NB_SESSIONS = 4
+NB_CONTRATS = 3
+
+
+class TestSessionsSimultanees(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        detail, production, cls.effectif, clause = fichiers_synthetiques(600, NB_CONTRATS)
+        cls.contrats = list(contrats_detail(detail.df, detail.schema))
+        cls.rapports = {contrat: rapport_synthetique(detail, production, cls.effectif, clause, contrat)
+                        for contrat in cls.contrats}
+        cls.logos = [(logo_synthetique((numero * 60, 120, 200)), logo_synthetique((200, numero * 60, 60)))
+                     for numero in range(NB_SESSIONS)]
+        # Références : chaque contrat rendu seul, sans cache ni quota
+        cls.graphiques = {}
+        tailles = []
+        for contrat, rapport in cls.rapports.items():
+            magasin = MagasinGraphiques()
+            cls.graphiques[contrat] = graphiques_session(magasin, copy.copy(rapport), cls.effectif).graphiques
+            tailles.append(magasin.taille())
+        # Quota d'une session : un seul contrat tient dans le magasin
+        cls.quota = max(tailles)
+        assert 2 * min(tailles) > cls.quota
+
+    def pdf_reference(self, session, contrat):
+        rapport = copy.copy(self.rapports[contrat])
+        rapport.graphiques = self.graphiques[contrat]
+        return pdf_sans_date(generer_pdf(rapport, *self.logos[session]))
+
+    def test_pdf_isoles_et_quota_respecte(self):
+        cache = CacheLRU(taille_max=64 * 1024 ** 2, max_entrees=64)
+        depart = threading.Barrier(NB_SESSIONS)
+        magasins = {}
+        pdfs = {}
+        erreurs = []
+
+        def session(numero):
+            try:
+                magasin = magasins[numero] = MagasinGraphiques(cache=cache, taille_max=self.quota)
+                depart.wait()
+                for rang in range(NB_CONTRATS):
+                    contrat = self.contrats[(numero + rang) % NB_CONTRATS]
+                    rapport = graphiques_session(magasin, copy.copy(self.rapports[contrat]), self.effectif)
+                    pdfs[numero, contrat] = generer_pdf(rapport, *self.logos[numero])
+                    self.assertLessEqual(magasin.taille(), self.quota)
+            except Exception as e:
+                erreurs.append(e)
+
+        threads = [threading.Thread(target=session, args=(numero,)) for numero in range(NB_SESSIONS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(erreurs, [])
+
+        self.assertEqual(len(pdfs), NB_SESSIONS * NB_CONTRATS)
+        for (numero, contrat), pdf in pdfs.items():
+            self.assertEqual(pdf_sans_date(pdf), self.pdf_reference(numero, contrat), (numero, contrat))
+
+        for numero, magasin in magasins.items():
+            ordre = [self.contrats[(numero + rang) % NB_CONTRATS] for rang in range(NB_CONTRATS)]
+            # Le quota n'a laissé que le dernier contrat consulté par la session
+            for contrat in ordre[:-1]:
+                self.assertEqual(magasin.impressions(contrat), {})
+            self.assertEqual(magasin.impressions(ordre[-1]), self.graphiques[ordre[-1]])
+
+        # Chaque graphique n'a été rendu qu'une fois pour toutes les sessions
+        self.assertEqual(cache.stats()["misses"], sum(len(graphiques) for graphiques in self.graphiques.values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from mesures import etape
+
+# Caractères accentués conservés tels quels dans les PDF (police Latin-1)
+CARACTERES_PRESERVES = frozenset('àÀéÉèÈ')
+
+# Remplacements appliqués après la conversion ASCII
+REMPLACEMENTS = {
+    'Œ': 'OE', 'œ': 'oe', '…': '...', '–': '-', '—': '-', '\u2013': '-', '\u2014': '-',
+    '\u2018': "'", '\u2019': "'", '\u2022': '*', '"': '"',
+}
+
+TAILLE_CACHE_TEXTES = 65536
+
+
+def _nettoyer_caractere(caractere):
+    """
+    Équivalent ASCII d'un caractère : décomposition NFKD puis suppression des caractères
+    non ASCII, sauf pour les caractères préservés.
+    """
+    if caractere in CARACTERES_PRESERVES:
+        return caractere
+    texte = unicodedata.normalize('NFKD', caractere).encode('ascii', 'ignore').decode('ascii')
+    for k, v in REMPLACEMENTS.items():
+        texte = texte.replace(k, v)
+    return texte
+
+
+class _TableNettoyage(dict):
+    """
+    Table de `str.translate` (code point -> remplacement). Les caractères Latin courants sont
+    précalculés ; les autres sont calculés à la première rencontre puis conservés.
+    """
+
+    def __missing__(self, code):
+        remplacement = _nettoyer_caractere(chr(code))
+        self[code] = remplacement
+        return remplacement
+
+
+TABLE_NETTOYAGE = _TableNettoyage({code: _nettoyer_caractere(chr(code)) for code in range(0x250)})
+TABLE_NETTOYAGE.update({ord(c): _nettoyer_caractere(c) for c in '\u2013\u2014\u2018\u2019\u201c\u201d\u2022\u2026'})
+
+
+@lru_cache(maxsize=TAILLE_CACHE_TEXTES)
+def nettoyer_texte(texte):
+    """
+    Nettoie une chaîne pour la police Latin-1 des PDF. Les noms de clients, spécialités ou
+    villes se répètent beaucoup : chaque chaîne distincte n'est traduite qu'une fois.
+    """
+    return texte.translate(TABLE_NETTOYAGE)
+
+
+def nettoyer_colonne(serie):
+    """
+    Nettoie une colonne entière : les chaînes distinctes sont nettoyées une seule fois
+    (factorisation), les autres valeurs sont converties en texte.
+    """
+    valeurs = serie.to_numpy(dtype=object)
+    est_texte = np.fromiter((isinstance(v, str) for v in valeurs), dtype=bool, count=len(valeurs))
+    resultat = np.empty(len(valeurs), dtype=object)
+    if est_texte.any():
+        codes, uniques = pd.factorize(valeurs[est_texte])
+        resultat[est_texte] = np.array([nettoyer_texte(u) for u in uniques], dtype=object)[codes]
+    if not est_texte.all():
+        resultat[~est_texte] = [str(v) for v in valeurs[~est_texte]]
+    return resultat
+
+
+def clean_text(text):
+    """
+    Nettoie le texte pour gérer correctement les caractères accentués et spéciaux.
+    Convertit les caractères Unicode en leur équivalent ASCII compatible avec Latin-1.
+    Préserve certains caractères accentués importants comme 'à'.
+    Un DataFrame est nettoyé colonne par colonne (modifié en place et renvoyé).
+    """
+    if isinstance(text, pd.DataFrame):
+        with etape("clean_text (tableaux)", lignes=len(text), cumuler=True):
+            for col in text.columns:
+                text[col] = nettoyer_colonne(text[col])
+        return text
+    elif isinstance(text, str):
+        return nettoyer_texte(text)
+    return str(text)
@@ -0,0 +1,155 @@
+import hashlib
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
+from datetime import datetime
+
+import pandas as pd
+
+from chargement import CacheLRU
+from mesures import Mesures
+from sections import ETAPES_PDF
+
+STATUT_ATTENTE = "en attente"
+STATUT_EN_COURS = "en cours"
+STATUT_TERMINE = "terminé"
+STATUT_ERREUR = "erreur"
+
+
+def _contenu(source):
+    """Octets d'une image ou d'un logo, donné par son contenu ou par son chemin."""
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if source and os.path.exists(source):
+        with open(source, "rb") as f:
+            return f.read()
+    return repr(source).encode()
+
+
+def empreinte_rapport(rapport, logo_ankara=None, logo_assureur=None):
+    """
+    Clé du PDF d'un rapport : tableaux (valeurs, index, colonnes et types), graphiques,
+    champs texte, logos et date d'édition imprimée sur la couverture.
+
+    Returns:
+        str: Empreinte hexadécimale SHA-256.
+    """
+    empreinte = hashlib.sha256()
+    for champ in fields(rapport):
+        valeur = getattr(rapport, champ.name)
+        empreinte.update(champ.name.encode())
+        if isinstance(valeur, pd.DataFrame):
+            empreinte.update(pd.util.hash_pandas_object(valeur, index=True).to_numpy().tobytes())
+            empreinte.update(repr((list(valeur.columns), list(valeur.dtypes.astype(str)))).encode())
+        elif isinstance(valeur, dict):
+            for nom in sorted(valeur):
+                empreinte.update(nom.encode())
+                empreinte.update(_contenu(valeur[nom]))
+        else:
+            empreinte.update(repr(valeur).encode())
+    for logo in (logo_ankara, logo_assureur):
+        empreinte.update(hashlib.sha256(_contenu(logo)).digest())
+    empreinte.update(datetime.now().strftime("%d/%m/%Y").encode())
+    return empreinte.hexdigest()
+
+
+@dataclass
+class TravailPDF:
+    """
+    Génération d'un PDF dans la file : statut, étape en cours (`sections.ETAPES_PDF`) et
+    progression entre 0 et 1, puis contenu du PDF ou message d'erreur.
+    """
+    cle: str
+    statut: str = STATUT_ATTENTE
+    etape: str = ""
+    progression: float = 0.0
+    pdf: bytes = None
+    nom_fichier: str = ""
+    erreur: str = ""
+    details: str = ""
+    duree: float = None
+    mesures: Mesures = None
+
+    @property
+    def termine(self):
+        return self.statut in (STATUT_TERMINE, STATUT_ERREUR)
+
+    def avancer(self, etape):
+        """Enregistre le début d'une étape de la génération."""
+        self.etape = etape
+        self.progression = ETAPES_PDF.index(etape) / len(ETAPES_PDF)
+
+
+class FileRapports:
+    """
+    File de génération des PDF, exécutée par un pool de threads hors du thread de la
+    session Streamlit : la page reste utilisable et la génération se poursuit même si le
+    navigateur se déconnecte.
+
+    Les travaux sont gardés dans un CacheLRU indexé par `empreinte_rapport` : redemander
+    un rapport identique (depuis n'importe quelle session) reprend le travail en cours ou
+    le PDF déjà généré au lieu de relancer la génération.
+    """
+
+    def __init__(self, max_workers=2, cache=None):
+        self.cache = cache if cache is not None else CacheLRU(taille_max=256 * 1024 ** 2, max_entrees=32)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rapport-pdf")
+        self._verrou = threading.Lock()
+
+    def soumettre(self, rapport, logo_ankara=None, logo_assureur=None, mesures=None):
+        """
+        Ajoute la génération du PDF d'un rapport à la file.
+
+        Args:
+            rapport (RapportContrat): Rapport complet, graphiques compris ; il ne doit plus être modifié.
+            logo_ankara, logo_assureur (bytes | str, optional): Logos, contenu ou chemin.
+            mesures (Mesures, optional): Mesures où enregistrer les étapes de la génération.
+
+        Returns:
+            TravailPDF: Travail à suivre ; déjà terminé si le même PDF a été généré.
+        """
+        cle = empreinte_rapport(rapport, logo_ankara, logo_assureur)
+        nouveaux = []
+
+        def creer():
+            nouveaux.append(TravailPDF(cle, mesures=mesures or Mesures()))
+            return nouveaux[-1]
+
+        with self._verrou:
+            travail = self.cache.get_or_compute(cle, creer)
+            if travail.statut == STATUT_ERREUR:
+                # Un échec n'est pas gardé : la demande suivante relance la génération
+                travail = creer()
+                self.cache.put(cle, travail)
+        if nouveaux:
+            self._pool.submit(self._executer, travail, rapport, logo_ankara, logo_assureur)
+        return travail
+
+    def _executer(self, travail, rapport, logo_ankara, logo_assureur):
+        from rapport_pdf import generer_pdf, nom_fichier_pdf
+
+        travail.statut = STATUT_EN_COURS
+        debut = time.perf_counter()
+        try:
+            with travail.mesures.active(), travail.mesures.etape("Génération du PDF"):
+                pdf = generer_pdf(rapport, logo_ankara, logo_assureur, progression=travail.avancer)
+            travail.pdf = pdf
+            travail.nom_fichier = nom_fichier_pdf(rapport)
+            travail.progression = 1.0
+            travail.statut = STATUT_TERMINE
+        except Exception as e:
+            travail.erreur = str(e)
+            travail.details = traceback.format_exc()
+            travail.statut = STATUT_ERREUR
+        finally:
+            travail.duree = time.perf_counter() - debut
+            travail.mesures.terminer()
+        # Nouvelle insertion pour que la taille du PDF compte dans les limites du cache
+        self.cache.put(travail.cle, travail)
+
+    def arreter(self):
+        """Attend la fin des travaux en cours et libère le pool."""
+        self._pool.shutdown(wait=True)